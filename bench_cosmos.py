@@ -0,0 +1,185 @@
+## benchmarks for the loader and the query paths, against the in-memory container (no azure account or network needed)
+## we measure for every dataset size:
+##   - ingest: docs/sec and RU of the one-by-one, bulk (thread pool) and batch loaders, reading from a json lines file
+##   - memory: the peak memory of streaming the file versus json.load of the whole file
+##   - queries: p50/p95 latency and RU of the readcosmos.py queries
+## settings come from the environment, like the other scripts:
+##   BENCH_SIZES="1000,10000"   the dataset sizes
+##   BENCH_LATENCY_MS=2         the simulated latency of one request
+##   BENCH_QUERY_RUNS=20        how many times we run every query
+##   BENCH_OUTPUT=bench.json    write the results to this json file
+##   BENCH_BASELINE=old.json    compare with an earlier result and exit with 1 when something got slower than BENCH_TOLERANCE (0.2 = 20%)
+
+import json
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from cosmos_emulator import InMemoryContainer
+from cosmos_loader import bulk_upsert, batch_upsert
+from cosmos_paging import PagedQuery
+from json_stream import iter_json_documents
+from cosmos_router import route_query
+from report_queries import REPORT_QUERIES, query_text
+
+BENCH_SIZES = [int(size) for size in os.environ.get('BENCH_SIZES', '1000,10000').split(',')]
+BENCH_LATENCY_MS = float(os.environ.get('BENCH_LATENCY_MS', '2'))
+BENCH_QUERY_RUNS = int(os.environ.get('BENCH_QUERY_RUNS', '20'))
+BENCH_OUTPUT = os.environ.get('BENCH_OUTPUT', '')
+BENCH_BASELINE = os.environ.get('BENCH_BASELINE', '')
+BENCH_TOLERANCE = float(os.environ.get('BENCH_TOLERANCE', '0.2'))
+
+CATEGORIES = ["Resort", "Budget", "Inn", "Lodge", "Boutique", "Suite"]
+TAGS = ["view", "pool", "spa", "beach", "wifi", "restaurant", "parking", "bar"]
+
+
+def make_hotels(count, seed=42):
+    """this generator makes `count` hotels that look like the ones in items/, always the same for the same seed"""
+    templates = list(iter_json_documents(Path("items/hotel1.json"))) + list(iter_json_documents(Path("items/hotel2.json")))
+    rng = random.Random(seed)
+    for number in range(count):
+        hotel = json.loads(json.dumps(templates[number % len(templates)]))
+        hotel["id"] = f"hotel-{number}"
+        hotel["HotelId"] = str(number)
+        hotel["HotelName"] = f"{hotel['HotelName']} {number}"
+        hotel["Category"] = rng.choice(CATEGORIES)
+        hotel["Rating"] = round(rng.uniform(2.0, 5.0), 1)
+        hotel["Tags"] = rng.sample(TAGS, 3)
+        for room in hotel["Rooms"]:
+            room["BaseRate"] = round(rng.uniform(50, 500), 2)
+        yield hotel
+
+
+def write_dataset(count, directory):
+    path = os.path.join(directory, f"hotels-{count}.jsonl")
+    with open(path, "w", encoding="utf-8") as file:
+        for hotel in make_hotels(count):
+            file.write(json.dumps(hotel) + "\n")
+    return path
+
+
+def bench_ingest(path, count):
+    """this function loads the file with every loader in a fresh container and gives back docs/sec and RU per loader"""
+    results = {}
+    latency = BENCH_LATENCY_MS / 1000
+    loaders = {
+        "one-by-one": lambda container, documents: bulk_upsert(container, documents, concurrency=1),
+        "bulk x8": lambda container, documents: bulk_upsert(container, documents, concurrency=8),
+        "batch x4": lambda container, documents: batch_upsert(container, documents, concurrency=4),
+    }
+    for name, load in loaders.items():
+        ## one by one is slow by design, on big sizes we only time a part of it
+        limit = min(count, 2000) if name == "one-by-one" else count
+        container = InMemoryContainer(latency=latency)
+        documents = (document for position, document in enumerate(iter_json_documents(path)) if position < limit)
+        report = load(container, documents)
+        results[name] = {
+            "documents": report.succeeded,
+            "failed": report.failed,
+            "docs_per_second": round(report.docs_per_second, 1),
+            "request_charge": round(report.request_charge, 2),
+        }
+    return results
+
+
+def bench_memory(path):
+    """this function compares the peak memory of streaming the file with loading it whole"""
+    tracemalloc.start()
+    for _ in iter_json_documents(path):
+        pass
+    _, streaming_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    tracemalloc.start()
+    with open(path, "r", encoding="utf-8") as file:
+        documents = [json.loads(line) for line in file]
+    _, whole_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    del documents
+    return {"streaming_peak_mb": round(streaming_peak / 1e6, 2), "whole_file_peak_mb": round(whole_peak / 1e6, 2)}
+
+
+def bench_queries(count):
+    """this function runs the readcosmos.py queries against a loaded container and gives back latency and RU per query"""
+    container = InMemoryContainer(latency=BENCH_LATENCY_MS / 1000)
+    container.load(make_hotels(count))
+    results = {}
+    for spec in REPORT_QUERIES:
+        timings = []
+        charge_before = container.total_request_charge
+        items = 0
+        query = query_text(spec)
+        route = route_query(query, spec.get("parameters"))
+        kwargs = {"partition_key": route.partition_keys[0]} if route.kind == "single" else {"enable_cross_partition_query": True}
+        for _ in range(BENCH_QUERY_RUNS):
+            started = time.perf_counter()
+            items = sum(1 for _ in PagedQuery(container, query, spec.get("parameters"), max_item_count=1000, **kwargs))
+            timings.append((time.perf_counter() - started) * 1000)
+        timings.sort()
+        results[spec["name"]] = {
+            "items": items,
+            "p50_ms": round(statistics.median(timings), 2),
+            "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 2),
+            "request_charge": round((container.total_request_charge - charge_before) / BENCH_QUERY_RUNS, 2),
+        }
+    return results
+
+
+def compare_with_baseline(results, baseline):
+    """this function gives the list of numbers that got worse than the tolerance compared to the baseline"""
+    regressions = []
+    for size, current in results["sizes"].items():
+        old = baseline.get("sizes", {}).get(size)
+        if not old:
+            continue
+        for loader, numbers in current["ingest"].items():
+            before = old["ingest"].get(loader, {}).get("docs_per_second")
+            if before and numbers["docs_per_second"] < before * (1 - BENCH_TOLERANCE):
+                regressions.append(f"{size} ingest {loader}: {numbers['docs_per_second']} docs/sec, was {before}")
+        for query, numbers in current["queries"].items():
+            before = old["queries"].get(query, {}).get("p50_ms")
+            if before and numbers["p50_ms"] > before * (1 + BENCH_TOLERANCE):
+                regressions.append(f"{size} query {query}: p50 {numbers['p50_ms']} ms, was {before}")
+    return regressions
+
+
+def main():
+    results = {"latency_ms": BENCH_LATENCY_MS, "sizes": {}}
+    with tempfile.TemporaryDirectory() as directory:
+        for count in BENCH_SIZES:
+            print(f"=== {count} documents ===")
+            path = write_dataset(count, directory)
+            size_results = {
+                "ingest": bench_ingest(path, count),
+                "memory": bench_memory(path),
+                "queries": bench_queries(count),
+            }
+            results["sizes"][str(count)] = size_results
+
+            for loader, numbers in size_results["ingest"].items():
+                print(f"  ingest {loader:<12} {numbers['docs_per_second']:>10.1f} docs/sec  {numbers['request_charge']:>12.2f} RU  ({numbers['documents']} docs, {numbers['failed']} failed)")
+            memory = size_results["memory"]
+            print(f"  memory streaming {memory['streaming_peak_mb']} MB, whole file {memory['whole_file_peak_mb']} MB")
+            for query, numbers in size_results["queries"].items():
+                print(f"  query  {query:<22} p50 {numbers['p50_ms']:>8.2f} ms  p95 {numbers['p95_ms']:>8.2f} ms  {numbers['request_charge']:>8.2f} RU  ({numbers['items']} items)")
+
+    if BENCH_OUTPUT:
+        with open(BENCH_OUTPUT, "w", encoding="utf-8") as file:
+            json.dump(results, file, indent=2)
+
+    if BENCH_BASELINE:
+        with open(BENCH_BASELINE, "r", encoding="utf-8") as file:
+            regressions = compare_with_baseline(results, json.load(file))
+        for regression in regressions:
+            print(f"REGRESSION {regression}")
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,186 @@
+## incremental copy of a container in a local sqlite file, kept up to date with the change feed
+## the first run reads the change feed from the beginning (everything), every next run only reads what changed since the last run
+## the continuation token of every feed range is stored in the same sqlite file, in the same transaction as the documents,
+## so after a crash we never skip a change and never lose one
+## other scripts can read the snapshot (ChangeFeedSnapshot.items / get) instead of scanning the container again
+## note: the change feed (latest version mode) has no deletes, use a soft delete field or a ttl if you need them
+
+import json
+import os
+import sqlite3
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cosmos_loader import get_partition_key_value
+from cosmos_scan import split_container
+from cosmos_throttle import call
+
+
+class ChangeFeedSnapshot:
+    """
+    this class is the local snapshot: a sqlite file with the documents (keyed by id and partition key) and the tokens
+    one connection is shared between the threads, every write holds the lock
+    """
+
+    def __init__(self, path, partition_key_path="/Category"):
+        self.path = path
+        self.partition_key_path = partition_key_path
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        with self._connection:
+            self._connection.execute("PRAGMA journal_mode=WAL")
+            self._connection.execute(
+                "CREATE TABLE IF NOT EXISTS items (id TEXT NOT NULL, pk TEXT NOT NULL, ts INTEGER, body TEXT NOT NULL, PRIMARY KEY (id, pk))"
+            )
+            self._connection.execute("CREATE TABLE IF NOT EXISTS checkpoints (feed_range TEXT PRIMARY KEY, token TEXT NOT NULL)")
+
+    def token(self, feed_range_key):
+        with self._lock:
+            row = self._connection.execute("SELECT token FROM checkpoints WHERE feed_range = ?", (feed_range_key,)).fetchone()
+        return row[0] if row else None
+
+    def apply_page(self, documents, feed_range_key, token):
+        """this function stores a page of changes and the token after it in one transaction"""
+        rows = [
+            (document["id"], json.dumps(get_partition_key_value(document, self.partition_key_path)), document.get("_ts"), json.dumps(document, ensure_ascii=False))
+            for document in documents
+        ]
+        with self._lock, self._connection:
+            self._connection.executemany("INSERT OR REPLACE INTO items (id, pk, ts, body) VALUES (?, ?, ?, ?)", rows)
+            if token is not None:
+                self._connection.execute("INSERT OR REPLACE INTO checkpoints (feed_range, token) VALUES (?, ?)", (feed_range_key, token))
+
+    def get(self, item_id, partition_key):
+        with self._lock:
+            row = self._connection.execute("SELECT body FROM items WHERE id = ? AND pk = ?", (item_id, json.dumps(partition_key))).fetchone()
+        return json.loads(row[0]) if row else None
+
+    def items(self, partition_key=None):
+        """this generator yields the documents of the snapshot (of one partition key when given), without loading all of them"""
+        ## its own connection, so reading does not hold the lock of the sync (sqlite in wal mode allows reading while writing)
+        connection = sqlite3.connect(self.path)
+        try:
+            if partition_key is None:
+                cursor = connection.execute("SELECT body FROM items ORDER BY pk, id")
+            else:
+                cursor = connection.execute("SELECT body FROM items WHERE pk = ? ORDER BY id", (json.dumps(partition_key),))
+            for (body,) in cursor:
+                yield json.loads(body)
+        finally:
+            connection.close()
+
+    def count(self):
+        with self._lock:
+            return self._connection.execute("SELECT COUNT(*) FROM items").fetchone()[0]
+
+    def reset(self):
+        """this function empties the snapshot and forgets the tokens, the next sync starts from the beginning"""
+        with self._lock, self._connection:
+            self._connection.execute("DELETE FROM items")
+            self._connection.execute("DELETE FROM checkpoints")
+
+    def close(self):
+        with self._lock:
+            self._connection.close()
+
+
+class SyncReport:
+    """this class keeps the numbers of a sync run"""
+
+    def __init__(self):
+        self.changes = 0
+        self.pages = 0
+        self.ranges = 0
+        self.failures = []
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add_page(self, count):
+        with self._lock:
+            self.changes += count
+            self.pages += 1
+
+    def add_failure(self, feed_range_key, error):
+        with self._lock:
+            self.failures.append((feed_range_key, str(error)))
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def print_summary(self):
+        print(f"changes applied    : {self.changes} in {self.pages} pages from {self.ranges} feed ranges")
+        print(f"elapsed            : {self.elapsed:.2f} s")
+        for feed_range_key, error in self.failures[:10]:
+            print(f"    -- failed range {feed_range_key}: {error}")
+
+
+def feed_range_key(feed_range):
+    """this function gives a stable text key for a feed range, to store its token under"""
+    return json.dumps(feed_range, sort_keys=True) if feed_range is not None else "all"
+
+
+def sync_change_feed(container_client, snapshot, workers=4, page_size=1000, controller=None):
+    """
+    this function brings the snapshot up to date: every feed range is read from its stored token (or from the beginning)
+    the ranges are read at the same time, a range that fails keeps its old token and is tried again on the next run
+    when the container was split since the last run the new ranges have no token yet and start from the beginning,
+    that reads some documents again but never misses one
+    """
+    report = SyncReport()
+    feed_ranges = split_container(container_client)
+    report.ranges = len(feed_ranges)
+
+    def sync_range(feed_range):
+        key = feed_range_key(feed_range)
+        token = snapshot.token(key)
+        ## the token already knows its feed range, the sdk does not accept both
+        options = {"continuation": token} if token else {"start_time": "Beginning"}
+        if feed_range is not None and not token:
+            options["feed_range"] = feed_range
+        try:
+            pages = container_client.query_items_change_feed(max_item_count=page_size, **options).by_page()
+            while True:
+                try:
+                    page = call(controller, container_client, lambda: list(next(pages)))
+                except StopIteration:
+                    break
+                snapshot.apply_page(page, key, pages.continuation_token)
+                report.add_page(len(page))
+            ## also when nothing changed the token can move forward
+            if pages.continuation_token and pages.continuation_token != token:
+                snapshot.apply_page([], key, pages.continuation_token)
+        except Exception as e:
+            report.add_failure(key, e)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        list(executor.map(sync_range, feed_ranges))
+    report.finish()
+    return report
+
+
+def main():
+    ## we only need azure and the .env when we run this file, importing it for the snapshot class works without them
+    from azure.cosmos import CosmosClient
+    from azure.identity import DefaultAzureCredential
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    snapshot = ChangeFeedSnapshot(os.environ.get('SNAPSHOT_PATH', '.snapshot.sqlite'), os.environ.get('PARTITION_KEY_PATH', '/Category'))
+    if os.environ.get('FULL_RESYNC', '') == '1':
+        snapshot.reset()
+    client = CosmosClient(os.environ['COSMOS_ENDPOINT'], DefaultAzureCredential())
+    container_client = client.get_database_client(os.environ['DATABASE_NAME']).get_container_client(os.environ['CONTAINER_NAME'])
+    report = sync_change_feed(container_client, snapshot, workers=int(os.environ.get('SYNC_WORKERS', '4')))
+    report.print_summary()
+    print(f"documents in snapshot : {snapshot.count()}")
+    snapshot.close()
+
+
+if __name__ == "__main__":
+    main()
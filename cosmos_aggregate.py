@@ -0,0 +1,112 @@
+## aggregates (COUNT, SUM, AVG, MIN, MAX, with or without GROUP BY) computed by cosmos db instead of by us
+## len(list(query)) sends every matching hotel over the wire just to count them, here cosmos db sends back one small row
+## we ask every partition (a feed range, or one partition key value when the WHERE has one) for a partial result and
+## merge the partials here: counts and sums are added, min and max compared, and AVG is the merged SUM / the merged COUNT
+## (an average of averages would be wrong when the partitions have a different number of documents)
+
+from concurrent.futures import ThreadPoolExecutor
+
+from cosmos_paging import PagedQuery
+from cosmos_router import route_query
+from cosmos_scan import split_container
+from cosmos_sql import sort_key
+
+AGGREGATE_FUNCTIONS = ("COUNT", "SUM", "AVG", "MIN", "MAX")
+
+## the partial results every function needs from every partition
+_PARTIALS = {
+    "COUNT": ("n",),
+    ## SUM also needs the count, to see a partition that has values but no sum
+    "SUM": ("s", "n"),
+    "AVG": ("s", "n"),
+    "MIN": ("lo",),
+    "MAX": ("hi",),
+}
+
+
+def partial_query(function, expression="1", where=None, group_by=None, join=None):
+    """this function gives the query we send to every partition, indexing_policy.py reads the index paths from it"""
+    function = function.upper()
+    partials = {
+        "n": f"COUNT({expression})",
+        "s": f"SUM({expression})",
+        "lo": f"MIN({expression})",
+        "hi": f"MAX({expression})",
+    }
+    select = [f"{partials[name]} AS {name}" for name in _PARTIALS[function]]
+    if group_by:
+        select.insert(0, f"{group_by} AS groupKey")
+    query = f"SELECT {', '.join(select)} FROM c"
+    if join:
+        query += f" JOIN {join}"
+    if where:
+        query += f" WHERE {where}"
+    if group_by:
+        query += f" GROUP BY {group_by}"
+    return query
+
+
+def _merge(total, row, function):
+    """this function adds the partial row of one partition to the running total"""
+    ## cosmos db leaves the sum out when a value is not a number (null, a string, ...), then SUM and AVG are undefined overall
+    if "s" in _PARTIALS[function] and row.get("n") and "s" not in row:
+        total["undefined"] = True
+    for name in ("n", "s"):
+        if name in row:
+            total[name] = total.get(name, 0) + row[name]
+    if "lo" in row and ("lo" not in total or sort_key(row["lo"]) < sort_key(total["lo"])):
+        total["lo"] = row["lo"]
+    if "hi" in row and ("hi" not in total or sort_key(row["hi"]) > sort_key(total["hi"])):
+        total["hi"] = row["hi"]
+
+
+def _result(function, total):
+    """this function turns the merged partials in the answer, None when there was nothing to aggregate (undefined in cosmos db)"""
+    if function == "COUNT":
+        return total.get("n", 0)
+    if function in ("SUM", "AVG") and total.get("undefined"):
+        return None
+    if function == "AVG":
+        return total["s"] / total["n"] if total.get("n") else None
+    return total.get({"SUM": "s", "MIN": "lo", "MAX": "hi"}[function])
+
+
+def aggregate(container_client, function, expression="1", where=None, parameters=None, group_by=None, join=None,
+              partition_key_path="/Category", controller=None, workers=4):
+    """
+    this function computes function(expression) over the documents that match where, the query alias is c
+    join: a JOIN like "r IN c.Rooms" to aggregate array elements, for example MIN(r.BaseRate)
+    group_by: an expression like "c.Category", then the result is a dict group value -> aggregate
+    """
+    function = function.upper()
+    if function not in AGGREGATE_FUNCTIONS:
+        raise ValueError(f"unknown aggregate {function}, use one of {', '.join(AGGREGATE_FUNCTIONS)}")
+    query = partial_query(function, expression, where, group_by, join)
+
+    ## with a filter on the partition key we only ask those partitions, else every feed range
+    route = route_query(query, parameters, partition_key_path)
+    if route.kind == "fan-out":
+        targets = [{"feed_range": feed_range} if feed_range is not None else {"enable_cross_partition_query": True}
+                   for feed_range in split_container(container_client)]
+    else:
+        targets = [{"partition_key": partition_key} for partition_key in route.partition_keys]
+
+    def read_partials(options):
+        return list(PagedQuery(container_client, query, parameters, controller=controller, **options))
+
+    totals = {}
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        for rows in executor.map(read_partials, targets):
+            for row in rows:
+                ## without GROUP BY every partition gives one row, all of them go in the same total
+                group = row.get("groupKey") if group_by else None
+                _merge(totals.setdefault(repr(group) if group_by else None, {"groupKey": group}), row, function)
+
+    if not group_by:
+        return _result(function, totals.get(None, {}))
+    return {total["groupKey"]: _result(function, total) for total in totals.values()}
+
+
+def count(container_client, where=None, parameters=None, **kwargs):
+    """this function counts the documents that match where (SELECT VALUE COUNT(1) style), without reading them"""
+    return aggregate(container_client, "COUNT", "1", where, parameters, **kwargs)
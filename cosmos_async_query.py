@@ -0,0 +1,93 @@
+## async query engine for cosmos db
+## readcosmos.py runs its queries one after the other, so the total time is the sum of all queries
+## here we start all queries at the same time over one shared async client, so the total time is about the slowest query
+## every query is a spec of report_queries.py, like {"name": "budget", "query": "SELECT ...", "parameters": [...]}
+## a query with a filter on the partition key (c.Category = 'Budget') only goes to that partition, like the router does
+## readcosmos.py keeps running the same specs one by one: it is the step by step walkthrough over the sync client, and it shares
+## that client with the router, the RateController (threads) and the item cache, none of which work on the async client
+
+import asyncio
+import os
+import time
+from dotenv import load_dotenv
+from azure.cosmos.aio import CosmosClient
+from azure.identity.aio import DefaultAzureCredential
+
+from cosmos_router import route_query
+from cosmos_utils import RequestChargeHook
+from report_queries import REPORT_QUERIES, query_text, to_items
+
+
+async def run_query(container_client, spec, partition_key_path="/Category"):
+    """this function runs one query spec to the end and gives back a result dict with the items, the RU and the time it took"""
+    started = time.perf_counter()
+    query = query_text(spec)
+    ## the other queries run at the same time, so the last_response_headers of the client can belong to any of them
+    ## the hook only sees the pages of this query
+    hook = RequestChargeHook()
+    kwargs = {"parameters": spec.get("parameters"), "response_hook": hook}
+    ## without a partition key the async client searches across all partitions
+    partition_key = spec.get("partition_key")
+    if partition_key is None:
+        route = route_query(query, spec.get("parameters"), partition_key_path)
+        partition_key = route.partition_keys[0] if route.kind == "single" else None
+    if partition_key is not None:
+        kwargs["partition_key"] = partition_key
+    rows = []
+    async for page in container_client.query_items(query, **kwargs).by_page():
+        rows.extend([item async for item in page])
+    return {
+        "name": spec["name"],
+        "items": to_items(spec, rows),
+        "request_charge": hook.request_charge,
+        "elapsed": time.perf_counter() - started,
+        "error": None,
+    }
+
+
+async def iter_concurrent_queries(container_client, specs, concurrency=8):
+    """
+    this async generator runs all query specs at the same time (at most `concurrency` of them) and yields every result as soon as it is done
+    a failing query gives a result with the error filled in, the other queries just continue
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def guarded(spec):
+        async with semaphore:
+            try:
+                return await run_query(container_client, spec)
+            except Exception as e:
+                return {"name": spec["name"], "items": [], "request_charge": 0.0, "elapsed": 0.0, "error": e}
+
+    tasks = [asyncio.create_task(guarded(spec)) for spec in specs]
+    try:
+        for finished in asyncio.as_completed(tasks):
+            yield await finished
+    finally:
+        ## when the caller stops early we dont leave queries running in the background
+        for task in tasks:
+            task.cancel()
+
+
+async def run_concurrent_queries(container_client, specs, concurrency=8):
+    """this function runs all query specs at the same time and gives back the results by name"""
+    return {result["name"]: result async for result in iter_concurrent_queries(container_client, specs, concurrency)}
+
+
+async def main():
+    load_dotenv()
+    ## the async client needs the async credential as well
+    async with DefaultAzureCredential() as credential:
+        async with CosmosClient(os.environ['COSMOS_ENDPOINT'], credential) as client:
+            container_client = client.get_database_client(os.environ['DATABASE_NAME']).get_container_client(os.environ['CONTAINER_NAME'])
+            started = time.perf_counter()
+            async for result in iter_concurrent_queries(container_client, REPORT_QUERIES):
+                if result["error"]:
+                    print(f"query '{result['name']}' failed: {result['error']}")
+                    continue
+                print(f"query '{result['name']}': {len(result['items'])} items, {result['request_charge']:.2f} RU, {result['elapsed']:.2f} s")
+            print(f"all queries done in {time.perf_counter() - started:.2f} s")
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
@@ -0,0 +1,122 @@
+## read-through cache for cosmos db items
+## hot hotels are read over and over while they almost never change, every read_item costs RU and a round-trip
+## this cache keeps items by (id, partition key) with a maximum size (LRU) and a time to live (TTL)
+## when an item is expired we ask cosmos db "only send it if the etag changed" (If-None-Match), a 304 is much cheaper than a full read
+
+import copy
+import json
+import threading
+import time
+from collections import OrderedDict
+
+from azure.core import MatchConditions
+
+from cosmos_throttle import call
+from cosmos_patch import patch_item
+
+
+class ItemCache:
+    """
+    this class wraps a container client for point reads and writes
+    reads come from the cache when we can, our own writes update the cache so we never serve our own stale data
+    every item we give back is a copy, so changing it (like hotel["Rooms"].append(...)) does not change the cache
+    """
+
+    def __init__(self, container_client, max_items=1000, ttl=60.0, controller=None):
+        self.container_client = container_client
+        self.max_items = max_items
+        self.ttl = ttl
+        self.controller = controller
+        self.hits = 0
+        self.misses = 0
+        self.revalidated = 0
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+
+    def _key(self, item_id, partition_key):
+        return (item_id, json.dumps(partition_key))
+
+    def read_item(self, item_id, partition_key):
+        """this function gives the item from the cache, revalidates it with its etag when expired, or reads it from cosmos db"""
+        key = self._key(item_id, partition_key)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is not None:
+                self._entries.move_to_end(key)
+                if entry["expires"] > time.monotonic():
+                    self.hits += 1
+                    return copy.deepcopy(entry["item"])
+
+        if entry is not None and entry["item"].get("_etag"):
+            item = self._read_if_modified(item_id, partition_key, entry["item"]["_etag"])
+            if item is None:
+                ## 304: the item did not change, we only extend the time to live
+                with self._lock:
+                    self.revalidated += 1
+                    entry["expires"] = time.monotonic() + self.ttl
+                return copy.deepcopy(entry["item"])
+        else:
+            item = call(self.controller, self.container_client, self.container_client.read_item, item_id, partition_key)
+
+        with self._lock:
+            self.misses += 1
+        self._store(key, item)
+        return copy.deepcopy(item)
+
+    def _read_if_modified(self, item_id, partition_key, etag):
+        try:
+            item = call(self.controller, self.container_client, self.container_client.read_item, item_id, partition_key,
+                        etag=etag, match_condition=MatchConditions.IfModified)
+        except Exception as e:
+            if getattr(e, "status_code", None) == 304:
+                return None
+            raise
+        ## depending on the sdk version a 304 comes back as an empty body instead of an error
+        return item or None
+
+    def _store(self, key, item):
+        with self._lock:
+            self._entries[key] = {"item": copy.deepcopy(dict(item)), "expires": time.monotonic() + self.ttl}
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_items:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, item_id, partition_key):
+        with self._lock:
+            self._entries.pop(self._key(item_id, partition_key), None)
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    ## our own writes go through the cache, the body cosmos db sends back has the new etag so we keep that
+    def upsert_item(self, body, partition_key, **kwargs):
+        result = call(self.controller, self.container_client, self.container_client.upsert_item, body, **kwargs)
+        self._store_written(body["id"], partition_key, result)
+        return result
+
+    def replace_item(self, item_id, body, partition_key, **kwargs):
+        result = call(self.controller, self.container_client, self.container_client.replace_item, item_id, body, **kwargs)
+        self._store_written(item_id, partition_key, result)
+        return result
+
+    def patch_item(self, item_id, partition_key, patch_operations, **kwargs):
+        try:
+            result = patch_item(self.container_client, item_id, partition_key, patch_operations, controller=self.controller, **kwargs)
+        except Exception:
+            ## a failed patch (like a 412) means our cached version is probably old
+            self.invalidate(item_id, partition_key)
+            raise
+        self._store_written(item_id, partition_key, result)
+        return result
+
+    def delete_item(self, item_id, partition_key, **kwargs):
+        self.invalidate(item_id, partition_key)
+        call(self.controller, self.container_client, self.container_client.delete_item, item_id, partition_key, **kwargs)
+
+    def _store_written(self, item_id, partition_key, result):
+        if isinstance(result, dict) and result.get("_etag"):
+            self._store(self._key(item_id, partition_key), result)
+        else:
+            ## without the new body (for example with no_response) we cant know the new version, so we drop it
+            self.invalidate(item_id, partition_key)
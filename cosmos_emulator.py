@@ -0,0 +1,646 @@
+## in-memory stand-in for a cosmos db container
+## writeCosmos.py and readcosmos.py open a real CosmosClient, so we cant test or benchmark them without an azure account
+## this class has the same methods as the container client of azure-cosmos (upsert, create, read, replace, delete, patch,
+## execute_item_batch, read_all_items, query_items, read_feed_ranges and query_items_change_feed) and keeps the documents in a dict
+## it also behaves a bit like the real thing: every call has a request charge header, can take some time (latency)
+## and can be throttled (429) randomly or when we go over the provisioned RU/s
+## the request charges are a rough model, good to compare two approaches with each other, not to predict your azure bill
+
+import copy
+import hashlib
+import json
+import math
+import random
+import threading
+import time
+import uuid
+
+from cosmos_sql import Evaluator, parse
+from cosmos_loader import get_partition_key_value
+from cosmos_utils import SYSTEM_PROPERTIES
+
+## the default indexing policy of a new container: every path is indexed
+DEFAULT_INDEXING_POLICY = {
+    "indexingMode": "consistent",
+    "automatic": True,
+    "includedPaths": [{"path": "/*"}],
+    "excludedPaths": [{"path": "/\"_etag\"/?"}],
+}
+
+
+class CosmosEmulatorError(Exception):
+    """this error looks like the CosmosHttpResponseError of azure-cosmos: it has a status_code and the response headers"""
+
+    def __init__(self, status_code, message, headers=None):
+        super().__init__(f"({status_code}) {message}")
+        self.status_code = status_code
+        self.message = message
+        self.headers = headers or {}
+
+
+class _ItemResponse(dict):
+    """a dict with the response headers, like the CosmosDict that azure-cosmos gives back"""
+
+    def __init__(self, item, headers):
+        super().__init__(item)
+        self._headers = headers
+
+    def get_response_headers(self):
+        return self._headers
+
+
+class _ListResponse(list):
+    """a list with the response headers, like the CosmosList of a batch"""
+
+    def __init__(self, items, headers):
+        super().__init__(items)
+        self._headers = headers
+
+    def get_response_headers(self):
+        return self._headers
+
+
+class _Connection:
+    """this class only holds last_response_headers, like the client_connection of the real container client"""
+
+    def __init__(self):
+        self.last_response_headers = {}
+
+
+def _size_kb(document):
+    return len(json.dumps(document, separators=(",", ":")).encode("utf-8")) / 1024
+
+
+def _leaf_paths(value, parts=()):
+    """this generator yields the path of every leaf value of a document, array elements get [] like in an indexing policy"""
+    if isinstance(value, dict):
+        for key, item in value.items():
+            if key not in SYSTEM_PROPERTIES:
+                yield from _leaf_paths(item, parts + (key,))
+    elif isinstance(value, list):
+        for item in value:
+            yield from _leaf_paths(item, parts + ("[]",))
+    else:
+        yield parts
+
+
+def _compile_policy(policy):
+    """
+    this function turns the included and excluded paths of a policy in rules (parts, exact, excluded)
+    /Category/? is exactly the value at Category, /Address/* is everything below Address, "quoted" names lose their quotes
+    """
+    rules = []
+    for excluded, key in ((False, "includedPaths"), (True, "excludedPaths")):
+        for entry in policy.get(key, []):
+            parts = [part[1:-1] if part.startswith('"') and part.endswith('"') else part for part in entry["path"].strip("/").split("/")]
+            rules.append((tuple(parts[:-1]), parts[-1] == "?", excluded))
+    return rules
+
+
+def _is_indexed(path, rules):
+    """the most specific rule that matches the path wins (a /? path beats a /* path of the same length, excluded beats included)"""
+    best = None
+    for parts, exact, excluded in rules:
+        if (len(path) != len(parts)) if exact else (len(path) < len(parts)):
+            continue
+        if path[:len(parts)] != parts:
+            continue
+        rank = (len(parts), exact, excluded)
+        if best is None or rank > best:
+            best = rank
+    return best is not None and not best[2]
+
+
+class InMemoryContainer:
+    """
+    this class is the in-memory container, all methods are thread safe
+    latency: seconds every request takes (plus up to latency_jitter extra), we sleep outside the lock so concurrency helps like for real
+    throttle_rate: the chance (0..1) that a request gets a 429
+    ru_per_second: the provisioned throughput, when a second uses more than this the next requests get a 429 until the second is over
+    physical_partitions: how many physical partitions we pretend to have, a cross partition query pays for each of them
+    """
+
+    def __init__(self, partition_key_path="/Category", latency=0.0, latency_jitter=0.0, throttle_rate=0.0,
+                 ru_per_second=None, physical_partitions=4, strict_cross_partition=True, seed=None, container_id="emulator"):
+        self.id = container_id
+        self.partition_key_path = partition_key_path
+        self.latency = latency
+        self.latency_jitter = latency_jitter
+        self.throttle_rate = throttle_rate
+        self.ru_per_second = ru_per_second
+        self.physical_partitions = physical_partitions
+        self.strict_cross_partition = strict_cross_partition
+        self.indexing_policy = DEFAULT_INDEXING_POLICY
+        self.client_connection = _Connection()
+        self.request_count = 0
+        self.throttled_count = 0
+        self.total_request_charge = 0.0
+        self._documents = {}
+        self._lock = threading.Lock()
+        self._random = random.Random(seed)
+        self._window_start = time.monotonic()
+        self._window_charge = 0.0
+        self._lsn = 0
+
+    ## ---- helpers for the request model ----
+
+    def _key(self, item_id, partition_key):
+        return (json.dumps(partition_key), item_id)
+
+    def _partition_key_of(self, document):
+        return get_partition_key_value(document, self.partition_key_path)
+
+    def _hash(self, partition_key):
+        """this function gives the hash of a partition key value (0 .. 2**32), the physical partitions split this range"""
+        digest = hashlib.md5(json.dumps(partition_key).encode("utf-8")).digest()
+        return int.from_bytes(digest[:4], "big")
+
+    def physical_partition_of(self, partition_key):
+        """this function gives the physical partition a partition key value lives in, like the hash partitioning of cosmos db"""
+        return self._hash(partition_key) * self.physical_partitions >> 32
+
+    def _feed_range_bounds(self, feed_range):
+        range_ = feed_range["Range"]
+        return int(range_["min"] or "0", 16), int(range_["max"], 16)
+
+    def _write_charge(self, document):
+        return 5.0 + 0.5 * math.ceil(_size_kb(document)) + 0.2 * self.index_terms(document)
+
+    @property
+    def indexing_policy(self):
+        return self._indexing_policy
+
+    @indexing_policy.setter
+    def indexing_policy(self, policy):
+        ## we keep our own copy and compile the paths once, not for every write
+        self._indexing_policy = copy.deepcopy(policy)
+        self._index_rules = _compile_policy(self._indexing_policy)
+
+    def index_terms(self, document):
+        """this function gives the number of index entries a document needs with the current indexing policy"""
+        if self._indexing_policy.get("indexingMode") == "none":
+            return 0
+        rules = self._index_rules
+        return sum(1 for path in _leaf_paths(document) if _is_indexed(path, rules))
+
+    def _delay(self):
+        if self.latency or self.latency_jitter:
+            time.sleep(self.latency + self._random.random() * self.latency_jitter)
+
+    def _begin(self):
+        """this function is called at the start of every request, it sleeps the latency and decides if we throttle"""
+        self._delay()
+        with self._lock:
+            self.request_count += 1
+            now = time.monotonic()
+            if now - self._window_start >= 1.0:
+                self._window_start = now
+                self._window_charge = 0.0
+            over_budget = self.ru_per_second is not None and self._window_charge >= self.ru_per_second
+            if over_budget or (self.throttle_rate and self._random.random() < self.throttle_rate):
+                self.throttled_count += 1
+                retry_after = max(1, int((1.0 - (now - self._window_start)) * 1000)) if over_budget else 5
+                headers = {"x-ms-request-charge": "0", "x-ms-retry-after-ms": str(retry_after)}
+                self.client_connection.last_response_headers = headers
+                raise CosmosEmulatorError(429, "Request rate is large", headers)
+
+    def _finish(self, request_charge, extra_headers=None):
+        """this function books the request charge and gives back the response headers, call it with the lock held"""
+        self._window_charge += request_charge
+        self.total_request_charge += request_charge
+        headers = {"x-ms-request-charge": f"{request_charge:.2f}"}
+        headers.update(extra_headers or {})
+        self.client_connection.last_response_headers = headers
+        return headers
+
+    def _fail(self, status_code, message, request_charge=1.0):
+        headers = self._finish(request_charge)
+        raise CosmosEmulatorError(status_code, message, headers)
+
+    def _stamp(self, document):
+        stored = copy.deepcopy(dict(document))
+        stored["_etag"] = f"\"{uuid.uuid4()}\""
+        stored["_ts"] = int(time.time())
+        stored.setdefault("_rid", uuid.uuid4().hex[:16])
+        ## every write gets the next log sequence number, the change feed hands out documents in this order
+        self._lsn += 1
+        stored["_lsn"] = self._lsn
+        return stored
+
+    def _check_id(self, body):
+        if not isinstance(body, dict) or not isinstance(body.get("id"), str) or not body["id"]:
+            self._fail(400, "The input content is invalid because the required property 'id' is missing or not a string")
+
+    def _check_etag(self, stored, etag, match_condition):
+        condition = getattr(match_condition, "name", match_condition)
+        if etag is None or condition is None:
+            return
+        if condition == "IfNotModified" and (stored is None or stored["_etag"] != etag):
+            self._fail(412, "Operation cannot be performed because one of the specified precondition is not met")
+        if condition == "IfModified" and stored is not None and stored["_etag"] == etag:
+            self._fail(304, "Not modified", request_charge=1.0)
+
+    ## ---- the container client methods ----
+
+    def read(self, **kwargs):
+        """this function gives the container properties, like ContainerProxy.read()"""
+        self._begin()
+        with self._lock:
+            headers = self._finish(1.0)
+            return _ItemResponse({
+                "id": self.id,
+                "partitionKey": {"paths": [self.partition_key_path], "kind": "Hash"},
+                "indexingPolicy": copy.deepcopy(self.indexing_policy),
+            }, headers)
+
+    def create_item(self, body, **kwargs):
+        self._begin()
+        with self._lock:
+            self._check_id(body)
+            key = self._key(body["id"], self._partition_key_of(body))
+            if key in self._documents:
+                self._fail(409, "Entity with the specified id already exists in the system.")
+            stored = self._documents[key] = self._stamp(body)
+            headers = self._finish(self._write_charge(stored), {"etag": stored["_etag"]})
+            return _ItemResponse(copy.deepcopy(stored), headers)
+
+    def upsert_item(self, body, etag=None, match_condition=None, **kwargs):
+        self._begin()
+        with self._lock:
+            self._check_id(body)
+            key = self._key(body["id"], self._partition_key_of(body))
+            self._check_etag(self._documents.get(key), etag, match_condition)
+            stored = self._documents[key] = self._stamp(body)
+            headers = self._finish(self._write_charge(stored), {"etag": stored["_etag"]})
+            return _ItemResponse(copy.deepcopy(stored), headers)
+
+    def replace_item(self, item, body, etag=None, match_condition=None, **kwargs):
+        item_id = item["id"] if isinstance(item, dict) else item
+        self._begin()
+        with self._lock:
+            self._check_id(body)
+            key = self._key(item_id, self._partition_key_of(body))
+            if key not in self._documents:
+                self._fail(404, "Entity with the specified id does not exist in the system.")
+            self._check_etag(self._documents[key], etag, match_condition)
+            stored = self._documents[key] = self._stamp(body)
+            headers = self._finish(self._write_charge(stored), {"etag": stored["_etag"]})
+            return _ItemResponse(copy.deepcopy(stored), headers)
+
+    def read_item(self, item, partition_key, etag=None, match_condition=None, **kwargs):
+        item_id = item["id"] if isinstance(item, dict) else item
+        self._begin()
+        with self._lock:
+            stored = self._documents.get(self._key(item_id, partition_key))
+            if stored is None:
+                self._fail(404, "Entity with the specified id does not exist in the system.")
+            self._check_etag(stored, etag, match_condition)
+            headers = self._finish(max(1.0, float(math.ceil(_size_kb(stored)))), {"etag": stored["_etag"]})
+            return _ItemResponse(copy.deepcopy(stored), headers)
+
+    def delete_item(self, item, partition_key, etag=None, match_condition=None, **kwargs):
+        item_id = item["id"] if isinstance(item, dict) else item
+        self._begin()
+        with self._lock:
+            key = self._key(item_id, partition_key)
+            stored = self._documents.get(key)
+            if stored is None:
+                self._fail(404, "Entity with the specified id does not exist in the system.")
+            self._check_etag(stored, etag, match_condition)
+            del self._documents[key]
+            self._finish(self._write_charge(stored))
+
+    def patch_item(self, item, partition_key, patch_operations, etag=None, match_condition=None, **kwargs):
+        item_id = item["id"] if isinstance(item, dict) else item
+        self._begin()
+        with self._lock:
+            key = self._key(item_id, partition_key)
+            stored = self._documents.get(key)
+            if stored is None:
+                self._fail(404, "Entity with the specified id does not exist in the system.")
+            self._check_etag(stored, etag, match_condition)
+            patched = copy.deepcopy(stored)
+            try:
+                for operation in patch_operations:
+                    _apply_patch(patched, operation)
+            except (KeyError, IndexError, TypeError, ValueError) as e:
+                self._fail(400, f"patch operation failed: {e}")
+            if self._partition_key_of(patched) != partition_key:
+                self._fail(400, "the partition key of a document cannot be patched")
+            stored = self._documents[key] = self._stamp(patched)
+            headers = self._finish(self._write_charge(stored) + 0.5 * len(patch_operations), {"etag": stored["_etag"]})
+            return _ItemResponse(copy.deepcopy(stored), headers)
+
+    def execute_item_batch(self, batch_operations, partition_key, **kwargs):
+        """this function runs the operations as one transaction: when one fails nothing is written"""
+        self._begin()
+        with self._lock:
+            if len(batch_operations) > 100:
+                self._fail(400, "a batch can have at most 100 operations")
+            ## we work on a copy of the partition, and only keep it when every operation succeeded
+            working = dict(self._documents)
+            results = []
+            charge = 0.0
+            for position, (operation, args, *rest) in enumerate(batch_operations):
+                options = rest[0] if rest else {}
+                try:
+                    result, op_charge = self._batch_operation(working, operation, args, options, partition_key)
+                except CosmosEmulatorError as e:
+                    self._fail(e.status_code, f"batch operation {position} ({operation}) failed: {e.message}", request_charge=charge)
+                results.append(result)
+                charge += op_charge
+            self._documents = working
+            headers = self._finish(charge)
+            return _ListResponse(results, headers)
+
+    def _batch_operation(self, documents, operation, args, options, partition_key):
+        operation = operation.lower()
+        if operation in ("create", "upsert"):
+            body = args[0]
+            if self._partition_key_of(body) != partition_key:
+                raise CosmosEmulatorError(400, "the partition key of the document does not match the batch")
+            key = self._key(body.get("id"), partition_key)
+            if operation == "create" and key in documents:
+                raise CosmosEmulatorError(409, "Entity with the specified id already exists in the system.")
+            stored = documents[key] = self._stamp(body)
+            return {"statusCode": 201 if operation == "create" else 200, "resourceBody": stored}, self._write_charge(stored)
+        if operation in ("replace", "read", "delete", "patch"):
+            item_id = args[0]
+            key = self._key(item_id, partition_key)
+            if key not in documents:
+                raise CosmosEmulatorError(404, "Entity with the specified id does not exist in the system.")
+            if operation == "read":
+                return {"statusCode": 200, "resourceBody": documents[key]}, max(1.0, float(math.ceil(_size_kb(documents[key]))))
+            if operation == "delete":
+                stored = documents.pop(key)
+                return {"statusCode": 204}, self._write_charge(stored)
+            if operation == "replace":
+                stored = documents[key] = self._stamp(args[1])
+            else:
+                patched = copy.deepcopy(documents[key])
+                for patch_operation in args[1]:
+                    _apply_patch(patched, patch_operation)
+                stored = documents[key] = self._stamp(patched)
+            return {"statusCode": 200, "resourceBody": stored}, self._write_charge(stored)
+        raise CosmosEmulatorError(400, f"unknown batch operation {operation}")
+
+    def read_feed_ranges(self, **kwargs):
+        """this function gives one feed range per physical partition, like ContainerProxy.read_feed_ranges()"""
+        self._begin()
+        with self._lock:
+            self._finish(1.0)
+        bounds = [(number << 32) // self.physical_partitions for number in range(self.physical_partitions + 1)]
+        return [
+            {"Range": {"min": f"{low:08X}" if low else "", "max": f"{high:08X}", "isMinInclusive": True, "isMaxInclusive": False}}
+            for low, high in zip(bounds, bounds[1:])
+        ]
+
+    def read_all_items(self, max_item_count=None, **kwargs):
+        return self.query_items("SELECT * FROM c", max_item_count=max_item_count, enable_cross_partition_query=True, **kwargs)
+
+    def query_items(self, query, parameters=None, partition_key=None, enable_cross_partition_query=None, max_item_count=None,
+                    feed_range=None, response_hook=None, **kwargs):
+        """
+        this function runs the query with our small sql engine, the result can be iterated or read page by page with by_page()
+        with a feed_range (from read_feed_ranges) only the documents of that range are queried
+        response_hook is called with the headers and the items of every page, like the real client does
+        """
+        if isinstance(query, dict):
+            parameters = query.get("parameters", parameters)
+            query = query["query"]
+        if partition_key is None and feed_range is None and not enable_cross_partition_query and self.strict_cross_partition:
+            raise CosmosEmulatorError(400, "Cross partition query is required but disabled. Please set enable_cross_partition_query to true")
+        return _QueryPaged(self, parse(query), parameters, partition_key, max_item_count, feed_range, response_hook)
+
+    def _run_query(self, parsed, parameters, partition_key, feed_range=None):
+        """this function runs a parsed query and gives back the results and the request charge"""
+        with self._lock:
+            if partition_key is not None:
+                wanted = json.dumps(partition_key)
+                documents = [document for (key, _), document in self._documents.items() if key == wanted]
+                partitions = 1
+            elif feed_range is not None:
+                low, high = self._feed_range_bounds(feed_range)
+                documents = [document for document in self._documents.values() if low <= self._hash(self._partition_key_of(document)) < high]
+                ## a feed range can span more than one physical partition, we pay for every one it touches
+                partitions = len({self.physical_partition_of(self._partition_key_of(document)) for document in documents}) or 1
+            else:
+                documents = list(self._documents.values())
+                partitions = self.physical_partitions
+        ## stored documents are never changed in place (every write stores a new dict), so we can query them without the lock
+        results = [copy.deepcopy(result) for result in Evaluator(parameters).run(parsed, documents)]
+        ## every physical partition we visit costs the base charge, plus a little per scanned document and per KB we send back
+        charge = 2.8 * partitions + 0.01 * len(documents) + 0.1 * math.ceil(sum(_size_kb(result) for result in results))
+        return results, charge
+
+    def query_items_change_feed(self, feed_range=None, partition_key=None, start_time=None, continuation=None, max_item_count=None, **kwargs):
+        """
+        this function reads the change feed (latest version mode): the latest version of every document written after the start
+        start_time "Beginning" starts at the first write, anything else at now; continuation continues after an earlier page
+        like the real change feed deletes are not in it, only creates and updates
+        """
+        if continuation:
+            ## like the real token, ours carries the feed range (or partition key) it belongs to
+            state = json.loads(continuation)
+            return _ChangeFeedPaged(self, state["feed_range"], state["partition_key"], state["lsn"], max_item_count)
+        if start_time == "Beginning":
+            start_lsn = 0
+        else:
+            with self._lock:
+                start_lsn = self._lsn
+        return _ChangeFeedPaged(self, feed_range, partition_key, start_lsn, max_item_count)
+
+    def _read_changes(self, feed_range, partition_key, start_lsn, max_item_count):
+        """this function gives the next page of changes after start_lsn, one request"""
+        self._begin()
+        with self._lock:
+            if partition_key is not None:
+                wanted = json.dumps(partition_key)
+                documents = [document for (key, _), document in self._documents.items() if key == wanted]
+            elif feed_range is not None:
+                low, high = self._feed_range_bounds(feed_range)
+                documents = [document for document in self._documents.values() if low <= self._hash(self._partition_key_of(document)) < high]
+            else:
+                documents = list(self._documents.values())
+            changes = sorted((document for document in documents if document["_lsn"] > start_lsn), key=lambda document: document["_lsn"])
+            page = [copy.deepcopy(document) for document in changes[:max_item_count]]
+            ## an empty page (304 not modified) still costs a little, like polling the real change feed
+            self._finish(max(1.0, 1.0 + 0.1 * math.ceil(sum(_size_kb(document) for document in page))), {"x-ms-item-count": str(len(page))})
+        return page
+
+    ## ---- helpers for tests and benchmarks ----
+
+    def load(self, documents):
+        """this function puts documents in the container without latency, throttling or charges"""
+        with self._lock:
+            for document in documents:
+                self._documents[self._key(document["id"], self._partition_key_of(document))] = self._stamp(document)
+
+    def count(self):
+        with self._lock:
+            return len(self._documents)
+
+    def documents(self):
+        with self._lock:
+            return [copy.deepcopy(document) for document in self._documents.values()]
+
+
+class _QueryPaged:
+    """this class looks like the ItemPaged of azure-core: iterate it for the items or use by_page() for the pages"""
+
+    def __init__(self, container, parsed, parameters, partition_key, max_item_count, feed_range=None, response_hook=None):
+        self._container = container
+        self._parsed = parsed
+        self._parameters = parameters
+        self._partition_key = partition_key
+        self._max_item_count = max_item_count or 100
+        self._feed_range = feed_range
+        self._response_hook = response_hook
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+    def by_page(self, continuation_token=None):
+        return _QueryPages(self, continuation_token)
+
+
+class _QueryPages:
+    """the page iterator, the continuation token is the position of the next page in the result"""
+
+    def __init__(self, paged, continuation_token):
+        self._paged = paged
+        self._results = None
+        self._charge = 0.0
+        self._offset = int(json.loads(continuation_token)["offset"]) if continuation_token else 0
+        self._done = False
+        self.continuation_token = continuation_token
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        if self._done:
+            raise StopIteration
+        paged = self._paged
+        container = paged._container
+        container._begin()
+        if self._results is None:
+            ## we run the whole query once and hand it out page by page, the charge is spread over the pages
+            self._results, self._charge = container._run_query(paged._parsed, paged._parameters, paged._partition_key, paged._feed_range)
+        page = self._results[self._offset:self._offset + paged._max_item_count]
+        self._offset += len(page)
+        pages = max(1, math.ceil(len(self._results) / paged._max_item_count))
+        with container._lock:
+            headers = container._finish(self._charge / pages, {"x-ms-item-count": str(len(page))})
+        if paged._response_hook is not None:
+            paged._response_hook(headers, page)
+        if self._offset >= len(self._results):
+            self._done = True
+            self.continuation_token = None
+        else:
+            self.continuation_token = json.dumps({"offset": self._offset})
+        return iter(page)
+
+
+class _ChangeFeedPaged:
+    """this class looks like the ItemPaged of a change feed: iterate it for the changes or use by_page() for the pages"""
+
+    def __init__(self, container, feed_range, partition_key, start_lsn, max_item_count):
+        self._container = container
+        self._feed_range = feed_range
+        self._partition_key = partition_key
+        self._start_lsn = start_lsn
+        self._max_item_count = max_item_count or 100
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+    def by_page(self, continuation_token=None):
+        return _ChangeFeedPages(self, json.loads(continuation_token)["lsn"] if continuation_token else self._start_lsn)
+
+
+class _ChangeFeedPages:
+    """
+    the page iterator of the change feed, it stops at the first empty page (nothing changed anymore)
+    the continuation token is the lsn of the last change we handed out, it stays valid after the last page
+    """
+
+    def __init__(self, paged, lsn):
+        self._paged = paged
+        self._lsn = lsn
+        self.continuation_token = self._token()
+
+    def _token(self):
+        return json.dumps({"lsn": self._lsn, "feed_range": self._paged._feed_range, "partition_key": self._paged._partition_key})
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        paged = self._paged
+        page = paged._container._read_changes(paged._feed_range, paged._partition_key, self._lsn, paged._max_item_count)
+        if not page:
+            raise StopIteration
+        self._lsn = page[-1]["_lsn"]
+        self.continuation_token = self._token()
+        return iter(page)
+
+
+def _pointer(path):
+    if not path.startswith("/"):
+        raise ValueError(f"patch path {path} must start with /")
+    return [part.replace("~1", "/").replace("~0", "~") for part in path[1:].split("/")]
+
+
+def _apply_patch(document, operation):
+    """this function applies one patch operation (add, set, replace, remove, incr, move) to a document"""
+    op = operation["op"].lower()
+    if op == "move":
+        value = _remove(document, _pointer(operation["from"]))
+        _set(document, _pointer(operation["path"]), value, "add")
+        return
+    parts = _pointer(operation["path"])
+    if op == "remove":
+        _remove(document, parts)
+    elif op in ("add", "set", "replace"):
+        _set(document, parts, operation["value"], op)
+    elif op == "incr":
+        parent = _parent(document, parts)
+        current = parent.get(parts[-1], 0) if isinstance(parent, dict) else parent[int(parts[-1])]
+        if isinstance(current, bool) or not isinstance(current, (int, float)):
+            raise ValueError(f"{operation['path']} is not a number")
+        _set(document, parts, current + operation["value"], "set")
+    else:
+        raise ValueError(f"unknown patch operation {op}")
+
+
+def _parent(document, parts):
+    target = document
+    for part in parts[:-1]:
+        target = target[int(part)] if isinstance(target, list) else target[part]
+    return target
+
+
+def _set(document, parts, value, op):
+    parent = _parent(document, parts)
+    last = parts[-1]
+    if isinstance(parent, list):
+        if last == "-":
+            parent.append(value)
+        elif op == "add":
+            parent.insert(int(last), value)
+        else:
+            parent[int(last)] = value
+    else:
+        if op == "replace" and last not in parent:
+            raise KeyError(last)
+        parent[last] = value
+
+
+def _remove(document, parts):
+    parent = _parent(document, parts)
+    if isinstance(parent, list):
+        return parent.pop(int(parts[-1]))
+    return parent.pop(parts[-1])
@@ -0,0 +1,196 @@
+## bulk loader for cosmos db
+## instead of waiting for every upsert one by one we keep a number of upserts "in flight" at the same time
+## the container client of azure-cosmos is thread safe, so a simple thread pool is enough here
+
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+
+from cosmos_utils import get_request_charge
+from cosmos_throttle import call
+
+## cosmos db accepts at most 100 operations in one transactional batch
+MAX_BATCH_OPERATIONS = 100
+
+
+class LoadReport:
+    """this class keeps the numbers of a load run so we can print a summary at the end"""
+
+    def __init__(self):
+        self.succeeded = 0
+        self.failed = 0
+        self.request_charge = 0.0
+        self.failures = []
+        self.batches = 0
+        self.batch_fallbacks = 0
+        self.fallback_errors = []
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add_success(self, request_charge):
+        with self._lock:
+            self.succeeded += 1
+            self.request_charge += request_charge
+
+    def add_batch(self, count, request_charge):
+        with self._lock:
+            self.batches += 1
+            self.succeeded += count
+            self.request_charge += request_charge
+
+    def add_batch_fallback(self, error):
+        with self._lock:
+            ## the documents of the batch are still written (one by one), so this is no failure
+            self.batch_fallbacks += 1
+            self.fallback_errors.append(str(error))
+
+    def add_failure(self, document, error):
+        with self._lock:
+            self.failed += 1
+            self.failures.append((document.get("id") if isinstance(document, dict) else None, str(error)))
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def docs_per_second(self):
+        return self.succeeded / self.elapsed if self.elapsed > 0 else 0.0
+
+    def print_summary(self):
+        print(f"documents upserted : {self.succeeded}")
+        print(f"documents failed   : {self.failed}")
+        print(f"elapsed            : {self.elapsed:.2f} s")
+        print(f"throughput         : {self.docs_per_second:.1f} docs/sec")
+        print(f"total request charge : {self.request_charge:.2f} RU")
+        if self.batches or self.batch_fallbacks:
+            print(f"batches            : {self.batches} ({self.batch_fallbacks} written one by one)")
+        for error in self.fallback_errors[:3]:
+            print(f"    -- batch written one by one after: {error}")
+        ## we only show the first few errors, otherwise a bad run floods the screen
+        for doc_id, error in self.failures[:10]:
+            print(f"    -- failed {doc_id}: {error}")
+
+
+def bulk_upsert(container_client, documents, concurrency=8, controller=None, on_success=None):
+    """
+    this function upserts all documents with a bounded pool of worker threads
+    documents can be any iterable (also a generator), we never hold more than `concurrency` documents in flight
+    a failing document is only recorded in the report, it does not stop the run
+    with a RateController the requests stay under its RU/s budget and throttled requests are retried
+    on_success is called with every document that cosmos db accepted (for example to update a manifest)
+    """
+    report = LoadReport()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+        for document in documents:
+            _submit(pool, in_flight, concurrency, _upsert_one, container_client, document, report, controller, on_success)
+        _drain(in_flight)
+
+    report.finish()
+    return report
+
+
+def batch_upsert(container_client, documents, partition_key_path="/Category", batch_size=MAX_BATCH_OPERATIONS, concurrency=4, controller=None, on_success=None):
+    """
+    this function groups the documents by their partition key value and sends them as transactional batches
+    one batch is one request for up to 100 documents instead of 100 requests, but all documents in a batch must share the partition key
+    if a batch fails (for example too big, or one bad document) we write the documents of that batch one by one
+    documents without a partition key value are also written one by one
+    """
+    report = LoadReport()
+    batch_size = min(batch_size, MAX_BATCH_OPERATIONS)
+    ## we dont want to buffer forever when there are many different partition keys, so we flush the biggest group at this point
+    max_pending = batch_size * concurrency
+    groups = {}
+    pending = 0
+
+    with ThreadPoolExecutor(max_workers=concurrency) as pool:
+        in_flight = set()
+        for document in documents:
+            partition_key = get_partition_key_value(document, partition_key_path)
+            if partition_key is None:
+                _submit(pool, in_flight, concurrency, _upsert_one, container_client, document, report, controller, on_success)
+                continue
+
+            ## True and 1 are the same dict key in python but not the same partition key in cosmos, so we add the type
+            group_key = (type(partition_key), partition_key)
+            group = groups.setdefault(group_key, [])
+            group.append(document)
+            pending += 1
+            if len(group) >= batch_size:
+                pending -= len(groups.pop(group_key))
+                _submit(pool, in_flight, concurrency, _write_batch, container_client, partition_key, group, report, controller, on_success)
+            elif pending >= max_pending:
+                biggest = max(groups, key=lambda key: len(groups[key]))
+                pending -= len(groups[biggest])
+                _submit(pool, in_flight, concurrency, _write_batch, container_client, biggest[1], groups.pop(biggest), report, controller, on_success)
+
+        ## at the end we send what is left in every group
+        for (_, partition_key), group in groups.items():
+            _submit(pool, in_flight, concurrency, _write_batch, container_client, partition_key, group, report, controller, on_success)
+        _drain(in_flight)
+
+    report.finish()
+    return report
+
+
+def get_partition_key_value(document, partition_key_path):
+    """this function gets the value at a partition key path like /Category or /Address/City, None if its not there"""
+    value = document
+    for part in partition_key_path.strip("/").split("/"):
+        if not isinstance(value, dict) or part not in value:
+            return None
+        value = value[part]
+    ## only simple values can be a partition key
+    return value if isinstance(value, (str, int, float, bool)) else None
+
+
+def _submit(pool, in_flight, limit, function, *args):
+    """this helper submits work to the pool, but first waits for a free slot when `limit` tasks are running"""
+    if len(in_flight) >= limit:
+        done, _ = wait(in_flight, return_when=FIRST_COMPLETED)
+        for future in done:
+            in_flight.discard(future)
+            ## the workers record their own errors, so this only raises on a bug in the loader itself
+            future.result()
+    in_flight.add(pool.submit(function, *args))
+
+
+def _drain(in_flight):
+    """this helper waits for the tasks that are still running, like _submit it raises the error of a task that crashed"""
+    for future in wait(in_flight).done:
+        future.result()
+    in_flight.clear()
+
+
+def _upsert_one(container_client, document, report, controller, on_success):
+    try:
+        result = call(controller, container_client, container_client.upsert_item, document)
+    except Exception as e:
+        report.add_failure(document, e)
+        return
+    report.add_success(get_request_charge(container_client, result))
+    if on_success:
+        on_success(document)
+
+
+def _write_batch(container_client, partition_key, documents, report, controller, on_success):
+    operations = [("upsert", (document,)) for document in documents]
+    try:
+        result = call(controller, container_client, container_client.execute_item_batch, batch_operations=operations, partition_key=partition_key)
+    except Exception as e:
+        ## the batch is transactional, so nothing of it is written and we can safely retry per document
+        report.add_batch_fallback(e)
+        for document in documents:
+            _upsert_one(container_client, document, report, controller, on_success)
+        return
+    report.add_batch(len(documents), get_request_charge(container_client, result))
+    if on_success:
+        for document in documents:
+            on_success(document)
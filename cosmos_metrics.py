@@ -0,0 +1,302 @@
+## request charge and latency metrics for cosmos db calls
+## the sdk tells us the RU of every call in the response headers but the scripts just throw that away
+## here we wrap the container client (data plane) and the management clients and record for every operation and partition key:
+## the count, errors, RU, latency percentiles (p50/p95/p99), sdk retries and payload sizes
+## the result goes to a json file (for other tools) and to a summary table on screen
+
+import json
+import math
+import threading
+import time
+
+from cosmos_utils import RequestChargeHook, get_response_headers
+from cosmos_loader import get_partition_key_value
+
+
+class LatencyHistogram:
+    """
+    this class keeps latencies in buckets that grow by 5%, so memory stays small even after millions of calls
+    the percentiles are the upper bound of the bucket, so they are at most 5% too high
+    """
+
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets = {}
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def add(self, seconds):
+        milliseconds = max(seconds * 1000, 0.001)
+        index = math.ceil(math.log(milliseconds, self.GROWTH))
+        self.buckets[index] = self.buckets.get(index, 0) + 1
+        self.count += 1
+        self.total += milliseconds
+        self.max = max(self.max, milliseconds)
+
+    def percentile(self, percent):
+        """this function gives the latency in milliseconds below which `percent` of the calls are"""
+        if not self.count:
+            return 0.0
+        wanted = math.ceil(self.count * percent / 100)
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= wanted:
+                return min(self.GROWTH ** index, self.max)
+        return self.max
+
+
+class OperationStats:
+    """this class keeps the numbers of one (operation, partition key) combination"""
+
+    def __init__(self):
+        self.count = 0
+        self.errors = 0
+        self.request_charge = 0.0
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.latency = LatencyHistogram()
+
+    def to_dict(self):
+        return {
+            "count": self.count,
+            "errors": self.errors,
+            "request_charge": round(self.request_charge, 2),
+            "retries": self.retries,
+            "request_bytes": self.request_bytes,
+            "response_bytes": self.response_bytes,
+            "latency_ms": {
+                "avg": round(self.latency.total / self.latency.count, 3) if self.latency.count else 0.0,
+                "p50": round(self.latency.percentile(50), 3),
+                "p95": round(self.latency.percentile(95), 3),
+                "p99": round(self.latency.percentile(99), 3),
+                "max": round(self.latency.max, 3),
+            },
+        }
+
+
+class MetricsRecorder:
+    """this class collects the stats of all operations, its thread safe so the bulk loader can share one"""
+
+    def __init__(self):
+        self.stats = {}
+        self._lock = threading.Lock()
+
+    def record(self, operation, partition_key, seconds, request_charge=0.0, retries=0, request_bytes=0, response_bytes=0, error=None):
+        key = (operation, "-" if partition_key is None else str(partition_key))
+        with self._lock:
+            stats = self.stats.get(key)
+            if stats is None:
+                stats = self.stats[key] = OperationStats()
+            stats.count += 1
+            stats.errors += 1 if error is not None else 0
+            stats.request_charge += request_charge
+            stats.retries += retries
+            stats.request_bytes += request_bytes
+            stats.response_bytes += response_bytes
+            stats.latency.add(seconds)
+
+    def to_dict(self):
+        with self._lock:
+            return {
+                "operations": [
+                    {"operation": operation, "partition_key": partition_key, **stats.to_dict()}
+                    for (operation, partition_key), stats in sorted(self.stats.items())
+                ]
+            }
+
+    def write_json(self, path):
+        with open(path, "w", encoding="utf-8") as file:
+            json.dump(self.to_dict(), file, indent=2)
+
+    def print_summary(self):
+        rows = self.to_dict()["operations"]
+        print(f"{'operation':<40} {'partition key':<15} {'count':>7} {'errors':>6} {'RU':>10} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'retries':>7}")
+        for row in rows:
+            latency = row["latency_ms"]
+            print(f"{row['operation'][:40]:<40} {row['partition_key'][:15]:<15} {row['count']:>7} {row['errors']:>6} {row['request_charge']:>10.2f} "
+                  f"{latency['p50']:>8.2f} {latency['p95']:>8.2f} {latency['p99']:>8.2f} {row['retries']:>7}")
+
+
+def _size(value):
+    """this function gives the size of a json body in bytes, 0 when its not json"""
+    if value is None:
+        return 0
+    try:
+        return len(json.dumps(value, separators=(",", ":")).encode("utf-8"))
+    except (TypeError, ValueError):
+        return 0
+
+
+def _header_float(headers, name):
+    try:
+        return float(headers.get(name, 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class InstrumentedContainer:
+    """
+    this class wraps a cosmos db container client and records every data plane call in a MetricsRecorder
+    it has the same methods as the container client, everything we dont wrap is passed through as it is
+    """
+
+    def __init__(self, container_client, recorder, partition_key_path="/Category"):
+        self._container_client = container_client
+        self._recorder = recorder
+        self._partition_key_path = partition_key_path
+
+    def __getattr__(self, name):
+        return getattr(self._container_client, name)
+
+    def _call(self, operation, partition_key, request_body, function, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            headers = getattr(e, "headers", None) or {}
+            self._recorder.record(operation, partition_key, time.perf_counter() - started,
+                                  request_charge=_header_float(headers, "x-ms-request-charge"),
+                                  request_bytes=_size(request_body), error=e)
+            raise
+        headers = get_response_headers(self._container_client, result)
+        self._recorder.record(operation, partition_key, time.perf_counter() - started,
+                              request_charge=_header_float(headers, "x-ms-request-charge"),
+                              retries=int(_header_float(headers, "x-ms-throttle-retry-count")),
+                              request_bytes=_size(request_body), response_bytes=_size(result))
+        return result
+
+    def _body_partition_key(self, body):
+        return get_partition_key_value(body, self._partition_key_path) if isinstance(body, dict) else None
+
+    def upsert_item(self, body, *args, **kwargs):
+        return self._call("upsert_item", self._body_partition_key(body), body, self._container_client.upsert_item, body, *args, **kwargs)
+
+    def create_item(self, body, *args, **kwargs):
+        return self._call("create_item", self._body_partition_key(body), body, self._container_client.create_item, body, *args, **kwargs)
+
+    def replace_item(self, item, body, *args, **kwargs):
+        return self._call("replace_item", self._body_partition_key(body), body, self._container_client.replace_item, item, body, *args, **kwargs)
+
+    def read_item(self, item, partition_key, *args, **kwargs):
+        return self._call("read_item", partition_key, None, self._container_client.read_item, item, partition_key, *args, **kwargs)
+
+    def delete_item(self, item, partition_key, *args, **kwargs):
+        return self._call("delete_item", partition_key, None, self._container_client.delete_item, item, partition_key, *args, **kwargs)
+
+    def patch_item(self, item, partition_key, patch_operations, *args, **kwargs):
+        return self._call("patch_item", partition_key, patch_operations, self._container_client.patch_item, item, partition_key, patch_operations, *args, **kwargs)
+
+    def execute_item_batch(self, batch_operations, partition_key, *args, **kwargs):
+        body = [operation[1][0] for operation in batch_operations if operation[1]]
+        return self._call("execute_item_batch", partition_key, body, self._container_client.execute_item_batch, batch_operations, partition_key, *args, **kwargs)
+
+    def query_items(self, query, *args, **kwargs):
+        ## queries are lazy, so we measure every page when it is fetched instead of the query_items call itself
+        ## the charge of a page comes from our response_hook, the client headers can belong to a query of another thread
+        partition_key = kwargs.get("partition_key", "cross-partition")
+        hook = kwargs["response_hook"] = RequestChargeHook(kwargs.get("response_hook"))
+        paged = self._container_client.query_items(query, *args, **kwargs)
+        return InstrumentedPaged(paged, self._recorder, "query_items: " + " ".join(query.split()), partition_key, hook)
+
+    def read_all_items(self, *args, **kwargs):
+        hook = kwargs["response_hook"] = RequestChargeHook(kwargs.get("response_hook"))
+        paged = self._container_client.read_all_items(*args, **kwargs)
+        return InstrumentedPaged(paged, self._recorder, "read_all_items", "cross-partition", hook)
+
+
+class InstrumentedPaged:
+    """this class wraps a paged result (ItemPaged) and records every page that is fetched"""
+
+    def __init__(self, paged, recorder, operation, partition_key, hook=None):
+        self._paged = paged
+        self._recorder = recorder
+        self._operation = operation
+        self._partition_key = partition_key
+        self._hook = hook
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+    def by_page(self, continuation_token=None):
+        return InstrumentedPages(self._paged.by_page(continuation_token), self)
+
+    def __getattr__(self, name):
+        return getattr(self._paged, name)
+
+
+class InstrumentedPages:
+    """this class is the page iterator of an InstrumentedPaged, the continuation_token is passed through"""
+
+    def __init__(self, pages, paged):
+        self._pages = pages
+        self._paged = paged
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        paged = self._paged
+        ## management clients have no request charge, they have no hook
+        responses = paged._hook.responses if paged._hook is not None else None
+        started = time.perf_counter()
+        try:
+            page = list(next(self._pages))
+        except StopIteration:
+            raise
+        except Exception as e:
+            paged._recorder.record(paged._operation, paged._partition_key, time.perf_counter() - started, error=e)
+            raise
+        ## when the hook was not called for this page we dont know its charge, better 0 than the charge of another request
+        headers = paged._hook.headers if paged._hook is not None and paged._hook.responses != responses else {}
+        paged._recorder.record(paged._operation, paged._partition_key, time.perf_counter() - started,
+                               request_charge=_header_float(headers, "x-ms-request-charge"),
+                               retries=int(_header_float(headers, "x-ms-throttle-retry-count")),
+                               response_bytes=_size(page))
+        return iter(page)
+
+    @property
+    def continuation_token(self):
+        return self._pages.continuation_token
+
+
+class InstrumentedClient:
+    """
+    this class wraps any azure client (like the CosmosDBManagementClient) and records the time of every method call
+    operation groups like client.sql_resources are wrapped as well, so the name becomes sql_resources.list_sql_role_assignments
+    """
+
+    def __init__(self, client, recorder, prefix=""):
+        self._client = client
+        self._recorder = recorder
+        self._prefix = prefix
+
+    def __getattr__(self, name):
+        attribute = getattr(self._client, name)
+        if name.startswith("_"):
+            return attribute
+        operation = self._prefix + name
+        if callable(attribute):
+            return self._wrap(operation, attribute)
+        if hasattr(attribute, "__dict__"):
+            return InstrumentedClient(attribute, self._recorder, operation + ".")
+        return attribute
+
+    def _wrap(self, operation, function):
+        def wrapper(*args, **kwargs):
+            started = time.perf_counter()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                self._recorder.record(operation, None, time.perf_counter() - started, error=e)
+                raise
+            ## list operations are lazy, the real calls happen when we page through them
+            if hasattr(result, "by_page"):
+                return InstrumentedPaged(result, self._recorder, operation, None)
+            self._recorder.record(operation, None, time.perf_counter() - started)
+            return result
+        return wrapper
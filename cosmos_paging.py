@@ -0,0 +1,125 @@
+## paged queries with continuation tokens
+## list(container_client.query_items(...)) keeps every result in memory and when something fails halfway we start from zero
+## here we read the results page by page (max_item_count per page) and keep the continuation token of the last page we handed out
+## the token can be written to a file, so a new run continues where the last one stopped
+
+import os
+import time
+
+from cosmos_throttle import call
+from cosmos_utils import RequestChargeHook
+
+## these status codes are worth another try (timeout, gone, retry with, server error, service unavailable)
+TRANSIENT_STATUS_CODES = (408, 410, 449, 500, 503)
+
+
+class _Page(list):
+    """a page of results with the response headers of the request that fetched it, like the CosmosList of azure-cosmos"""
+
+    def __init__(self, items, headers):
+        super().__init__(items)
+        self._headers = headers
+
+    def get_response_headers(self):
+        return self._headers
+
+
+class PagedQuery:
+    """
+    this class runs a query page by page, memory stays bounded by the page size
+    continuation_token is the token to continue after the last page the caller finished, None when we are done or did not start yet
+    with checkpoint_path the token is also saved to that file after every page, and loaded from it when we start
+    """
+
+    def __init__(self, container_client, query, parameters=None, max_item_count=100, continuation_token=None,
+                 checkpoint_path=None, controller=None, retries=3, **kwargs):
+        self.container_client = container_client
+        self.query = query
+        self.parameters = parameters
+        self.max_item_count = max_item_count
+        self.checkpoint_path = checkpoint_path
+        self.controller = controller
+        self.retries = retries
+        self.kwargs = kwargs
+        if continuation_token is None and checkpoint_path and os.path.exists(checkpoint_path):
+            with open(checkpoint_path, "r", encoding="utf-8") as file:
+                continuation_token = file.read() or None
+        self.continuation_token = continuation_token
+        self.pages_read = 0
+        self._pager = None
+        self._hook = None
+
+    def __iter__(self):
+        for page in self.pages():
+            yield from page
+
+    def pages(self):
+        """this generator yields the result pages as lists, the token moves forward when the caller asks for the next page"""
+        while True:
+            page = self._read_page()
+            if page is None:
+                self._finish()
+                return
+            token = self._pager.continuation_token
+            self.pages_read += 1
+            yield page
+            ## the caller is done with this page, so now its safe to continue after it
+            self.continuation_token = token
+            self._checkpoint()
+            if token is None:
+                self._finish()
+                return
+
+    def _read_page(self):
+        attempt = 0
+        while True:
+            try:
+                return call(self.controller, self.container_client, self._next_page)
+            except Exception as e:
+                if getattr(e, "status_code", None) not in TRANSIENT_STATUS_CODES or attempt >= self.retries:
+                    raise
+                attempt += 1
+                time.sleep(0.5 * attempt)
+
+    def _next_page(self):
+        if self._pager is None:
+            ## the hook sees the headers of our own pages, the last_response_headers of the client can belong to a query of
+            ## another thread (the scan and the aggregates run queries in parallel)
+            self._hook = RequestChargeHook(self.kwargs.get("response_hook"))
+            kwargs = dict(self.kwargs, response_hook=self._hook)
+            self._pager = self.container_client.query_items(
+                self.query, parameters=self.parameters, max_item_count=self.max_item_count, **kwargs
+            ).by_page(self.continuation_token)
+        responses = self._hook.responses
+        try:
+            page = list(next(self._pager))
+        except StopIteration:
+            return None
+        except Exception:
+            ## we dont trust a pager that failed halfway, the next try starts again from our last token
+            self._pager = None
+            raise
+        ## the page carries its own headers, so the controller books the charge of this page
+        return _Page(page, self._hook.headers if self._hook.responses != responses else {})
+
+    def _checkpoint(self):
+        if not self.checkpoint_path:
+            return
+        temp_path = self.checkpoint_path + ".tmp"
+        with open(temp_path, "w", encoding="utf-8") as file:
+            file.write(self.continuation_token or "")
+        os.replace(temp_path, self.checkpoint_path)
+
+    def _finish(self):
+        ## the query is complete, so the next run should start from the beginning again
+        self.continuation_token = None
+        if self.checkpoint_path and os.path.exists(self.checkpoint_path):
+            os.remove(self.checkpoint_path)
+
+
+def throttled_query(controller, container_client, query, parameters=None, **kwargs):
+    """
+    this generator runs a query page by page, every page goes through the controller
+    when a page is throttled we start again from the continuation token of the last good page, so nothing is read twice
+    """
+    yield from PagedQuery(container_client, query, parameters, controller=controller, **kwargs)
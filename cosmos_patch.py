@@ -0,0 +1,76 @@
+## partial document updates with patch operations
+## read_item + change + replace_item sends the whole hotel two times, and when someone else writes in between we overwrite their change
+## with patch we only send the change itself ("add this room to /Rooms"), cosmos db applies it on the server
+## when the change depends on what we read, we guard it with the etag so it fails (412) if the item changed, and then we try again
+
+from azure.core import MatchConditions
+
+from cosmos_throttle import call
+
+## cosmos db accepts at most 10 operations in one patch
+MAX_PATCH_OPERATIONS = 10
+
+
+## small helpers to build the patch operations, paths are json pointers like /Rating or /Rooms/-
+def add_op(path, value):
+    """add a value, /Rooms/- appends to the end of the Rooms array"""
+    return {"op": "add", "path": path, "value": value}
+
+
+def set_op(path, value):
+    """set a value, the property is created when its not there"""
+    return {"op": "set", "path": path, "value": value}
+
+
+def replace_op(path, value):
+    """replace a value, fails when the property is not there"""
+    return {"op": "replace", "path": path, "value": value}
+
+
+def remove_op(path):
+    return {"op": "remove", "path": path}
+
+
+def incr_op(path, value=1):
+    """increment a number on the server, so two clients can count at the same time without losing updates"""
+    return {"op": "incr", "path": path, "value": value}
+
+
+def patch_item(container_client, item_id, partition_key, operations, etag=None, controller=None):
+    """
+    this function sends the patch operations for one item and gives back the updated item
+    with an etag the patch only succeeds when the item did not change since we read it, otherwise cosmos db answers 412
+    """
+    if len(operations) > MAX_PATCH_OPERATIONS:
+        raise ValueError(f"a patch can have at most {MAX_PATCH_OPERATIONS} operations, got {len(operations)}")
+    kwargs = {}
+    if etag:
+        kwargs = {"etag": etag, "match_condition": MatchConditions.IfNotModified}
+    return call(controller, container_client, container_client.patch_item, item_id, partition_key, operations, **kwargs)
+
+
+def update_item(container_client, item_id, partition_key, make_operations, retries=5, controller=None, cache=None):
+    """
+    this function does a safe read-modify-write with patch instead of replace
+    make_operations(item) gets the current item and gives back the patch operations, we send them guarded by the etag
+    when someone else changed the item in between (412) we read it again and call make_operations again
+    with a cache the read can come from the cache, a stale etag just gives one extra try
+    """
+    attempt = 0
+    while True:
+        if cache is not None:
+            item = cache.read_item(item_id, partition_key)
+        else:
+            item = call(controller, container_client, container_client.read_item, item_id, partition_key)
+        operations = make_operations(item)
+        if not operations:
+            return item
+        try:
+            if cache is not None:
+                return cache.patch_item(item_id, partition_key, operations, etag=item.get("_etag"))
+            return patch_item(container_client, item_id, partition_key, operations, etag=item.get("_etag"), controller=controller)
+        except Exception as e:
+            if getattr(e, "status_code", None) != 412 or attempt >= retries:
+                raise
+            attempt += 1
+            ## the item changed on the server, the cache already dropped it so the next read gets the current version
@@ -0,0 +1,92 @@
+## typed queries: say which fields you need, get small records back
+## SELECT * sends the whole hotel (Rooms, Address, Description_fr, ...) when we only print HotelName and Rating
+## here the caller describes the fields once (record_type), we write the projection (SELECT c["HotelName"] AS HotelName, ...)
+## and turn every row in a record with __slots__: no dict per row, so a long listing needs a lot less memory
+
+from cosmos_router import QueryRouter
+from cosmos_sql import KEYWORDS
+
+
+class Record:
+    """
+    the base class of the records record_type makes, a record works like a small read only object with named fields
+    a field that is missing in the document (undefined in cosmos db) is None
+    """
+
+    __slots__ = ()
+    _fields = ()
+    _paths = ()
+
+    def __init__(self, *values):
+        if len(values) != len(self._fields):
+            raise TypeError(f"{type(self).__name__} needs {len(self._fields)} values, got {len(values)}")
+        for field, value in zip(self._fields, values):
+            object.__setattr__(self, field, value)
+
+    @classmethod
+    def from_row(cls, row):
+        return cls(*(row.get(field) for field in cls._fields))
+
+    def __setattr__(self, name, value):
+        raise AttributeError(f"{type(self).__name__} is read only")
+
+    def __iter__(self):
+        return (getattr(self, field) for field in self._fields)
+
+    def __eq__(self, other):
+        return type(other) is type(self) and tuple(self) == tuple(other)
+
+    def __hash__(self):
+        return hash(tuple(self))
+
+    def __repr__(self):
+        return f"{type(self).__name__}({', '.join(f'{field}={getattr(self, field)!r}' for field in self._fields)})"
+
+    def _asdict(self):
+        return dict(zip(self._fields, self))
+
+
+def record_type(name, fields):
+    """
+    this function makes a record class, fields is a dict field name -> document path like "/HotelName" or "/Address/City"
+    a list of names is short for the top level properties with that name
+    """
+    if not isinstance(fields, dict):
+        fields = {field: f"/{field}" for field in fields}
+    for field in fields:
+        if not field.isidentifier() or field.startswith("_") or field.upper() in KEYWORDS:
+            raise ValueError(f"{field} cant be a field name, use a python identifier that does not start with _ and is no sql keyword")
+    return type(name, (Record,), {
+        "__slots__": tuple(fields),
+        "_fields": tuple(fields),
+        "_paths": tuple(fields.values()),
+    })
+
+
+def projection(record_class, alias="c"):
+    """this function gives the SELECT list for the record, with the bracket notation every property name works"""
+    columns = []
+    for field, path in zip(record_class._fields, record_class._paths):
+        column = alias + "".join(f'["{part}"]' for part in path.strip("/").split("/"))
+        columns.append(f"{column} AS {field}")
+    return ", ".join(columns)
+
+
+def records_query(record_class, where=None, order_by=None):
+    """this function gives SELECT <fields of the record> FROM c [WHERE where] [ORDER BY order_by]"""
+    query = f"SELECT {projection(record_class)} FROM c"
+    if where:
+        query += f" WHERE {where}"
+    if order_by:
+        query += f" ORDER BY {order_by}"
+    return query
+
+
+def query_records(source, record_class, where=None, parameters=None, order_by=None, allow_fan_out=False, **kwargs):
+    """
+    this generator runs the records_query of the record and yields records
+    source is a QueryRouter (or a container client, then we make a router for it), so the partition routing works as usual
+    """
+    router = source if isinstance(source, QueryRouter) else QueryRouter(source)
+    for row in router.query(records_query(record_class, where, order_by), parameters, allow_fan_out=allow_fan_out, **kwargs):
+        yield record_class.from_row(row)
@@ -0,0 +1,182 @@
+## partition aware queries
+## a query with c.Category = 'Budget' only needs the partition of Budget, one without a filter on the partition key has to ask
+## every partition (fan-out), which costs the base charge of every physical partition again
+## the router parses the query (cosmos_sql.parse), looks for = and IN filters on the partition key path in the WHERE and picks:
+##   single:  one partition key value   -> the query runs with partition_key=value
+##   multi:   a few values (IN or OR)   -> one targeted query per value, or one cross partition query when the results must be
+##                                         merged (ORDER BY, TOP, OFFSET, DISTINCT, GROUP BY, aggregates)
+##   fan-out: no filter on the key      -> a cross partition query, which we allow, warn about or refuse (fan_out setting)
+
+import threading
+
+from cosmos_paging import PagedQuery
+from cosmos_sql import SqlError, contains_aggregate, parse
+
+
+class FanOutError(Exception):
+    """this error is raised when a query would ask every partition and the router is set to refuse that"""
+
+
+class QueryRoute:
+    """this class is the routing decision for one query: kind is single, multi or fan-out"""
+
+    def __init__(self, kind, partition_keys=None, merged=False, reason=None):
+        self.kind = kind
+        self.partition_keys = partition_keys or []
+        self.merged = merged
+        self.reason = reason
+
+    def __repr__(self):
+        return f"QueryRoute({self.kind}, partition_keys={self.partition_keys})"
+
+
+def _property_path(expression, alias):
+    """this function gives the path of c.Address.City (or c["Address"]["City"]) as ["Address", "City"], None for anything else"""
+    parts = []
+    while expression[0] == "property":
+        _, expression, name = expression
+        if name[0] != "lit" or not isinstance(name[1], str):
+            return None
+        parts.append(name[1])
+    if expression != ("alias", alias):
+        return None
+    return list(reversed(parts))
+
+
+def _constant(expression, parameters):
+    """this function gives (True, value) for a literal or a parameter, (False, None) when the value depends on the document"""
+    if expression[0] == "lit":
+        return True, expression[1]
+    if expression[0] == "param" and expression[1] in parameters:
+        return True, parameters[expression[1]]
+    return False, None
+
+
+def _value_key(value):
+    ## True and 1 are equal in python but not the same partition key in cosmos, so we compare the type too
+    return (type(value), value)
+
+
+def _unique(values):
+    """this function drops repeated partition key values (IN ('Budget', 'Budget')), otherwise we ask the partition twice"""
+    seen = set()
+    unique = []
+    for value in values:
+        if _value_key(value) not in seen:
+            seen.add(_value_key(value))
+            unique.append(value)
+    return unique
+
+
+def _key_values(expression, key_path, alias, parameters):
+    """
+    this function gives the list of partition key values the filter allows, or None when it allows any value
+    AND keeps the values both sides allow, OR needs a value list on both sides
+    """
+    if expression is None:
+        return None
+    kind = expression[0]
+    if kind == "compare" and expression[1] == "=":
+        for column, value in ((expression[2], expression[3]), (expression[3], expression[2])):
+            is_constant, constant = _constant(value, parameters)
+            if is_constant and _property_path(column, alias) == key_path:
+                return [constant]
+        return None
+    if kind == "in" and _property_path(expression[1], alias) == key_path:
+        values = []
+        for item in expression[2]:
+            is_constant, constant = _constant(item, parameters)
+            if not is_constant:
+                return None
+            values.append(constant)
+        return _unique(values)
+    if kind == "and":
+        left = _key_values(expression[1], key_path, alias, parameters)
+        right = _key_values(expression[2], key_path, alias, parameters)
+        if left is None or right is None:
+            return left if right is None else right
+        allowed = {_value_key(value) for value in right}
+        return _unique(value for value in left if _value_key(value) in allowed)
+    if kind == "or":
+        left = _key_values(expression[1], key_path, alias, parameters)
+        right = _key_values(expression[2], key_path, alias, parameters)
+        if left is None or right is None:
+            return None
+        return _unique(left + right)
+    return None
+
+
+def _needs_merge(parsed):
+    """a query whose result depends on all partitions together cant be split in one query per partition key"""
+    select_items = [] if parsed["select"] == "*" else ([parsed["select"]] if parsed["value"] else [item[0] for item in parsed["select"]])
+    return bool(
+        parsed["order_by"] or parsed["top"] is not None or parsed["offset"] is not None or parsed["distinct"]
+        or parsed["group_by"] or any(contains_aggregate(item) for item in select_items)
+    )
+
+
+def route_query(query, parameters=None, partition_key_path="/Category"):
+    """this function decides how a query should run, without running it"""
+    try:
+        parsed = parse(query)
+    except SqlError as e:
+        ## our small parser does not know all of cosmos sql (LIKE for example), such a query still works as a cross partition query
+        return QueryRoute("fan-out", reason=f"the router cant read it ({e})")
+    ## FROM x IN c.Array works on the array elements, the partition key is not there anymore
+    if parsed["from_in"] is not None:
+        return QueryRoute("fan-out")
+    values = {parameter["name"]: parameter["value"] for parameter in parameters or []}
+    key_values = _key_values(parsed["where"], partition_key_path.strip("/").split("/"), parsed["from_alias"], values)
+    if key_values is None:
+        return QueryRoute("fan-out")
+    if len(key_values) == 1:
+        return QueryRoute("single", key_values)
+    return QueryRoute("multi", key_values, merged=_needs_merge(parsed))
+
+
+class QueryRouter:
+    """
+    this class runs queries on the partitions they need
+    fan_out: "allow" runs cross partition queries silently, "warn" prints a warning, "fail" raises FanOutError
+    a query that really needs every partition can pass allow_fan_out=True
+    """
+
+    def __init__(self, container_client, partition_key_path=None, fan_out="warn", controller=None, max_item_count=100):
+        if fan_out not in ("allow", "warn", "fail"):
+            raise ValueError(f"fan_out must be allow, warn or fail, not {fan_out}")
+        if partition_key_path is None:
+            ## we ask the container for its partition key, so the router cant be set up with the wrong one
+            partition_key_path = container_client.read()["partitionKey"]["paths"][0]
+        self.container_client = container_client
+        self.partition_key_path = partition_key_path
+        self.fan_out = fan_out
+        self.controller = controller
+        self.max_item_count = max_item_count
+        self.routes = {"single": 0, "multi": 0, "fan-out": 0}
+        self._lock = threading.Lock()
+
+    def route(self, query, parameters=None):
+        return route_query(query, parameters, self.partition_key_path)
+
+    def query(self, query, parameters=None, allow_fan_out=False, **kwargs):
+        """this generator yields the items of the query, read page by page from the partitions the query needs"""
+        route = self.route(query, parameters)
+        with self._lock:
+            self.routes[route.kind] += 1
+        if route.kind == "fan-out" and not allow_fan_out:
+            reason = route.reason or f"it has no = or IN filter on {self.partition_key_path}"
+            message = f"query asks every partition, {reason}: {' '.join(query.split())}"
+            if self.fan_out == "fail":
+                raise FanOutError(message)
+            if self.fan_out == "warn":
+                print(f"    Warning: {message}")
+
+        options = dict(kwargs, max_item_count=kwargs.get("max_item_count", self.max_item_count), controller=self.controller)
+        if route.kind == "single":
+            yield from PagedQuery(self.container_client, query, parameters, partition_key=route.partition_keys[0], **options)
+        elif route.kind == "multi" and not route.merged:
+            for partition_key in route.partition_keys:
+                yield from PagedQuery(self.container_client, query, parameters, partition_key=partition_key, **options)
+        else:
+            ## cosmos db itself only visits the partitions of the key values of a multi query, but it has to merge the results
+            yield from PagedQuery(self.container_client, query, parameters, enable_cross_partition_query=True, **options)
@@ -0,0 +1,135 @@
+## full scan of every item in every container of the account
+## we find all databases and containers, split every container in its feed ranges (about one per physical partition)
+## and read the ranges at the same time with a thread pool, so a big container is read by many requests in parallel
+## the pages go through a bounded queue: when the caller is slower than the readers, the readers wait (backpressure)
+## and memory stays at about max_buffered_pages pages, also for containers with millions of items
+
+import queue
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from cosmos_paging import PagedQuery
+
+SCAN_QUERY = "SELECT * FROM c"
+
+## a reader puts this in the queue when its range is done (or failed)
+_RANGE_DONE = object()
+
+
+class ScanReport:
+    """this class keeps the numbers of a scan: items and pages per container, and the ranges that failed"""
+
+    def __init__(self):
+        self.items = {}
+        self.pages = 0
+        self.ranges = 0
+        self.failures = []
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add_page(self, database_id, container_id, count):
+        with self._lock:
+            key = (database_id, container_id)
+            self.items[key] = self.items.get(key, 0) + count
+            self.pages += 1
+
+    def add_failure(self, database_id, container_id, feed_range, error):
+        with self._lock:
+            self.failures.append((database_id, container_id, feed_range, str(error)))
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def total_items(self):
+        return sum(self.items.values())
+
+    def print_summary(self):
+        for (database_id, container_id), count in sorted(self.items.items()):
+            print(f"  {database_id}/{container_id}: {count} items")
+        print(f"items scanned      : {self.total_items} in {self.pages} pages from {self.ranges} feed ranges")
+        print(f"elapsed            : {self.elapsed:.2f} s")
+        print(f"throughput         : {self.total_items / self.elapsed if self.elapsed > 0 else 0.0:.1f} items/sec")
+        for database_id, container_id, feed_range, error in self.failures[:10]:
+            print(f"    -- failed {database_id}/{container_id} range {feed_range}: {error}")
+
+
+def discover_containers(client):
+    """this generator yields (database id, container client) for every container in every database of the account"""
+    for database in client.list_databases():
+        database_client = client.get_database_client(database["id"])
+        for container in database_client.list_containers():
+            yield database["id"], database_client.get_container_client(container["id"])
+
+
+def split_container(container_client):
+    """this function gives the feed ranges of a container, or [None] (the whole container) when the sdk cant split it"""
+    read_feed_ranges = getattr(container_client, "read_feed_ranges", None)
+    if read_feed_ranges is None:
+        return [None]
+    return list(read_feed_ranges()) or [None]
+
+
+def scan_account(client, workers=8, max_buffered_pages=16, page_size=1000, controller=None, report=None, containers=None):
+    """
+    this generator yields (database id, container id, item) for every item in the account, in no particular order
+    containers: a list of (database id, container client) to scan instead of everything discover_containers finds
+    a range that fails is recorded in the report and skipped, the other ranges go on
+    """
+    report = report if report is not None else ScanReport()
+    tasks = [
+        (database_id, container_client, feed_range)
+        for database_id, container_client in (containers if containers is not None else discover_containers(client))
+        for feed_range in split_container(container_client)
+    ]
+    report.ranges += len(tasks)
+    pages = queue.Queue(maxsize=max_buffered_pages)
+    stop = threading.Event()
+
+    def put(entry):
+        ## we wait for room in the queue, but give up when the caller stopped reading
+        while not stop.is_set():
+            try:
+                pages.put(entry, timeout=0.1)
+                return True
+            except queue.Full:
+                continue
+        return False
+
+    def read_range(database_id, container_client, feed_range):
+        container_id = container_client.id
+        try:
+            options = {"feed_range": feed_range} if feed_range is not None else {"enable_cross_partition_query": True}
+            for page in PagedQuery(container_client, SCAN_QUERY, max_item_count=page_size, controller=controller, **options).pages():
+                report.add_page(database_id, container_id, len(page))
+                if not put((database_id, container_id, page)):
+                    return
+        except Exception as e:
+            report.add_failure(database_id, container_id, feed_range, e)
+        finally:
+            put(_RANGE_DONE)
+
+    executor = ThreadPoolExecutor(max_workers=workers)
+    try:
+        for task in tasks:
+            executor.submit(read_range, *task)
+        remaining = len(tasks)
+        while remaining:
+            entry = pages.get()
+            if entry is _RANGE_DONE:
+                remaining -= 1
+                continue
+            database_id, container_id, page = entry
+            for item in page:
+                yield database_id, container_id, item
+    finally:
+        ## when the caller stops early the readers must not wait forever for room in the queue
+        stop.set()
+        executor.shutdown(wait=True, cancel_futures=True)
+        report.finish()
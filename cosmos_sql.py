@@ -0,0 +1,773 @@
+## a small cosmos db sql engine, so we can run our queries without a real cosmos db account
+## it knows the part of the language our scripts use:
+##   SELECT [DISTINCT] [TOP n] * | VALUE expr | expr [AS name], ...
+##   FROM c | FROM x IN c.Array, JOIN x IN c.Array
+##   WHERE with = != <> < <= > >= AND OR NOT IN BETWEEN, + - * / % ||, parameters (@name), EXISTS(SELECT ...)
+##   functions like LOWER, UPPER, CONTAINS, STARTSWITH, ARRAY_CONTAINS, IS_DEFINED and the aggregates COUNT SUM AVG MIN MAX
+##   GROUP BY, ORDER BY, OFFSET n LIMIT n
+## like cosmos db a missing property is "undefined" (not null), and a filter only passes when it is exactly true
+
+import json
+import math
+import re
+
+
+class SqlError(ValueError):
+    """this error is raised when we cant parse or run a query"""
+
+
+class _Undefined:
+    def __repr__(self):
+        return "undefined"
+
+
+UNDEFINED = _Undefined()
+
+KEYWORDS = {
+    "SELECT", "DISTINCT", "TOP", "VALUE", "AS", "FROM", "IN", "JOIN", "WHERE", "AND", "OR", "NOT",
+    "BETWEEN", "EXISTS", "ARRAY", "GROUP", "BY", "ORDER", "ASC", "DESC", "OFFSET", "LIMIT",
+    "TRUE", "FALSE", "NULL", "UNDEFINED",
+}
+
+AGGREGATES = {"COUNT", "SUM", "AVG", "MIN", "MAX"}
+
+_token_pattern = re.compile(r"""
+    (?P<space>\s+)
+  | (?P<number>\d+\.\d*(?:[eE][+-]?\d+)?|\.\d+(?:[eE][+-]?\d+)?|\d+(?:[eE][+-]?\d+)?)
+  | (?P<string>'(?:[^'\\]|\\.)*'|"(?:[^"\\]|\\.)*")
+  | (?P<param>@\w+)
+  | (?P<name>[A-Za-z_]\w*)
+  | (?P<op>>=|<=|!=|<>|\|\||\?\?|[=<>(),.\[\]*+\-/%{}:?])
+""", re.VERBOSE)
+
+_escapes = {"n": "\n", "t": "\t", "r": "\r", "b": "\b", "f": "\f", "\\": "\\", "'": "'", '"': '"', "/": "/"}
+
+
+def tokenize(text):
+    """this function splits the query text in tokens: (kind, value) tuples"""
+    tokens = []
+    pos = 0
+    while pos < len(text):
+        match = _token_pattern.match(text, pos)
+        if not match:
+            raise SqlError(f"unexpected character {text[pos]!r} at position {pos}")
+        pos = match.end()
+        kind = match.lastgroup
+        value = match.group()
+        if kind == "space":
+            continue
+        if kind == "number":
+            value = float(value) if any(c in value for c in ".eE") else int(value)
+        elif kind == "string":
+            value = re.sub(r"\\(u[0-9a-fA-F]{4}|.)", lambda m: chr(int(m.group(1)[1:], 16)) if m.group(1)[0] == "u" else _escapes.get(m.group(1), m.group(1)), value[1:-1])
+        elif kind == "name" and value.upper() in KEYWORDS:
+            kind, value = "keyword", value.upper()
+        tokens.append((kind, value))
+    tokens.append(("end", None))
+    return tokens
+
+
+class _Parser:
+    """a recursive descent parser, every parse_... function reads one part of the grammar"""
+
+    def __init__(self, text):
+        self.tokens = tokenize(text)
+        self.pos = 0
+
+    def peek(self, offset=0):
+        return self.tokens[self.pos + offset]
+
+    def next(self):
+        token = self.tokens[self.pos]
+        self.pos += 1
+        return token
+
+    def accept(self, kind, value=None):
+        token = self.peek()
+        if token[0] == kind and (value is None or token[1] == value):
+            self.pos += 1
+            return token
+        return None
+
+    def expect(self, kind, value=None):
+        token = self.accept(kind, value)
+        if token is None:
+            found = self.peek()
+            raise SqlError(f"expected {value or kind} but found {found[1] if found[1] is not None else 'end of query'}")
+        return token
+
+    def parse_query(self):
+        self.expect("keyword", "SELECT")
+        query = {"distinct": False, "top": None, "value": False, "select": "*", "from_alias": None, "from_in": None,
+                 "joins": [], "where": None, "group_by": [], "order_by": [], "offset": None, "limit": None}
+        if self.accept("keyword", "DISTINCT"):
+            query["distinct"] = True
+        if self.accept("keyword", "TOP"):
+            query["top"] = self.parse_count()
+        if self.accept("keyword", "VALUE"):
+            query["value"] = True
+            query["select"] = self.parse_expression()
+        elif self.accept("op", "*"):
+            query["select"] = "*"
+        else:
+            query["select"] = [self.parse_select_item()]
+            while self.accept("op", ","):
+                query["select"].append(self.parse_select_item())
+
+        if self.accept("keyword", "FROM"):
+            alias = self.expect("name")[1]
+            if self.accept("keyword", "IN"):
+                query["from_alias"] = alias
+                query["from_in"] = self.parse_expression()
+            else:
+                ## FROM Hotels h: the container name is not important, only the alias
+                self.accept("keyword", "AS")
+                second = self.accept("name")
+                query["from_alias"] = second[1] if second else alias
+            while self.accept("keyword", "JOIN"):
+                join_alias = self.expect("name")[1]
+                self.expect("keyword", "IN")
+                query["joins"].append((join_alias, self.parse_expression()))
+
+        if self.accept("keyword", "WHERE"):
+            query["where"] = self.parse_expression()
+        if self.accept("keyword", "GROUP"):
+            self.expect("keyword", "BY")
+            query["group_by"].append(self.parse_expression())
+            while self.accept("op", ","):
+                query["group_by"].append(self.parse_expression())
+        if self.accept("keyword", "ORDER"):
+            self.expect("keyword", "BY")
+            query["order_by"].append(self.parse_order_item())
+            while self.accept("op", ","):
+                query["order_by"].append(self.parse_order_item())
+        if self.accept("keyword", "OFFSET"):
+            query["offset"] = self.parse_count()
+            self.expect("keyword", "LIMIT")
+            query["limit"] = self.parse_count()
+        return query
+
+    def parse_count(self):
+        token = self.next()
+        if token[0] in ("number", "param"):
+            return ("lit", token[1]) if token[0] == "number" else ("param", token[1])
+        raise SqlError(f"expected a number but found {token[1]}")
+
+    def parse_select_item(self):
+        expression = self.parse_expression()
+        alias = None
+        if self.accept("keyword", "AS"):
+            alias = self.expect("name")[1]
+        elif self.peek()[0] == "name":
+            alias = self.next()[1]
+        return (expression, alias)
+
+    def parse_order_item(self):
+        expression = self.parse_expression()
+        if self.accept("keyword", "DESC"):
+            return (expression, False)
+        self.accept("keyword", "ASC")
+        return (expression, True)
+
+    ## expressions, from the weakest binding operator to the strongest
+    def parse_expression(self):
+        expression = self.parse_or()
+        if self.accept("op", "?"):
+            when_true = self.parse_expression()
+            self.expect("op", ":")
+            return ("ternary", expression, when_true, self.parse_expression())
+        if self.accept("op", "??"):
+            return ("coalesce", expression, self.parse_expression())
+        return expression
+
+    def parse_or(self):
+        expression = self.parse_and()
+        while self.accept("keyword", "OR"):
+            expression = ("or", expression, self.parse_and())
+        return expression
+
+    def parse_and(self):
+        expression = self.parse_not()
+        while self.accept("keyword", "AND"):
+            expression = ("and", expression, self.parse_not())
+        return expression
+
+    def parse_not(self):
+        if self.accept("keyword", "NOT"):
+            return ("not", self.parse_not())
+        return self.parse_comparison()
+
+    def parse_comparison(self):
+        expression = self.parse_additive()
+        while True:
+            token = self.peek()
+            if token[0] == "op" and token[1] in ("=", "!=", "<>", "<", "<=", ">", ">="):
+                self.next()
+                operator = "!=" if token[1] == "<>" else token[1]
+                expression = ("compare", operator, expression, self.parse_additive())
+                continue
+            negated = False
+            if token == ("keyword", "NOT") and self.peek(1)[0] == "keyword" and self.peek(1)[1] in ("IN", "BETWEEN"):
+                self.next()
+                negated = True
+                token = self.peek()
+            if token == ("keyword", "IN"):
+                self.next()
+                self.expect("op", "(")
+                values = [self.parse_expression()]
+                while self.accept("op", ","):
+                    values.append(self.parse_expression())
+                self.expect("op", ")")
+                expression = ("in", expression, values)
+            elif token == ("keyword", "BETWEEN"):
+                self.next()
+                low = self.parse_additive()
+                self.expect("keyword", "AND")
+                expression = ("between", expression, low, self.parse_additive())
+            else:
+                return expression
+            if negated:
+                expression = ("not", expression)
+
+    def parse_additive(self):
+        expression = self.parse_multiplicative()
+        while True:
+            token = self.peek()
+            if token[0] == "op" and token[1] in ("+", "-", "||"):
+                self.next()
+                expression = ("arith", token[1], expression, self.parse_multiplicative())
+            else:
+                return expression
+
+    def parse_multiplicative(self):
+        expression = self.parse_unary()
+        while True:
+            token = self.peek()
+            if token[0] == "op" and token[1] in ("*", "/", "%"):
+                self.next()
+                expression = ("arith", token[1], expression, self.parse_unary())
+            else:
+                return expression
+
+    def parse_unary(self):
+        if self.accept("op", "-"):
+            return ("negate", self.parse_unary())
+        if self.accept("op", "+"):
+            return self.parse_unary()
+        return self.parse_postfix()
+
+    def parse_postfix(self):
+        expression = self.parse_primary()
+        while True:
+            if self.accept("op", "."):
+                expression = ("property", expression, ("lit", self.expect("name")[1]))
+            elif self.accept("op", "["):
+                expression = ("property", expression, self.parse_expression())
+                self.expect("op", "]")
+            else:
+                return expression
+
+    def parse_primary(self):
+        kind, value = self.next()
+        if kind in ("number", "string"):
+            return ("lit", value)
+        if kind == "param":
+            return ("param", value)
+        if kind == "keyword":
+            if value in ("TRUE", "FALSE"):
+                return ("lit", value == "TRUE")
+            if value == "NULL":
+                return ("lit", None)
+            if value == "UNDEFINED":
+                return ("lit", UNDEFINED)
+            if value in ("EXISTS", "ARRAY"):
+                self.expect("op", "(")
+                subquery = self.parse_query()
+                self.expect("op", ")")
+                return ("exists" if value == "EXISTS" else "array_query", subquery)
+        if kind == "name":
+            if self.accept("op", "("):
+                arguments = []
+                if not self.accept("op", ")"):
+                    arguments.append(self.parse_expression())
+                    while self.accept("op", ","):
+                        arguments.append(self.parse_expression())
+                    self.expect("op", ")")
+                return ("call", value.upper(), arguments)
+            return ("alias", value)
+        if kind == "op" and value == "(":
+            if self.peek() == ("keyword", "SELECT"):
+                subquery = self.parse_query()
+                self.expect("op", ")")
+                return ("scalar_query", subquery)
+            expression = self.parse_expression()
+            self.expect("op", ")")
+            return expression
+        if kind == "op" and value == "[":
+            items = []
+            if not self.accept("op", "]"):
+                items.append(self.parse_expression())
+                while self.accept("op", ","):
+                    items.append(self.parse_expression())
+                self.expect("op", "]")
+            return ("array", items)
+        if kind == "op" and value == "{":
+            fields = []
+            if not self.accept("op", "}"):
+                while True:
+                    key = self.next()
+                    if key[0] not in ("name", "string"):
+                        raise SqlError(f"expected an object key but found {key[1]}")
+                    self.expect("op", ":")
+                    fields.append((key[1], self.parse_expression()))
+                    if not self.accept("op", ","):
+                        break
+                self.expect("op", "}")
+            return ("object", fields)
+        raise SqlError(f"unexpected {value if value is not None else 'end of query'}")
+
+
+def parse(text):
+    """this function parses a query text into a query dict, a SqlError tells what is wrong"""
+    parser = _Parser(text)
+    query = parser.parse_query()
+    if parser.peek()[0] != "end":
+        raise SqlError(f"unexpected {parser.peek()[1]} after the end of the query")
+    return query
+
+
+## the order cosmos db uses when it sorts values of different types
+def _type_rank(value):
+    if value is None:
+        return 0
+    if isinstance(value, bool):
+        return 1
+    if isinstance(value, (int, float)):
+        return 2
+    if isinstance(value, str):
+        return 3
+    if isinstance(value, list):
+        return 4
+    if isinstance(value, dict):
+        return 5
+    return 6
+
+
+def sort_key(value):
+    """this function gives a key to sort mixed json values like cosmos db does (undefined first)"""
+    if value is UNDEFINED:
+        return (-1, 0)
+    rank = _type_rank(value)
+    if rank in (1, 2, 3):
+        return (rank, value)
+    if rank in (4, 5):
+        return (rank, repr(value))
+    return (rank, 0)
+
+
+def _equal(left, right):
+    rank = _type_rank(left)
+    if rank != _type_rank(right):
+        return UNDEFINED
+    if rank == 4:
+        return len(left) == len(right) and all(_equal(a, b) is True for a, b in zip(left, right))
+    if rank == 5:
+        return left.keys() == right.keys() and all(_equal(left[key], right[key]) is True for key in left)
+    return left == right
+
+
+def _compare(operator, left, right):
+    if left is UNDEFINED or right is UNDEFINED:
+        return UNDEFINED
+    if operator == "=":
+        return _equal(left, right)
+    if operator == "!=":
+        equal = _equal(left, right)
+        return UNDEFINED if equal is UNDEFINED else not equal
+    rank = _type_rank(left)
+    ## < and > only work on two values of the same simple type
+    if rank != _type_rank(right) or rank not in (0, 1, 2, 3):
+        return UNDEFINED
+    if operator == "<":
+        return left < right
+    if operator == "<=":
+        return left <= right
+    if operator == ">":
+        return left > right
+    return left >= right
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _number_result(value):
+    if isinstance(value, float) and (math.isnan(value) or math.isinf(value)):
+        return UNDEFINED
+    return value
+
+
+def _string_function(function):
+    def wrapper(*args):
+        if not all(isinstance(arg, str) for arg in args):
+            return UNDEFINED
+        return function(*args)
+    return wrapper
+
+
+def _number_function(function):
+    def wrapper(*args):
+        if not all(_is_number(arg) for arg in args):
+            return UNDEFINED
+        return _number_result(function(*args))
+    return wrapper
+
+
+def _contains(text, part, ignore_case=False):
+    if not isinstance(text, str) or not isinstance(part, str):
+        return UNDEFINED
+    return part.lower() in text.lower() if ignore_case is True else part in text
+
+
+def _starts_with(text, part, ignore_case=False):
+    if not isinstance(text, str) or not isinstance(part, str):
+        return UNDEFINED
+    return text.lower().startswith(part.lower()) if ignore_case is True else text.startswith(part)
+
+
+def _ends_with(text, part, ignore_case=False):
+    if not isinstance(text, str) or not isinstance(part, str):
+        return UNDEFINED
+    return text.lower().endswith(part.lower()) if ignore_case is True else text.endswith(part)
+
+
+def _array_contains(array, value, partial=False):
+    if not isinstance(array, list):
+        return UNDEFINED
+    for item in array:
+        if partial is True and isinstance(item, dict) and isinstance(value, dict):
+            if all(key in item and _equal(item[key], value[key]) is True for key in value):
+                return True
+        elif _equal(item, value) is True:
+            return True
+    return False
+
+
+def _length(value):
+    return len(value) if isinstance(value, str) else UNDEFINED
+
+
+def _array_length(value):
+    return len(value) if isinstance(value, list) else UNDEFINED
+
+
+def _concat(*args):
+    if not all(isinstance(arg, str) for arg in args):
+        return UNDEFINED
+    return "".join(args)
+
+
+def _to_string(value):
+    if value is UNDEFINED:
+        return UNDEFINED
+    if isinstance(value, str):
+        return value
+    if isinstance(value, bool):
+        return "true" if value else "false"
+    if value is None:
+        return "null"
+    return json.dumps(value, separators=(",", ":"))
+
+
+def _round(value, digits=0):
+    return round(value, int(digits)) if digits else float(round(value))
+
+
+FUNCTIONS = {
+    "LOWER": _string_function(str.lower),
+    "UPPER": _string_function(str.upper),
+    "TRIM": _string_function(str.strip),
+    "LTRIM": _string_function(str.lstrip),
+    "RTRIM": _string_function(str.rstrip),
+    "LENGTH": _length,
+    "CONCAT": _concat,
+    "CONTAINS": _contains,
+    "STARTSWITH": _starts_with,
+    "ENDSWITH": _ends_with,
+    "INDEX_OF": _string_function(lambda text, part: text.find(part)),
+    "SUBSTRING": lambda text, start, length: text[int(start):int(start) + int(length)] if isinstance(text, str) and _is_number(start) and _is_number(length) else UNDEFINED,
+    "TOSTRING": _to_string,
+    "ARRAY_CONTAINS": _array_contains,
+    "ARRAY_LENGTH": _array_length,
+    "IS_DEFINED": lambda value: value is not UNDEFINED,
+    "IS_NULL": lambda value: value is None,
+    "IS_BOOL": lambda value: isinstance(value, bool),
+    "IS_NUMBER": _is_number,
+    "IS_STRING": lambda value: isinstance(value, str),
+    "IS_ARRAY": lambda value: isinstance(value, list),
+    "IS_OBJECT": lambda value: isinstance(value, dict),
+    "ABS": _number_function(abs),
+    "FLOOR": _number_function(math.floor),
+    "CEILING": _number_function(math.ceil),
+    "ROUND": _number_function(_round),
+    "SQRT": _number_function(lambda value: math.sqrt(value) if value >= 0 else float("nan")),
+}
+
+
+def _arith(operator, left, right):
+    if operator == "||":
+        return left + right if isinstance(left, str) and isinstance(right, str) else UNDEFINED
+    if not _is_number(left) or not _is_number(right):
+        return UNDEFINED
+    if operator == "+":
+        return left + right
+    if operator == "-":
+        return left - right
+    if operator == "*":
+        return left * right
+    if right == 0:
+        return UNDEFINED
+    if operator == "/":
+        return left / right
+    return math.fmod(left, right)
+
+
+def contains_aggregate(expression):
+    """this function checks if an expression uses COUNT/SUM/AVG/MIN/MAX (aggregates inside a subquery dont count)"""
+    kind = expression[0]
+    if kind in ("lit", "param", "alias", "exists", "array_query", "scalar_query"):
+        return False
+    if kind == "call":
+        return expression[1] in AGGREGATES or any(contains_aggregate(argument) for argument in expression[2])
+    if kind == "in":
+        return contains_aggregate(expression[1]) or any(contains_aggregate(option) for option in expression[2])
+    if kind == "array":
+        return any(contains_aggregate(item) for item in expression[1])
+    if kind == "object":
+        return any(contains_aggregate(item) for _, item in expression[1])
+    return any(contains_aggregate(part) for part in expression[1:] if isinstance(part, tuple))
+
+
+class Evaluator:
+    """this class evaluates expressions and runs queries with a set of parameters"""
+
+    def __init__(self, parameters=None):
+        self.parameters = {}
+        for parameter in parameters or []:
+            self.parameters[parameter["name"]] = parameter["value"]
+
+    def evaluate(self, expression, scope, group=None):
+        kind = expression[0]
+        if kind == "lit":
+            return expression[1]
+        if kind == "param":
+            if expression[1] not in self.parameters:
+                raise SqlError(f"parameter {expression[1]} has no value")
+            return self.parameters[expression[1]]
+        if kind == "alias":
+            if expression[1] not in scope:
+                raise SqlError(f"identifier {expression[1]} could not be resolved")
+            return scope[expression[1]]
+        if kind == "property":
+            base = self.evaluate(expression[1], scope, group)
+            key = self.evaluate(expression[2], scope, group)
+            if isinstance(base, dict) and isinstance(key, str):
+                return base.get(key, UNDEFINED)
+            if isinstance(base, list) and _is_number(key) and 0 <= key < len(base) and int(key) == key:
+                return base[int(key)]
+            return UNDEFINED
+        if kind == "compare":
+            return _compare(expression[1], self.evaluate(expression[2], scope, group), self.evaluate(expression[3], scope, group))
+        if kind == "and":
+            left = self.evaluate(expression[1], scope, group)
+            if left is False:
+                return False
+            right = self.evaluate(expression[2], scope, group)
+            if right is False:
+                return False
+            return True if left is True and right is True else UNDEFINED
+        if kind == "or":
+            left = self.evaluate(expression[1], scope, group)
+            if left is True:
+                return True
+            right = self.evaluate(expression[2], scope, group)
+            if right is True:
+                return True
+            return False if left is False and right is False else UNDEFINED
+        if kind == "not":
+            value = self.evaluate(expression[1], scope, group)
+            return not value if isinstance(value, bool) else UNDEFINED
+        if kind == "in":
+            value = self.evaluate(expression[1], scope, group)
+            if value is UNDEFINED:
+                return UNDEFINED
+            return any(_equal(value, self.evaluate(option, scope, group)) is True for option in expression[2])
+        if kind == "between":
+            value = self.evaluate(expression[1], scope, group)
+            low = _compare(">=", value, self.evaluate(expression[2], scope, group))
+            high = _compare("<=", value, self.evaluate(expression[3], scope, group))
+            if low is UNDEFINED or high is UNDEFINED:
+                return UNDEFINED
+            return low and high
+        if kind == "arith":
+            return _number_result(_arith(expression[1], self.evaluate(expression[2], scope, group), self.evaluate(expression[3], scope, group)))
+        if kind == "negate":
+            value = self.evaluate(expression[1], scope, group)
+            return -value if _is_number(value) else UNDEFINED
+        if kind == "ternary":
+            condition = self.evaluate(expression[1], scope, group)
+            return self.evaluate(expression[2] if condition is True else expression[3], scope, group)
+        if kind == "coalesce":
+            value = self.evaluate(expression[1], scope, group)
+            return self.evaluate(expression[2], scope, group) if value is UNDEFINED else value
+        if kind == "array":
+            return [value for value in (self.evaluate(item, scope, group) for item in expression[1]) if value is not UNDEFINED]
+        if kind == "object":
+            result = {}
+            for key, item in expression[1]:
+                value = self.evaluate(item, scope, group)
+                if value is not UNDEFINED:
+                    result[key] = value
+            return result
+        if kind == "exists":
+            return any(True for _ in self.run(expression[1], scope=scope))
+        if kind == "array_query":
+            return list(self.run(expression[1], scope=scope))
+        if kind == "scalar_query":
+            for value in self.run(expression[1], scope=scope):
+                return value
+            return UNDEFINED
+        if kind == "call":
+            name, arguments = expression[1], expression[2]
+            if name in AGGREGATES:
+                if group is None:
+                    raise SqlError(f"{name} can only be used in the SELECT of a query")
+                return self.aggregate(name, arguments, group)
+            if name not in FUNCTIONS:
+                raise SqlError(f"unknown function {name}")
+            values = [self.evaluate(argument, scope, group) for argument in arguments]
+            try:
+                return FUNCTIONS[name](*values)
+            except TypeError:
+                raise SqlError(f"wrong number of arguments for {name}")
+        raise SqlError(f"unknown expression {kind}")
+
+    def aggregate(self, name, arguments, group):
+        if name == "COUNT":
+            if not arguments:
+                return len(group)
+            return sum(1 for scope in group if self.evaluate(arguments[0], scope) is not UNDEFINED)
+        values = [self.evaluate(arguments[0], scope) for scope in group]
+        values = [value for value in values if value is not UNDEFINED]
+        if name in ("SUM", "AVG"):
+            if not all(_is_number(value) for value in values):
+                return UNDEFINED
+            if name == "SUM":
+                return sum(values)
+            return sum(values) / len(values) if values else UNDEFINED
+        ## MIN and MAX work on simple values of any type, using the cosmos db type order
+        values = [value for value in values if _type_rank(value) <= 3]
+        if not values:
+            return UNDEFINED
+        return min(values, key=sort_key) if name == "MIN" else max(values, key=sort_key)
+
+    def scopes(self, query, documents, scope=None):
+        """this generator gives every combination of FROM and JOIN bindings that passes the WHERE"""
+        scope = scope or {}
+        if query["from_in"] is not None:
+            source = self.evaluate(query["from_in"], scope)
+            roots = source if isinstance(source, list) else []
+        elif query["from_alias"] is None:
+            roots = [UNDEFINED]
+        else:
+            roots = documents
+        for root in roots:
+            bindings = dict(scope)
+            if query["from_alias"] is not None:
+                bindings[query["from_alias"]] = root
+            yield from self._joins(query, query["joins"], bindings)
+
+    def _joins(self, query, joins, bindings):
+        if not joins:
+            if query["where"] is None or self.evaluate(query["where"], bindings) is True:
+                yield bindings
+            return
+        alias, source = joins[0]
+        values = self.evaluate(source, bindings)
+        if not isinstance(values, list):
+            return
+        for value in values:
+            yield from self._joins(query, joins[1:], {**bindings, alias: value})
+
+    def project(self, query, scope, group=None):
+        if query["select"] == "*":
+            if query["from_alias"] is None:
+                raise SqlError("SELECT * needs a FROM")
+            return scope[query["from_alias"]]
+        if query["value"]:
+            return self.evaluate(query["select"], scope, group)
+        result = {}
+        for position, (expression, alias) in enumerate(query["select"], start=1):
+            value = self.evaluate(expression, scope, group)
+            if value is UNDEFINED:
+                continue
+            if alias is None:
+                if expression[0] == "property" and expression[2][0] == "lit":
+                    alias = expression[2][1]
+                elif expression[0] == "alias":
+                    alias = expression[1]
+                else:
+                    alias = f"${position}"
+            result[alias] = value
+        return result
+
+    def run(self, query, documents=(), scope=None):
+        """this generator runs a parsed query over the documents and yields the results"""
+        select_items = [query["select"]] if query["value"] else ([] if query["select"] == "*" else [item[0] for item in query["select"]])
+        aggregated = bool(query["group_by"]) or any(contains_aggregate(item) for item in select_items)
+        scopes = self.scopes(query, documents, scope)
+
+        if aggregated:
+            groups = {}
+            for item_scope in scopes:
+                key = tuple(repr(sort_key(self.evaluate(expression, item_scope))) for expression in query["group_by"])
+                groups.setdefault(key, []).append(item_scope)
+            if not groups and not query["group_by"]:
+                ## an aggregate over nothing still gives one result, like SELECT VALUE COUNT(1) gives 0
+                groups[()] = []
+            results = []
+            for group in groups.values():
+                first = group[0] if group else dict(scope or {})
+                results.append(self.project(query, first, group))
+        else:
+            if query["order_by"]:
+                scopes = list(scopes)
+                for expression, ascending in reversed(query["order_by"]):
+                    scopes.sort(key=lambda item_scope: sort_key(self.evaluate(expression, item_scope)), reverse=not ascending)
+            results = (self.project(query, item_scope) for item_scope in scopes)
+
+        offset = self.evaluate(query["offset"], {}) if query["offset"] is not None else 0
+        limit = self.evaluate(query["limit"], {}) if query["limit"] is not None else None
+        top = self.evaluate(query["top"], {}) if query["top"] is not None else None
+        seen = []
+        produced = 0
+        skipped = 0
+        for result in results:
+            if result is UNDEFINED:
+                continue
+            if query["distinct"]:
+                if any(_equal(result, earlier) is True for earlier in seen):
+                    continue
+                seen.append(result)
+            if skipped < offset:
+                skipped += 1
+                continue
+            if (limit is not None and produced >= limit) or (top is not None and produced >= top):
+                return
+            produced += 1
+            yield result
+
+
+def execute(query_text, documents, parameters=None):
+    """this function parses and runs a query text over a list of documents and gives back the results as a list"""
+    return list(Evaluator(parameters).run(parse(query_text), documents))
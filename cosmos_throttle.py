@@ -0,0 +1,130 @@
+## rate controller for cosmos db requests
+## cosmos db answers with a 429 (too many requests) when we use more RU/s than the container has provisioned
+## this controller is shared by the loader and the query helpers so they stay under one RU/s budget together
+## it works like tcp congestion control (AIMD): every success adds a little concurrency, every 429 halves it
+
+import random
+import threading
+import time
+
+from cosmos_utils import get_request_charge
+
+
+class RateController:
+    """
+    this class limits how many requests run at the same time and how many RU/s they use
+    ru_per_second is the budget, we keep a bucket of RU that fills up at that speed and every request takes its charge out of it
+    """
+
+    def __init__(self, ru_per_second, max_concurrency=16, min_concurrency=1, max_retries=9, base_delay=0.1, max_delay=30.0):
+        self.ru_per_second = float(ru_per_second)
+        self.max_concurrency = max_concurrency
+        self.min_concurrency = min_concurrency
+        self.max_retries = max_retries
+        self.base_delay = base_delay
+        self.max_delay = max_delay
+        ## we start halfway and let the successes push us up
+        self.concurrency = max(min_concurrency, max_concurrency / 2)
+        self.throttled = 0
+        self._active = 0
+        self._tokens = self.ru_per_second
+        self._refilled = time.monotonic()
+        self._condition = threading.Condition()
+
+    def call(self, container_client, function, *args, **kwargs):
+        """
+        this function runs function(*args, **kwargs) within the budget and retries it when cosmos throttles us
+        the request charge is read from the response headers of container_client
+        """
+        attempt = 0
+        while True:
+            self._acquire()
+            try:
+                result = function(*args, **kwargs)
+            except Exception as e:
+                self._release(get_error_charge(e))
+                if not is_throttled(e) or attempt >= self.max_retries:
+                    raise
+                self._on_throttle()
+                time.sleep(self.backoff(attempt, get_retry_after(e)))
+                attempt += 1
+                continue
+            self._release(get_request_charge(container_client, result))
+            self._on_success()
+            return result
+
+    def backoff(self, attempt, retry_after=0.0):
+        """this function gives the time to wait before the next try: full jitter exponential backoff, but never shorter than what cosmos asked"""
+        ceiling = min(self.max_delay, self.base_delay * (2 ** attempt))
+        return max(retry_after, random.uniform(0, ceiling))
+
+    def _acquire(self):
+        with self._condition:
+            while True:
+                self._refill()
+                if self._active < int(self.concurrency) and self._tokens > 0:
+                    self._active += 1
+                    return
+                ## when we are over budget we sleep until the bucket is positive again, otherwise until a slot is free
+                timeout = -self._tokens / self.ru_per_second if self._tokens <= 0 else None
+                self._condition.wait(timeout)
+
+    def _release(self, request_charge):
+        with self._condition:
+            self._active -= 1
+            self._tokens -= request_charge
+            self._condition.notify_all()
+
+    def _refill(self):
+        now = time.monotonic()
+        ## the bucket holds at most one second of budget, so an idle period does not give a huge burst afterwards
+        self._tokens = min(self.ru_per_second, self._tokens + (now - self._refilled) * self.ru_per_second)
+        self._refilled = now
+
+    def _on_success(self):
+        with self._condition:
+            ## additive increase: about +1 concurrency after a full round of successful requests
+            self.concurrency = min(self.max_concurrency, self.concurrency + 1 / self.concurrency)
+            self._condition.notify_all()
+
+    def _on_throttle(self):
+        with self._condition:
+            ## multiplicative decrease, and we empty the bucket so nobody starts a new request right away
+            self.throttled += 1
+            self.concurrency = max(self.min_concurrency, self.concurrency / 2)
+            self._tokens = min(self._tokens, 0.0)
+
+
+def call(controller, container_client, function, *args, **kwargs):
+    """this helper runs the function through the controller, or just runs it when there is no controller"""
+    if controller is None:
+        return function(*args, **kwargs)
+    return controller.call(container_client, function, *args, **kwargs)
+
+
+def is_throttled(error):
+    """this function checks if an exception is a 429 from cosmos db"""
+    return getattr(error, "status_code", None) == 429
+
+
+def _error_headers(error):
+    headers = getattr(error, "headers", None)
+    if not headers and getattr(error, "response", None) is not None:
+        headers = getattr(error.response, "headers", None)
+    return headers or {}
+
+
+def get_retry_after(error):
+    """this function reads the x-ms-retry-after-ms header of a throttled request, in seconds"""
+    try:
+        return float(_error_headers(error).get("x-ms-retry-after-ms", 0) or 0) / 1000
+    except (TypeError, ValueError):
+        return 0.0
+
+
+def get_error_charge(error):
+    """a failed request can also cost RU, we read it from the error headers"""
+    try:
+        return float(_error_headers(error).get("x-ms-request-charge", 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
@@ -0,0 +1,57 @@
+## small helpers that we share between the scripts
+## they dont open any connection themselves so you can import them without a .env file
+
+## these properties are added by cosmos db itself, they are not part of our content
+SYSTEM_PROPERTIES = ("_rid", "_self", "_etag", "_attachments", "_ts", "_lsn")
+
+
+def get_response_headers(container_client, result=None):
+    """
+    this function gets the response headers of the last cosmos db call
+    newer versions of azure-cosmos return a CosmosDict/CosmosList that carries its own headers,
+    which is safe when we use threads. if thats not there we fall back to the last_response_headers of the client
+    """
+    if result is not None and hasattr(result, "get_response_headers"):
+        return result.get_response_headers() or {}
+    connection = getattr(container_client, "client_connection", None)
+    return getattr(connection, "last_response_headers", None) or {}
+
+
+def get_request_charge(container_client, result=None):
+    """this function gets the request charge (RU) of the last call as a float, 0.0 if we dont know it"""
+    return _header_charge(get_response_headers(container_client, result))
+
+
+def _header_charge(headers):
+    try:
+        return float((headers or {}).get("x-ms-request-charge", 0) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+
+class RequestChargeHook:
+    """
+    this class is a response_hook for one request or one query, cosmos db calls it with the headers of every response (every page)
+    the last_response_headers of the client belong to whatever request finished last, with threads or asyncio that can be another
+    one, the hook only sees the responses of the call it was passed to
+    chained is a response_hook of the caller that is still called
+    """
+
+    def __init__(self, chained=None):
+        self.headers = {}
+        self.request_charge = 0.0
+        self.last_request_charge = 0.0
+        self.responses = 0
+        self._chained = chained
+
+    def __call__(self, headers, result=None, *args):
+        ## the sync client also calls the hook once when the query is created, with the pager instead of a page and the
+        ## headers of an earlier request, that call is skipped
+        if hasattr(result, "by_page"):
+            return
+        self.headers = headers or {}
+        self.last_request_charge = _header_charge(headers)
+        self.request_charge += self.last_request_charge
+        self.responses += 1
+        if self._chained is not None:
+            self._chained(headers, result, *args)
@@ -0,0 +1,399 @@
+## record a workload and play it again
+## RecordingContainer wraps the container client like InstrumentedContainer, but writes every data plane call to a json lines
+## file: when it started, the operation with its arguments (document, query text, parameters, partition key), the time and RU
+## a query is written when it is issued, its pages follow as "page" lines with their time, RU and number of items, so a
+## query that is stopped after the first page (TOP, or a loop with a break) is in the workload too
+## every run of a script is a session, the times count from the start of that session, so the runs of writeCosmos.py and
+## readcosmos.py that append to the same file are never mixed into one schedule
+## replay() sends the recorded calls again, at the recorded pace (speed 1), faster (speed 10 = ten times faster) or as fast as
+## it can (speed 0), against the real container or the in-memory one, and reports throughput and latency percentiles
+## with that we can ask "what RU/s does this traffic need" and "did this change make the same traffic slower"
+## run it:  WORKLOAD_PATH=workload.jsonl REPLAY_SESSION=last REPLAY_SPEED=5 REPLAY_CONCURRENCY=16 REPLAY_TARGET=memory python cosmos_workload.py
+
+import itertools
+import json
+import os
+import threading
+import time
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from cosmos_loader import get_partition_key_value
+from cosmos_metrics import InstrumentedContainer, MetricsRecorder
+from cosmos_utils import RequestChargeHook, get_request_charge
+
+## the query options we keep, continuation tokens and etags would not mean anything when we replay
+QUERY_OPTIONS = ("partition_key", "enable_cross_partition_query", "max_item_count", "feed_range")
+
+
+class WorkloadRecorder:
+    """
+    this class appends the recorded calls to the json lines file, it is thread safe and flushes every line
+    every line has the session (one per recorder, so one per run) and the number of the call in that session
+    """
+
+    def __init__(self, path, session=None):
+        self.path = path
+        self.session = session or f"{time.strftime('%Y%m%dT%H%M%S')}-{uuid.uuid4().hex[:8]}"
+        self.started = time.perf_counter()
+        self.started_at = time.time()
+        self._calls = itertools.count(1)
+        self._lock = threading.Lock()
+        self._file = open(path, "a", encoding="utf-8")
+
+    def _write(self, entry):
+        line = json.dumps(entry, ensure_ascii=False, default=str)
+        with self._lock:
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def _entry(self, call, started, **fields):
+        offset = started - self.started
+        return {"session": self.session, "call": call, "t": round(offset, 6), "at": round(self.started_at + offset, 6), **fields}
+
+    def record(self, operation, request, partition_key, started, seconds=None, request_charge=None, error=None):
+        """this function writes one call and gives back its number, a query is written without time and RU (see record_page)"""
+        with self._lock:
+            call = next(self._calls)
+        self._write(self._entry(
+            call, started, operation=operation, request=request, partition_key=partition_key,
+            seconds=round(seconds, 6) if seconds is not None else None,
+            request_charge=round(request_charge, 2) if request_charge is not None else None,
+            error=str(error) if error is not None else None,
+        ))
+        return call
+
+    def record_page(self, call, started, seconds, request_charge=0.0, items=0, error=None):
+        """this function writes one page of the query with number call"""
+        self._write(self._entry(
+            call, started, operation="page", seconds=round(seconds, 6), request_charge=round(request_charge, 2), items=items,
+            error=str(error) if error is not None else None,
+        ))
+
+    def close(self):
+        with self._lock:
+            self._file.close()
+
+
+class RecordingContainer:
+    """
+    this class wraps a container client and records every data plane call in a WorkloadRecorder
+    a query is recorded when it is issued, and every page it reads after that
+    """
+
+    def __init__(self, container_client, recorder, partition_key_path="/Category"):
+        self._container_client = container_client
+        self._recorder = recorder
+        self._partition_key_path = partition_key_path
+
+    def __getattr__(self, name):
+        return getattr(self._container_client, name)
+
+    def _call(self, operation, request, partition_key, function, *args, **kwargs):
+        started = time.perf_counter()
+        try:
+            result = function(*args, **kwargs)
+        except Exception as e:
+            self._recorder.record(operation, request, partition_key, started, time.perf_counter() - started, 0.0, error=e)
+            raise
+        self._recorder.record(operation, request, partition_key, started, time.perf_counter() - started,
+                              get_request_charge(self._container_client, result))
+        return result
+
+    def _body_partition_key(self, body):
+        return get_partition_key_value(body, self._partition_key_path) if isinstance(body, dict) else None
+
+    def upsert_item(self, body, *args, **kwargs):
+        return self._call("upsert_item", {"body": body}, self._body_partition_key(body), self._container_client.upsert_item, body, *args, **kwargs)
+
+    def create_item(self, body, *args, **kwargs):
+        return self._call("create_item", {"body": body}, self._body_partition_key(body), self._container_client.create_item, body, *args, **kwargs)
+
+    def replace_item(self, item, body, *args, **kwargs):
+        request = {"item": item if isinstance(item, str) else item["id"], "body": body}
+        return self._call("replace_item", request, self._body_partition_key(body), self._container_client.replace_item, item, body, *args, **kwargs)
+
+    def read_item(self, item, partition_key, *args, **kwargs):
+        request = {"item": item if isinstance(item, str) else item["id"]}
+        return self._call("read_item", request, partition_key, self._container_client.read_item, item, partition_key, *args, **kwargs)
+
+    def delete_item(self, item, partition_key, *args, **kwargs):
+        request = {"item": item if isinstance(item, str) else item["id"]}
+        return self._call("delete_item", request, partition_key, self._container_client.delete_item, item, partition_key, *args, **kwargs)
+
+    def patch_item(self, item, partition_key, patch_operations, *args, **kwargs):
+        request = {"item": item if isinstance(item, str) else item["id"], "patch_operations": patch_operations}
+        return self._call("patch_item", request, partition_key, self._container_client.patch_item, item, partition_key, patch_operations, *args, **kwargs)
+
+    def execute_item_batch(self, batch_operations, partition_key, *args, **kwargs):
+        request = {"batch_operations": [list(operation) for operation in batch_operations]}
+        return self._call("execute_item_batch", request, partition_key, self._container_client.execute_item_batch, batch_operations, partition_key, *args, **kwargs)
+
+    def query_items(self, query, parameters=None, *args, **kwargs):
+        request = {"query": query, "parameters": parameters}
+        request.update({name: kwargs[name] for name in QUERY_OPTIONS if name in kwargs})
+        ## the charge of a page comes from our own response_hook, other threads can run queries at the same time
+        hook = kwargs["response_hook"] = RequestChargeHook(kwargs.get("response_hook"))
+        paged = self._container_client.query_items(query, parameters, *args, **kwargs)
+        call = self._recorder.record("query_items", request, kwargs.get("partition_key"), time.perf_counter())
+        return RecordingPaged(paged, self._recorder, call, hook)
+
+    def read_all_items(self, *args, **kwargs):
+        request = {name: kwargs[name] for name in QUERY_OPTIONS if name in kwargs}
+        hook = kwargs["response_hook"] = RequestChargeHook(kwargs.get("response_hook"))
+        paged = self._container_client.read_all_items(*args, **kwargs)
+        call = self._recorder.record("read_all_items", request, None, time.perf_counter())
+        return RecordingPaged(paged, self._recorder, call, hook)
+
+
+class RecordingPaged:
+    """this class wraps a paged result and records every page that is read as a page line of its query"""
+
+    def __init__(self, paged, recorder, call, hook):
+        self._paged = paged
+        self._recorder = recorder
+        self._call = call
+        self._hook = hook
+
+    def __iter__(self):
+        for page in self.by_page():
+            yield from page
+
+    def by_page(self, continuation_token=None):
+        return RecordingPages(self._paged.by_page(continuation_token), self)
+
+    def __getattr__(self, name):
+        return getattr(self._paged, name)
+
+
+class RecordingPages:
+    """the page iterator of a RecordingPaged, the continuation_token is passed through"""
+
+    def __init__(self, pages, paged):
+        self._pages = pages
+        self._paged = paged
+
+    def __iter__(self):
+        return self
+
+    def __next__(self):
+        paged = self._paged
+        responses = paged._hook.responses
+        started = time.perf_counter()
+        try:
+            page = list(next(self._pages))
+        except StopIteration:
+            raise
+        except Exception as e:
+            paged._recorder.record_page(paged._call, started, time.perf_counter() - started, error=e)
+            raise
+        request_charge = paged._hook.last_request_charge if paged._hook.responses != responses else 0.0
+        paged._recorder.record_page(paged._call, started, time.perf_counter() - started, request_charge, len(page))
+        return iter(page)
+
+    @property
+    def continuation_token(self):
+        return self._pages.continuation_token
+
+
+def load_workload(path, session=None):
+    """
+    this function reads the recorded calls of one session (or of all sessions), in the order they started
+    the page lines are added to their query: pages, items, seconds and request_charge
+    """
+    calls = {}
+    pages = []
+    with open(path, "r", encoding="utf-8") as file:
+        for line in file:
+            try:
+                entry = json.loads(line)
+            except json.JSONDecodeError:
+                ## the last line can be half written when the recording script was stopped
+                continue
+            if session is not None and entry.get("session") != session:
+                continue
+            if entry["operation"] == "page":
+                pages.append(entry)
+            else:
+                calls[(entry.get("session"), entry.get("call"))] = entry
+    for page in pages:
+        query = calls.get((page.get("session"), page.get("call")))
+        if query is None:
+            continue
+        if query.get("pages") is None:
+            query.update(pages=0, items=0, seconds=0.0, request_charge=0.0)
+        query["seconds"] += page["seconds"]
+        query["request_charge"] += page["request_charge"]
+        if page["error"] is not None:
+            query["error"] = page["error"]
+        else:
+            query["pages"] += 1
+            query["items"] += page["items"]
+    for entry in calls.values():
+        if entry["operation"] in ("query_items", "read_all_items") and entry.get("pages") is None:
+            ## a query that never read a page did not send a request
+            entry.update(pages=0, items=0, seconds=0.0, request_charge=0.0)
+    return sorted(calls.values(), key=lambda entry: (entry.get("at", 0.0), entry["t"]))
+
+
+def list_sessions(entries):
+    """this function gives the sessions of the entries, in the order they started"""
+    return list(dict.fromkeys(entry.get("session") for entry in entries))
+
+
+def _schedule(entries):
+    """
+    this function gives (start, entry) pairs for replay: within a session the recorded offsets, and the sessions one after
+    the other (the next one starts when the previous one ended), so the gap between two runs is not replayed
+    """
+    schedule = []
+    offset = 0.0
+    for session in list_sessions(entries):
+        session_entries = [entry for entry in entries if entry.get("session") == session]
+        for entry in session_entries:
+            schedule.append((offset + entry["t"], entry))
+        offset += max(entry["t"] + (entry.get("seconds") or 0.0) for entry in session_entries)
+    schedule.sort(key=lambda pair: pair[0])
+    return schedule
+
+
+def _read_pages(paged, pages):
+    """this function reads as many pages as the recorded query read (all of them when we dont know)"""
+    for number, _ in enumerate(paged.by_page(), start=1):
+        if pages is not None and number >= pages:
+            break
+
+
+def _issue(container_client, entry):
+    """this function sends one recorded call again, a query reads the same number of pages as when it was recorded"""
+    operation = entry["operation"]
+    request = entry["request"]
+    partition_key = entry["partition_key"]
+    if operation in ("upsert_item", "create_item"):
+        getattr(container_client, operation)(request["body"])
+    elif operation == "replace_item":
+        container_client.replace_item(request["item"], request["body"])
+    elif operation in ("read_item", "delete_item"):
+        getattr(container_client, operation)(request["item"], partition_key)
+    elif operation == "patch_item":
+        container_client.patch_item(request["item"], partition_key, request["patch_operations"])
+    elif operation == "execute_item_batch":
+        container_client.execute_item_batch([tuple(operation) for operation in request["batch_operations"]], partition_key)
+    elif operation == "query_items":
+        options = {name: request[name] for name in QUERY_OPTIONS if name in request}
+        _read_pages(container_client.query_items(request["query"], request.get("parameters"), **options), entry.get("pages"))
+    elif operation == "read_all_items":
+        _read_pages(container_client.read_all_items(**request), entry.get("pages"))
+    else:
+        raise ValueError(f"cant replay operation {operation}")
+
+
+class ReplayReport:
+    """this class keeps the totals of a replay, the per operation latency and RU are in the MetricsRecorder"""
+
+    def __init__(self, metrics):
+        self.metrics = metrics
+        self.issued = 0
+        self.errors = 0
+        self.max_lag = 0.0
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add(self, lag, error):
+        with self._lock:
+            self.issued += 1
+            self.errors += 1 if error is not None else 0
+            self.max_lag = max(self.max_lag, lag)
+
+    @property
+    def elapsed(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    @property
+    def request_charge(self):
+        return sum(stats.request_charge for stats in self.metrics.stats.values())
+
+    def print_summary(self):
+        self.metrics.print_summary()
+        print(f"operations replayed : {self.issued} ({self.errors} errors)")
+        print(f"elapsed             : {self.elapsed:.2f} s")
+        print(f"throughput          : {self.issued / self.elapsed if self.elapsed > 0 else 0.0:.1f} ops/sec")
+        print(f"request charge      : {self.request_charge:.2f} RU ({self.request_charge / self.elapsed if self.elapsed > 0 else 0.0:.1f} RU/s)")
+        ## when the lag grows the client (or the concurrency) could not keep up with the recorded pace
+        print(f"max schedule lag    : {self.max_lag * 1000:.1f} ms")
+
+
+def replay(container_client, entries, speed=1.0, concurrency=8, partition_key_path="/Category"):
+    """
+    this function sends the recorded calls again, every call at its recorded start time divided by speed (0 = no waiting)
+    the sessions in entries are replayed one after the other (see _schedule), a query that read no page is skipped
+    at most `concurrency` calls are in flight, the latency and RU per operation are measured with an InstrumentedContainer
+    """
+    metrics = MetricsRecorder()
+    report = ReplayReport(metrics)
+    target = InstrumentedContainer(container_client, metrics, partition_key_path)
+    slots = threading.Semaphore(concurrency)
+
+    def run(entry, lag):
+        try:
+            _issue(target, entry)
+            report.add(lag, None)
+        except Exception as e:
+            report.add(lag, e)
+        finally:
+            slots.release()
+
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        for start, entry in _schedule(entries):
+            if entry.get("pages") == 0:
+                continue
+            if speed:
+                delay = report.started + start / speed - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+            slots.acquire()
+            lag = max(0.0, time.perf_counter() - report.started - start / speed) if speed else 0.0
+            executor.submit(run, entry, lag)
+    report.finished = time.perf_counter()
+    return report
+
+
+def main():
+    from dotenv import load_dotenv
+
+    load_dotenv()
+    ## REPLAY_SESSION: empty for every session (one after the other), "last" for the last run, or a session id
+    session = os.environ.get('REPLAY_SESSION', '')
+    entries = load_workload(os.environ.get('WORKLOAD_PATH', 'workload.jsonl'))
+    sessions = list_sessions(entries)
+    if session == 'last':
+        session = sessions[-1] if sessions else ''
+    if session:
+        entries = [entry for entry in entries if entry.get("session") == session]
+        sessions = [session]
+    partition_key_path = os.environ.get('PARTITION_KEY_PATH', '/Category')
+    if os.environ.get('REPLAY_TARGET', 'memory') == 'memory':
+        from cosmos_emulator import InMemoryContainer
+        container_client = InMemoryContainer(partition_key_path=partition_key_path, latency=float(os.environ.get('REPLAY_LATENCY_MS', '2')) / 1000)
+        ## reads and queries need data, we start from the change feed snapshot when there is one
+        snapshot_path = os.environ.get('SNAPSHOT_PATH', '.snapshot.sqlite')
+        if os.path.exists(snapshot_path):
+            from change_feed_sync import ChangeFeedSnapshot
+            snapshot = ChangeFeedSnapshot(snapshot_path, partition_key_path)
+            container_client.load(snapshot.items())
+            snapshot.close()
+    else:
+        from azure.cosmos import CosmosClient
+        from azure.identity import DefaultAzureCredential
+        client = CosmosClient(os.environ['COSMOS_ENDPOINT'], DefaultAzureCredential())
+        container_client = client.get_database_client(os.environ['DATABASE_NAME']).get_container_client(os.environ['CONTAINER_NAME'])
+
+    print(f"replaying {len(entries)} operations of {len(sessions)} session(s): {', '.join(str(session) for session in sessions)}")
+    report = replay(container_client, entries, speed=float(os.environ.get('REPLAY_SPEED', '1')),
+                    concurrency=int(os.environ.get('REPLAY_CONCURRENCY', '8')), partition_key_path=partition_key_path)
+    report.print_summary()
+
+
+if __name__ == "__main__":
+    main()
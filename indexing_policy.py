@@ -0,0 +1,200 @@
+## indexing policy from the queries we really run
+## by default cosmos db indexes every property of every document, and every index entry costs write RU on every upsert
+## our hotels carry long texts (Description, Description_fr, room descriptions) that no query ever filters on
+## here we read the queries (WHERE, ORDER BY, GROUP BY and the aggregates), collect the paths they use and make a policy that
+## only indexes those, show the difference with the current policy, measure the write RU of both on the in-memory container
+## and (APPLY_POLICY=1) put it on the real container
+## careful: a query on a path that is not indexed anymore becomes a full scan, so add new queries here before you run them
+
+import json
+import os
+from pathlib import Path
+
+from cosmos_emulator import DEFAULT_INDEXING_POLICY, InMemoryContainer
+from cosmos_sql import contains_aggregate, parse
+from report_queries import all_query_texts
+
+## the queries of readcosmos.py (the report queries, the projections and the queries behind the aggregates), from the same
+## list readcosmos.py, cosmos_async_query.py and the benchmark run, so the policy follows when a query is added there
+QUERIES = all_query_texts()
+
+
+def _path_of(expression, aliases):
+    """this function gives the document path of c.Address.City or r.BaseRate (via the alias of r), None for anything else"""
+    if expression[0] == "alias":
+        return aliases.get(expression[1])
+    if expression[0] == "property":
+        base = _path_of(expression[1], aliases)
+        name = expression[2]
+        if base is None or name[0] != "lit":
+            return None
+        return base + (name[1] if isinstance(name[1], str) else "[]",)
+    return None
+
+
+def _collect(expression, aliases, paths):
+    if isinstance(expression, dict):
+        _collect_query(expression, aliases, paths)
+        return
+    if isinstance(expression, list):
+        for item in expression:
+            _collect(item, aliases, paths)
+        return
+    if not isinstance(expression, tuple) or not expression:
+        return
+    path = _path_of(expression, aliases) if expression[0] in ("alias", "property") else None
+    if path is not None:
+        paths.add(path)
+        return
+    for part in expression[1:]:
+        _collect(part, aliases, paths)
+
+
+def _collect_query(parsed, aliases, paths):
+    """this function adds the paths a query filters, sorts, groups or aggregates on, subqueries (EXISTS) included"""
+    aliases = dict(aliases)
+    if parsed["from_in"] is not None:
+        source = _path_of(parsed["from_in"], aliases)
+        aliases[parsed["from_alias"]] = source + ("[]",) if source is not None else None
+    else:
+        aliases[parsed["from_alias"]] = ()
+    for alias, source in parsed["joins"]:
+        source_path = _path_of(source, aliases)
+        aliases[alias] = source_path + ("[]",) if source_path is not None else None
+    aliases = {alias: path for alias, path in aliases.items() if path is not None}
+
+    _collect(parsed["where"], aliases, paths)
+    _collect([expression for expression, _ in parsed["order_by"]], aliases, paths)
+    _collect(parsed["group_by"], aliases, paths)
+    select = parsed["select"]
+    if select != "*":
+        for expression in [select] if parsed["value"] else [item for item, _ in select]:
+            if contains_aggregate(expression):
+                _collect(expression, aliases, paths)
+
+
+def query_paths(queries):
+    """this function gives the sorted index paths (like /Rooms/[]/BaseRate/?) the queries need"""
+    paths = set()
+    for query in queries:
+        _collect_query(parse(query), {}, paths)
+    return sorted(format_path(path) for path in paths if path)
+
+
+def format_path(parts):
+    ## names that are no plain identifiers are quoted in an indexing policy
+    quoted = [part if part == "[]" or part.isidentifier() else f'"{part}"' for part in parts]
+    return "/" + "/".join(quoted) + "/?"
+
+
+def derive_policy(queries, partition_key_path="/Category"):
+    """this function gives an indexing policy that only indexes the paths of the queries (and the partition key)"""
+    paths = set(query_paths(queries))
+    paths.add(partition_key_path.rstrip("/") + "/?")
+    return {
+        "indexingMode": "consistent",
+        "automatic": True,
+        "includedPaths": [{"path": path} for path in sorted(paths)],
+        "excludedPaths": [{"path": "/*"}, {"path": "/\"_etag\"/?"}],
+    }
+
+
+def diff_policy(current, desired):
+    """this function gives the differences as lines: + for what the desired policy adds, - for what it removes"""
+    lines = []
+    for key in ("indexingMode", "automatic"):
+        if current.get(key) != desired.get(key):
+            lines.append(f"~ {key}: {current.get(key)} -> {desired.get(key)}")
+    for key in ("includedPaths", "excludedPaths"):
+        before = {entry["path"] for entry in current.get(key, [])}
+        after = {entry["path"] for entry in desired.get(key, [])}
+        lines.extend(f"- {key} {path}" for path in sorted(before - after))
+        lines.extend(f"+ {key} {path}" for path in sorted(after - before))
+    return lines
+
+
+def measure_write_charge(documents, policy, partition_key_path="/Category"):
+    """this function upserts the documents in an in-memory container with the policy and gives back the RU per document"""
+    container = InMemoryContainer(partition_key_path=partition_key_path)
+    container.indexing_policy = policy
+    for position, document in enumerate(documents):
+        ## the files in items/ have no id yet, the charge does not depend on it
+        container.upsert_item(dict(document, id=document.get("id") or f"measure-{position}"))
+    return container.total_request_charge / max(1, container.request_count)
+
+
+def replace_indexing_policy(database_client, container_client, policy):
+    """
+    this function puts the policy on the container and keeps the other settings as they are (partition key, default ttl,
+    conflict resolution, computed properties, ...)
+    replace_container resets every setting it does not get, so we read the current ones and pass them along
+    it gives back the new container client, the old one can still have the previous properties cached
+    """
+    ## we only need azure when we change the real container
+    from azure.cosmos import PartitionKey
+
+    properties = container_client.read()
+    partition_key = properties["partitionKey"]
+    paths = partition_key["paths"]
+    ## a hierarchical partition key (kind MultiHash) has more than one path
+    settings = {
+        "partition_key": PartitionKey(path=paths if len(paths) > 1 else paths[0], kind=partition_key.get("kind", "Hash"),
+                                      version=partition_key.get("version", 2)),
+        "indexing_policy": policy,
+    }
+    keep = {
+        "defaultTtl": "default_ttl",
+        "conflictResolutionPolicy": "conflict_resolution_policy",
+        "analyticalStorageTtl": "analytical_storage_ttl",
+        "computedProperties": "computed_properties",
+        "fullTextPolicy": "full_text_policy",
+    }
+    for name, argument in keep.items():
+        if properties.get(name) is not None:
+            settings[argument] = properties[name]
+    return database_client.replace_container(container_client, **settings)
+
+
+def main():
+    ## we only need azure and the .env when we read or change the real container
+    from dotenv import load_dotenv
+    from json_stream import iter_directory_documents
+
+    load_dotenv()
+    partition_key_path = os.environ.get('PARTITION_KEY_PATH', '/Category')
+    desired = derive_policy(QUERIES, partition_key_path)
+    print("=== derived indexing policy ===")
+    print(json.dumps(desired, indent=2))
+
+    container_client = None
+    current = DEFAULT_INDEXING_POLICY
+    if os.environ.get('COSMOS_ENDPOINT'):
+        from azure.cosmos import CosmosClient
+        from azure.identity import DefaultAzureCredential
+        client = CosmosClient(os.environ['COSMOS_ENDPOINT'], DefaultAzureCredential())
+        database_client = client.get_database_client(os.environ['DATABASE_NAME'])
+        container_client = database_client.get_container_client(os.environ['CONTAINER_NAME'])
+        current = container_client.read()["indexingPolicy"]
+
+    print("=== difference with the current policy ===")
+    for line in diff_policy(current, desired) or ["(no difference)"]:
+        print(line)
+
+    documents = list(iter_directory_documents(Path(os.environ.get('ITEMS_DIR', 'items'))))
+    before = measure_write_charge(documents, current, partition_key_path)
+    after = measure_write_charge(documents, desired, partition_key_path)
+    print("=== write RU per document (in-memory container) ===")
+    print(f"current policy : {before:.2f} RU")
+    print(f"derived policy : {after:.2f} RU ({(1 - after / before) * 100 if before else 0:.0f}% less)")
+
+    if os.environ.get('APPLY_POLICY', '') == '1':
+        if container_client is None:
+            print("set COSMOS_ENDPOINT, DATABASE_NAME and CONTAINER_NAME to apply the policy")
+            return
+        ## changing the policy starts an index transformation in the background, queries keep working meanwhile
+        replace_indexing_policy(database_client, container_client, desired)
+        print("policy applied")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,93 @@
+## local manifest of what we already loaded into cosmos db
+## for every document we keep the id, the partition key and a hash of the content
+## a new run only sends the documents that are new or changed, which saves the write RU of everything else
+## every write is appended to the file right away, so after a crash the next run continues where we stopped
+
+import hashlib
+import json
+import os
+import threading
+
+from cosmos_loader import get_partition_key_value
+from cosmos_utils import SYSTEM_PROPERTIES
+
+
+def content_hash(document):
+    """this function hashes the normalised document: sorted keys, no whitespace and without the cosmos system properties"""
+    content = {key: value for key, value in document.items() if key not in SYSTEM_PROPERTIES}
+    normalised = json.dumps(content, sort_keys=True, separators=(",", ":"), ensure_ascii=False)
+    return hashlib.sha256(normalised.encode("utf-8")).hexdigest()
+
+
+class IngestManifest:
+    """
+    this class keeps the manifest in memory and appends every committed document to a json lines file
+    the last line for an (id, partition key) wins, use compact() to rewrite the file with one line per document
+    """
+
+    def __init__(self, path, partition_key_path="/Category"):
+        self.path = path
+        self.partition_key_path = partition_key_path
+        self.entries = {}
+        self.skipped = 0
+        self._lock = threading.Lock()
+        self._load()
+        self._file = open(self.path, "a", encoding="utf-8")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r", encoding="utf-8") as file:
+            for line in file:
+                try:
+                    entry = json.loads(line)
+                except json.JSONDecodeError:
+                    ## the last line can be half written when we crashed, we just write that document again
+                    continue
+                self.entries[self._key(entry["id"], entry["pk"])] = entry["hash"]
+
+    def _key(self, document_id, partition_key):
+        return (document_id, json.dumps(partition_key))
+
+    def _document_key(self, document):
+        document_id = document.get("id")
+        if document_id is None:
+            return None
+        return self._key(document_id, get_partition_key_value(document, self.partition_key_path))
+
+    def changed(self, documents):
+        """this generator only yields the documents that are new or changed since they were last committed"""
+        for document in documents:
+            key = self._document_key(document)
+            ## without an id we cant track the document, so we always send it
+            if key is not None and self.entries.get(key) == content_hash(document):
+                self.skipped += 1
+                continue
+            yield document
+
+    def commit(self, document):
+        """this function records a document as written, call it only after cosmos db accepted the write"""
+        key = self._document_key(document)
+        if key is None:
+            return
+        digest = content_hash(document)
+        line = json.dumps({"id": key[0], "pk": json.loads(key[1]), "hash": digest}, ensure_ascii=False)
+        with self._lock:
+            self.entries[key] = digest
+            self._file.write(line + "\n")
+            self._file.flush()
+
+    def compact(self):
+        """this function rewrites the manifest with one line per document, so the file does not keep growing"""
+        with self._lock:
+            self._file.close()
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                for (document_id, partition_key), digest in self.entries.items():
+                    file.write(json.dumps({"id": document_id, "pk": json.loads(partition_key), "hash": digest}, ensure_ascii=False) + "\n")
+            os.replace(temp_path, self.path)
+            self._file = open(self.path, "a", encoding="utf-8")
+
+    def close(self):
+        with self._lock:
+            self._file.close()
@@ -0,0 +1,122 @@
+## streaming json reader
+## json.load reads the whole file in memory, that is fine for our 2 hotels but not for an export of a few GB
+## this reader gives back one document at a time and only keeps a small buffer of the file in memory
+## it understands a json array ([{...}, {...}]), json lines (one document per line) and concatenated json ({...}{...})
+
+import json
+import re
+
+_decoder = json.JSONDecoder()
+_whitespace = re.compile(r"\s*")
+_delimiters = set(" \t\r\n,[]{}\"")
+## cosmos db refuses documents over 2 MB, with some room for whitespace a bigger one is broken json (like a missing "}")
+MAX_DOCUMENT_SIZE = 4 * 1024 * 1024
+
+
+def iter_json_documents(path, chunk_size=1024 * 1024, max_document_size=MAX_DOCUMENT_SIZE):
+    """
+    this generator yields every document in the file at path, one by one
+    top level arrays are opened up so each element becomes a document, everything else is yielded as it is
+    memory stays around chunk_size plus the size of the biggest single document
+    a document that still does not parse after max_document_size characters raises a JSONDecodeError, so one broken
+    document does not pull the rest of the file in memory
+    """
+    with open(path, "r", encoding="utf-8-sig") as file:
+        yield from _iter_stream(file, chunk_size, max_document_size)
+
+
+def _iter_stream(file, chunk_size, max_document_size=MAX_DOCUMENT_SIZE):
+    buffer = ""
+    pos = 0
+    eof = False
+    in_array = False
+    ## inside an array: "first" (a value or ]), "value" (after a comma, only a value) or "separator" (after a value, , or ])
+    expect = None
+
+    def fill(minimum):
+        ## we read at least one more chunk, and more if a single document is bigger than what we have
+        nonlocal buffer, pos, eof
+        if pos:
+            buffer = buffer[pos:]
+            pos = 0
+        chunk = file.read(max(chunk_size, minimum))
+        if chunk:
+            buffer += chunk
+        else:
+            eof = True
+
+    while True:
+        ## skip whitespace (this also handles the newlines of json lines), refill when we hit the end of the buffer
+        pos = _whitespace.match(buffer, pos).end()
+        if pos >= len(buffer):
+            if eof:
+                break
+            fill(chunk_size)
+            continue
+
+        char = buffer[pos]
+        if in_array:
+            ## exactly one comma between two elements and none before the ], so a mangled file is reported, not loaded
+            if expect == "separator":
+                if char not in ",]":
+                    raise json.JSONDecodeError("expecting ',' or ']' after an array element", buffer, pos)
+            elif char == ",":
+                raise json.JSONDecodeError("expecting an array element, not ','", buffer, pos)
+            elif char == "]" and expect == "value":
+                raise json.JSONDecodeError("trailing ',' before ']'", buffer, pos)
+            if char == "]":
+                in_array = False
+                pos += 1
+                continue
+            if char == ",":
+                expect = "value"
+                pos += 1
+                continue
+        elif char == "[":
+            in_array = True
+            expect = "first"
+            pos += 1
+            continue
+
+        try:
+            document, end = _decoder.raw_decode(buffer, pos)
+        except json.JSONDecodeError as e:
+            ## the document is probably cut off at the end of the buffer, so we read more and try again
+            if eof:
+                raise
+            if len(buffer) - pos > max_document_size:
+                raise json.JSONDecodeError(f"no valid document within {max_document_size} characters ({e.msg})", e.doc, e.pos) from None
+            fill(min(len(buffer) - pos, max_document_size))
+            continue
+
+        ## a number or literal that is cut off by the end of the buffer can look complete ("-1.5" of "-1.5e10")
+        ## so we only trust it when a delimiter follows, otherwise we read more and try again
+        if not eof and not isinstance(document, (dict, list, str)) and buffer[end:end + 1] not in _delimiters:
+            fill(chunk_size)
+            continue
+
+        pos = end
+        if in_array:
+            expect = "separator"
+        yield document
+
+    if in_array:
+        raise json.JSONDecodeError("unterminated json array", buffer, pos)
+
+
+def iter_directory_documents(items_dir, patterns=("*.json", "*.jsonl"), on_error=None):
+    """
+    this generator yields the documents of every matching file in a directory, file after file
+    with on_error a file with broken json is reported as on_error(path, error) and we go on with the next file
+    (the documents before the broken one are already yielded), without it the error is raised
+    """
+    for pattern in patterns:
+        for json_file in sorted(items_dir.glob(pattern)):
+            if not json_file.is_file():
+                continue
+            try:
+                yield from iter_json_documents(json_file)
+            except json.JSONDecodeError as e:
+                if on_error is None:
+                    raise
+                on_error(json_file, e)
@@ -0,0 +1,141 @@
+## local indexed copy of the hotels, for dashboards that ask the same questions all day
+## the data changes about once a day, so instead of paying RU for every query we build indexes once from a snapshot
+## (the sqlite snapshot of change_feed_sync.py, or the json files in items/) and answer the filters of readcosmos.py locally:
+##   - sorted indexes on numbers (Rating, Rooms BaseRate): a range is two binary searches
+##   - hash indexes on Category and City: an equal filter is one dict lookup
+##   - an inverted index on the lowercase hotel and room Tags: LOWER(tag) = LOWER(@tag) is one dict lookup, no scan
+## paths are written like in an indexing policy: /Rating, /Address/City, /Rooms/[]/BaseRate ([] = every element of the array)
+
+import bisect
+import os
+import time
+from pathlib import Path
+
+DEFAULT_NUMERIC_PATHS = ("/Rating", "/Rooms/[]/BaseRate")
+DEFAULT_HASH_PATHS = ("/Category", "/Address/City")
+DEFAULT_TAG_PATHS = ("/Tags", "/Rooms/[]/Tags")
+
+
+def path_values(document, path):
+    """this generator yields every value at the path, [] goes into every element of an array"""
+    values = [document]
+    for part in path.strip("/").split("/"):
+        next_values = []
+        for value in values:
+            if part == "[]":
+                if isinstance(value, list):
+                    next_values.extend(value)
+            elif isinstance(value, dict) and part in value:
+                next_values.append(value[part])
+        values = next_values
+    yield from values
+
+
+def _is_number(value):
+    return isinstance(value, (int, float)) and not isinstance(value, bool)
+
+
+def _hash_key(value):
+    ## True == 1 in python, but not in cosmos db, so the type is part of the key
+    return (isinstance(value, bool), value)
+
+
+class SortedIndex:
+    """this class keeps (value, position) of one numeric path sorted by value, a range filter is two binary searches"""
+
+    def __init__(self, pairs):
+        pairs = sorted(pairs)
+        self.values = [value for value, _ in pairs]
+        self.positions = [position for _, position in pairs]
+
+    def range(self, low=None, high=None, include_low=True, include_high=True):
+        start = 0
+        if low is not None:
+            start = (bisect.bisect_left if include_low else bisect.bisect_right)(self.values, low)
+        end = len(self.values)
+        if high is not None:
+            end = (bisect.bisect_right if include_high else bisect.bisect_left)(self.values, high)
+        return set(self.positions[start:end])
+
+
+class LocalIndex:
+    """
+    this class holds the documents in a list and indexes on their positions
+    every filter method gives back a set of positions, combine them with & and | and turn them into documents with documents()
+    """
+
+    def __init__(self, documents, numeric_paths=DEFAULT_NUMERIC_PATHS, hash_paths=DEFAULT_HASH_PATHS, tag_paths=DEFAULT_TAG_PATHS):
+        self.items = list(documents)
+        numeric_pairs = {path: [] for path in numeric_paths}
+        self.hashed = {path: {} for path in hash_paths}
+        self.tags = {path: {} for path in tag_paths}
+        for position, document in enumerate(self.items):
+            for path, pairs in numeric_pairs.items():
+                pairs.extend((value, position) for value in path_values(document, path) if _is_number(value))
+            for path, index in self.hashed.items():
+                for value in path_values(document, path):
+                    if not isinstance(value, (dict, list)):
+                        index.setdefault(_hash_key(value), set()).add(position)
+            for path, index in self.tags.items():
+                for tags in path_values(document, path):
+                    for tag in tags if isinstance(tags, list) else []:
+                        if isinstance(tag, str):
+                            index.setdefault(tag.lower(), set()).add(position)
+        self.numeric = {path: SortedIndex(pairs) for path, pairs in numeric_pairs.items()}
+
+    def all(self):
+        return set(range(len(self.items)))
+
+    def range(self, path, low=None, high=None, include_low=True, include_high=True):
+        """the documents with a number at path between low and high, for an array path ([]) one matching element is enough"""
+        return self.numeric[path].range(low, high, include_low, include_high)
+
+    def equal(self, path, value):
+        return set(self.hashed[path].get(_hash_key(value), ()))
+
+    def tagged(self, tag, path=None):
+        """the documents with the tag (case insensitive) at path, or at any of the tag paths when path is None"""
+        paths = [path] if path else list(self.tags)
+        positions = set()
+        for tag_path in paths:
+            positions |= self.tags[tag_path].get(tag.lower(), set())
+        return positions
+
+    def documents(self, positions):
+        """this function gives the documents of the positions, in the order of the snapshot"""
+        return [self.items[position] for position in sorted(positions)]
+
+
+def load_index():
+    """this function builds the index from the change feed snapshot when there is one, else from the json files in items/"""
+    snapshot_path = os.environ.get('SNAPSHOT_PATH', '.snapshot.sqlite')
+    if os.path.exists(snapshot_path):
+        from change_feed_sync import ChangeFeedSnapshot
+        snapshot = ChangeFeedSnapshot(snapshot_path, os.environ.get('PARTITION_KEY_PATH', '/Category'))
+        try:
+            return LocalIndex(snapshot.items())
+        finally:
+            snapshot.close()
+    from json_stream import iter_directory_documents
+    return LocalIndex(iter_directory_documents(Path(os.environ.get('ITEMS_DIR', 'items'))))
+
+
+def main():
+    started = time.perf_counter()
+    index = load_index()
+    print(f"indexed {len(index.items)} documents in {(time.perf_counter() - started) * 1000:.1f} ms")
+
+    ## the same filters as readcosmos.py, with the same parameters
+    filters = {
+        "Category = 'Budget'": lambda: index.equal("/Category", "Budget"),
+        "Rating >= 4.8": lambda: index.range("/Rating", low=4.8),
+        "LOWER(tag) = LOWER('View')": lambda: index.tagged("View", "/Tags"),
+    }
+    for name, run in filters.items():
+        started = time.perf_counter()
+        items = index.documents(run())
+        print(f"{name:<28} {len(items):>6} items in {(time.perf_counter() - started) * 1e6:.0f} µs")
+
+
+if __name__ == "__main__":
+    main()
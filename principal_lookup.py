@@ -0,0 +1,183 @@
+## resolve principal ids (the ugly GUIDs in role assignments) to human readable names with Microsoft Graph
+## we collect the distinct ids first and ask graph for up to 1000 of them in one getByIds request,
+## a few of those requests run at the same time over one graph client and one event loop
+## only when a bulk request fails we look its ids up one by one as user, service principal or group
+## names almost never change, so we keep what we found in a small json file (PrincipalCache) that every script can share
+
+import asyncio
+import json
+import os
+import threading
+import time
+
+from msgraph.graph_service_client import GraphServiceClient
+from msgraph.generated.directory_objects.get_by_ids.get_by_ids_post_request_body import GetByIdsPostRequestBody
+
+## graph accepts at most 1000 ids in one getByIds request
+MAX_IDS_PER_REQUEST = 1000
+
+NOT_FOUND = {"displayName": "Not Found", "email": "Not Found", "type": "Unknown"}
+
+## a found principal we trust for a week, a principal that was not found only for a day (it may have been created since)
+DEFAULT_TTL = 7 * 24 * 3600
+DEFAULT_NOT_FOUND_TTL = 24 * 3600
+
+
+def _describe(directory_object, odata_type=None):
+    """this function turns a graph user, service principal or group into our {displayName, email, type} dict"""
+    odata_type = (odata_type or getattr(directory_object, "odata_type", "") or "").lower()
+    display_name = getattr(directory_object, "display_name", None) or 'Unknown'
+    if odata_type.endswith("user"):
+        return {
+            "displayName": display_name,
+            "email": getattr(directory_object, "mail", None) or getattr(directory_object, "user_principal_name", None) or 'No email',
+            "type": "User",
+        }
+    if odata_type.endswith("serviceprincipal"):
+        return {"displayName": display_name, "email": getattr(directory_object, "app_id", None) or 'No email', "type": "Service Principal"}
+    if odata_type.endswith("group"):
+        return {"displayName": display_name, "email": getattr(directory_object, "mail", None) or 'No email', "type": "Group"}
+    return {"displayName": display_name, "email": 'No email', "type": odata_type.rsplit(".", 1)[-1] or "Unknown"}
+
+
+async def lookup_principal_details_async(principal_id, graph_client):
+    """
+    this function looks up one principal: first as user, then as service principal, then as group
+    we only use it for the ids of a bulk request that failed
+    """
+    lookups = [
+        lambda: graph_client.users.by_user_id(principal_id).get(),
+        lambda: graph_client.service_principals.by_service_principal_id(principal_id).get(),
+        lambda: graph_client.groups.by_group_id(principal_id).get(),
+    ]
+    errors = []
+    for lookup, odata_type in zip(lookups, ("#microsoft.graph.user", "#microsoft.graph.servicePrincipal", "#microsoft.graph.group")):
+        try:
+            directory_object = await lookup()
+        except Exception as e:
+            errors.append(e)
+            continue
+        if directory_object:
+            return _describe(directory_object, odata_type)
+    ## only a 404 (or an empty answer) on all three means the principal really does not exist (anymore)
+    ## one 403 or 5xx and we dont know, that is an error, which is not cached so the next run tries again
+    failures = [e for e in errors if getattr(e, "response_status_code", None) != 404]
+    if failures:
+        return {"displayName": f"Error: {failures[-1]}", "email": "Error", "type": "Error"}
+    return dict(NOT_FOUND)
+
+
+class PrincipalCache:
+    """
+    this class keeps principal_id -> {displayName, email, type} in a json file, with the time we looked it up
+    entries older than the ttl count as missing, "Not Found" is cached too but with its own (shorter) ttl
+    errors are never cached, so the next run tries them again
+    with refresh=True nothing is read from the cache, but everything we resolve is still written to it
+    """
+
+    def __init__(self, path, ttl=DEFAULT_TTL, not_found_ttl=DEFAULT_NOT_FOUND_TTL, refresh=False):
+        self.path = path
+        self.ttl = ttl
+        self.not_found_ttl = not_found_ttl
+        self.refresh = refresh
+        self.entries = {}
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._load()
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        try:
+            with open(self.path, "r", encoding="utf-8") as file:
+                self.entries = json.load(file)
+        except (OSError, json.JSONDecodeError) as e:
+            ## a broken cache is not a problem, we just look everything up again
+            print(f"    Debug: ignoring principal cache {self.path}: {e}")
+            self.entries = {}
+
+    def _is_fresh(self, entry, now):
+        ttl = self.not_found_ttl if entry["principal"] == NOT_FOUND else self.ttl
+        return now - entry["fetched_at"] < ttl
+
+    def get(self, principal_id):
+        """this function gives the cached details of a principal, or None when we have to ask graph"""
+        with self._lock:
+            entry = None if self.refresh else self.entries.get(principal_id)
+            if entry is not None and self._is_fresh(entry, time.time()):
+                self.hits += 1
+                return dict(entry["principal"])
+            self.misses += 1
+            return None
+
+    def put(self, principal_id, principal):
+        if principal.get("type") == "Error":
+            return
+        with self._lock:
+            self.entries[principal_id] = {"principal": dict(principal), "fetched_at": time.time()}
+
+    def save(self):
+        """this function writes the cache without the expired entries, via a temp file so a crash cant leave half a file"""
+        now = time.time()
+        with self._lock:
+            self.entries = {principal_id: entry for principal_id, entry in self.entries.items() if self._is_fresh(entry, now)}
+            temp_path = self.path + ".tmp"
+            with open(temp_path, "w", encoding="utf-8") as file:
+                json.dump(self.entries, file, ensure_ascii=False)
+            os.replace(temp_path, self.path)
+
+
+async def resolve_principals_async(principal_ids, credential, concurrency=4, graph_client=None, cache=None):
+    """
+    this function resolves all distinct principal ids and gives back a dict principal_id -> {displayName, email, type}
+    with a cache we only ask graph for the ids that are not in it (or expired), and store what we found
+    """
+    distinct_ids = list(dict.fromkeys(principal_id for principal_id in principal_ids if principal_id))
+    results = {}
+    if cache is not None:
+        for principal_id in distinct_ids:
+            cached = cache.get(principal_id)
+            if cached is not None:
+                results[principal_id] = cached
+        distinct_ids = [principal_id for principal_id in distinct_ids if principal_id not in results]
+    if not distinct_ids:
+        return results
+    graph_client = graph_client or GraphServiceClient(credentials=credential)
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def resolve_chunk(chunk):
+        async with semaphore:
+            try:
+                response = await graph_client.directory_objects.get_by_ids.post(
+                    GetByIdsPostRequestBody(ids=chunk, types=["user", "group", "servicePrincipal"])
+                )
+            except Exception as e:
+                print(f"    Debug: bulk lookup of {len(chunk)} principals failed, looking them up one by one: {e}")
+                return
+            ## graph can give the ids back in another case than we asked, so we match them case insensitive
+            wanted = {principal_id.lower(): principal_id for principal_id in chunk}
+            for directory_object in (response.value if response else None) or []:
+                results[wanted.get((directory_object.id or "").lower(), directory_object.id)] = _describe(directory_object)
+            ## getByIds gives back every user, group and service principal that exists, so what is missing really is not there
+            for principal_id in chunk:
+                results.setdefault(principal_id, dict(NOT_FOUND))
+
+    async def resolve_one(principal_id):
+        async with semaphore:
+            results[principal_id] = await lookup_principal_details_async(principal_id, graph_client)
+
+    chunks = [distinct_ids[start:start + MAX_IDS_PER_REQUEST] for start in range(0, len(distinct_ids), MAX_IDS_PER_REQUEST)]
+    await asyncio.gather(*(resolve_chunk(chunk) for chunk in chunks))
+    ## the ids of failed bulk requests we try one by one (also at the same time)
+    await asyncio.gather(*(resolve_one(principal_id) for principal_id in distinct_ids if principal_id not in results))
+    if cache is not None:
+        for principal_id in distinct_ids:
+            cache.put(principal_id, results[principal_id])
+        cache.save()
+    return results
+
+
+def resolve_principals(principal_ids, credential, concurrency=4, cache=None):
+    """this is the synchronous wrapper, it runs all lookups in one event loop"""
+    return asyncio.run(resolve_principals_async(principal_ids, credential, concurrency, cache=cache))
@@ -3,6 +3,14 @@ from dotenv import load_dotenv
 from azure.cosmos import CosmosClient
 from azure.identity import DefaultAzureCredential
 
+from cosmos_throttle import RateController
+from cosmos_router import QueryRouter
+from report_queries import AGGREGATES_BY_NAME, REPORT_QUERIES_BY_NAME, run_aggregate, run_report_query
+from cosmos_cache import ItemCache
+from cosmos_metrics import MetricsRecorder, InstrumentedContainer
+from cosmos_workload import RecordingContainer, WorkloadRecorder
+from cosmos_scan import ScanReport, scan_account
+
 # we get the variables from the .env file (ADD this file to the gitignore ! never publish youre api keys !!! not even in a commit that you overwrite 
 load_dotenv()
 
@@ -10,6 +18,16 @@ load_dotenv()
 COSMOS_ENDPOINT = os.environ['COSMOS_ENDPOINT']
 DATABASE_NAME = os.environ['DATABASE_NAME']
 CONTAINER_NAME = os.environ['CONTAINER_NAME']
+## the RU/s we allow the queries to use, leave it empty to not throttle ourselves
+RU_BUDGET = os.environ.get('RU_BUDGET', '')
+## when set we record the RU and latency of every call and write them to this json file
+METRICS_PATH = os.environ.get('METRICS_PATH', '')
+## when set every call is appended to this json lines file, cosmos_workload.py can replay it later
+WORKLOAD_PATH = os.environ.get('WORKLOAD_PATH', '')
+## how many feed ranges list_all_db_items reads at the same time
+SCAN_WORKERS = int(os.environ.get('SCAN_WORKERS', '8'))
+## what to do with a query that has to ask every partition by accident: allow, warn or fail
+FAN_OUT = os.environ.get('FAN_OUT', 'warn')
 
 ## now we setup the cosmosdb client connection using Azure AD
 credential = DefaultAzureCredential()
@@ -19,18 +37,26 @@ client = CosmosClient(COSMOS_ENDPOINT, credential)
 print(f"endpoint : {COSMOS_ENDPOINT}")
 db_client = client.get_database_client(DATABASE_NAME)
 container_client = db_client.get_container_client(CONTAINER_NAME)
+metrics = MetricsRecorder()
+if METRICS_PATH:
+    container_client = InstrumentedContainer(container_client, metrics)
+workload = WorkloadRecorder(WORKLOAD_PATH) if WORKLOAD_PATH else None
+if workload:
+    container_client = RecordingContainer(container_client, workload)
+## the controller keeps the queries under the RU/s budget and retries them when cosmos throttles us
+controller = RateController(float(RU_BUDGET)) if RU_BUDGET else None
+## point reads go through a small cache, so reading the same hotel again does not cost a full read every time
+cache = ItemCache(container_client, max_items=1000, ttl=60, controller=controller)
+## the router looks at the WHERE of every query and only asks the partitions it needs
+router = QueryRouter(container_client, partition_key_path="/Category", fan_out=FAN_OUT, controller=controller)
 
 def list_all_db_items():
-    ## now we loop through all databases uses list_database 
-    for db in client.list_databases():
-        print(f" -- DATABASE: {db["id"]}")
-        # and for each databse we get all the containers
-        
-        for container in db_client.list_containers():
-            print(f'  -- Container: {container['id']}')
-            ## now we get all items per container 
-            for item in container_client.read_all_items():
-                print(f"    -- item: {item["HotelName"]} - type : {item["Category"]} - rating : {item["Rating"]} - hotelid : {item["HotelId"]} - documentid = {item["id"]} ")
+    ## we scan all containers of all databases, every container is split in feed ranges that we read at the same time
+    ## the items come in the order the ranges deliver them, so we print the database and container on every line
+    report = ScanReport()
+    for database_id, container_id, item in scan_account(client, workers=SCAN_WORKERS, controller=controller, report=report):
+        print(f"    -- {database_id}/{container_id} item: {item.get("HotelName")} - type : {item.get("Category")} - rating : {item.get("Rating")} - hotelid : {item.get("HotelId")} - documentid = {item["id"]} ")
+    report.print_summary()
 
 
 # ## now we insert a new hotel (its hotel1 from the items but we do it manualy just for this example 
@@ -107,19 +133,32 @@ def list_all_db_items():
 #         "Tags": [ "bathroom shower" ]
 #       }
 
-# hotel = container_client.read_item('300bf955-8637-4a34-b17f-e8a26ea0f30a',"Resort")
+# ## we read it through the cache, the copy we get can be changed without touching the cache
+# hotel = cache.read_item('300bf955-8637-4a34-b17f-e8a26ea0f30a',"Resort")
 # ## show the current rooms 
 # print(hotel["Rooms"])
 # print("*****************************************")
 # ## we update the hotel with the new room 
 # hotel["Rooms"].append(new_room)
 # ## and now we update the cosmos db item with the extra room 
-# updated_hotel = container_client.replace_item(hotel["id"],hotel)
+# ## the replace also goes through the cache, so the cache gets the new version (and etag) right away
+# updated_hotel = cache.replace_item(hotel["id"],hotel,"Resort")
 
 # ## now we read the item to check if the room is added
 # print(f"updated rooms : {updated_hotel["Rooms"]}")
 # ## if you want to make 100 % sure the item in cosmod db is the same (just in case someone updated it with something else after you ) you should do a read_item again, but this will be a read operation extra 
-# print(f"real updated rooms : {container_client.read_item('300bf955-8637-4a34-b17f-e8a26ea0f30a',"Resort")["Rooms"]} ")
+# ## with the cache this is free while the item is fresh, and only a cheap etag check (304) when it expired
+# print(f"real updated rooms : {cache.read_item('300bf955-8637-4a34-b17f-e8a26ea0f30a',"Resort")["Rooms"]} ")
+
+
+# ## this works, but we send the whole hotel back and forth, and if someone else changed it in between we overwrite their change
+# ## with a patch we only send the new room, cosmos db appends it on the server
+# from cosmos_patch import update_item, add_op, set_op, incr_op
+# updated_hotel = cache.patch_item('300bf955-8637-4a34-b17f-e8a26ea0f30a', "Resort", [add_op("/Rooms/-", new_room)])
+
+# ## when the change depends on what we read (like a new rating), update_item guards it with the etag and tries again when someone was faster
+# updated_hotel = update_item(container_client, '300bf955-8637-4a34-b17f-e8a26ea0f30a', "Resort",
+#                             lambda hotel: [set_op("/Rating", round(hotel["Rating"] + 0.1, 1)), incr_op("/RatingUpdates")], cache=cache)
 
 
 
@@ -127,18 +166,20 @@ def list_all_db_items():
 # ## first we list 
 # print(list_all_db_items())
 # ## then we delete one of the id and list again 
-# container_client.delete_item("300bf955-8637-4a34-b17f-e8a26ea0f30a","Resort")
+# cache.delete_item("300bf955-8637-4a34-b17f-e8a26ea0f30a","Resort")
 # print(list_all_db_items())
 
 
 ## lets select something using parameters and querys
 # let filter by propperty
 
-## we make a query where we select Category = budget
-query = "SELECT * FROM  c WHERE c.Category = 'Budget' "
+## the queries of this report are in report_queries.py, so cosmos_async_query.py (all of them at the same time),
+## the benchmark and indexing_policy.py (the index paths) use exactly the same ones
+## here we run them one by one, with the explanation of every step
 
-# put them in a list , make sure we sue partition_key="Budget" again or we need to enable enablecrosspartitio_Search= true
-items = list(container_client.query_items(query, partition_key="Budget"))
+## we make a query where we select Category = budget
+## the router sees c.Category = 'Budget' and only asks the Budget partition (like partition_key="Budget")
+items = run_report_query(router, REPORT_QUERIES_BY_NAME["budget"])
 
 for item in items:
     print(f"{item["HotelName"]}")
@@ -149,44 +190,58 @@ print("*********************************************************")
 
 
 ## however this is not very safe, so lets make a parameterised query , which is safer , so lets check for a rating of 4.8 or higher
-query = "SELECT * FROM  c WHERE c.Rating >= @min_rating "
-params = [{"name": "@min_rating", "value": 4.8 }]
-
-# put them in a list , we are going to look accross partition in this case since we want all paritions 
-items = list(container_client.query_items(query, params, enable_cross_partition_query=True))
+## we only print the name, category and rating, so we only ask for those fields (SELECT c["HotelName"] AS HotelName, ...)
+## the rest of every hotel stays in cosmos db, and we get small records (item.HotelName) instead of big dicts
+## we are going to look accross partition in this case since we want all paritions
+spec = REPORT_QUERIES_BY_NAME["top rated"]
+items = run_report_query(router, spec)
 
 for item in items:
-    print(f"{item["HotelName"]} - { item["Category"]} - rating {item["Rating"]}")
+    print(f"{item.HotelName} - {item.Category} - rating {item.Rating}")
 
-print(f"items found = {len(items)} with a rating higher than Value: {params[0]['value']}") 
+print(f"items found = {len(items)} with a rating higher than Value: {spec['parameters'][0]['value']}") 
 
 print("*********************************************************")
 
 
 ## lets do a project now where we only select certain fields , for example HotelId HotelName, Rating 
-query = "SELECT c.HotelId, c.HotelName, c.Rating FROM  c WHERE c.Rating >= @min_rating "
-params = [{"name": "@min_rating", "value": 4.8 }]
-
-# put them in a list , we are going to look accross partition in this case since we want all paritions searches
-items = list(container_client.query_items(query, params, enable_cross_partition_query=True))
+spec = REPORT_QUERIES_BY_NAME["top rated projection"]
+items = run_report_query(router, spec)
 
 for item in items:
     print(f"{item} -- onlyu 3 fields !")
 
-print(f"items found = {len(items)} with a rating higher than Value: {params[0]['value']}")
+print(f"items found = {len(items)} with a rating higher than Value: {spec['parameters'][0]['value']}")
 
 print("*********************************************************")
 
 
 ## now we log into the tags and only select the hotels that have the  tag view  (hotels with a view) , since we arent sure if every tag is lowercase or not , we normalise both sides for comparison
-query = "SELECT * FROM c WHERE EXISTS(SELECT VALUE tag FROM tag IN c.Tags WHERE LOWER(tag) = LOWER(@tag))"
-params = [{"name": "@tag", "value": "View" }]
-
-# put them in a list , we are going to look accross partition in this case since we want all paritions searches
-items = list(container_client.query_items(query, params, enable_cross_partition_query=True))
+## we only need the name here
+spec = REPORT_QUERIES_BY_NAME["with a view"]
+items = run_report_query(router, spec)
 
 for item in items:
-    print(f"{item["HotelName"]} -has a view !!!")
+    print(f"{item.HotelName} -has a view !!!")
+
+print(f"{len(items)} hotel(s) hava a view {spec['parameters'][0]['value']}")
+
+print("*********************************************************")
 
-print(f"{len(items)} hotel(s) hava a view {params[0]['value']}")
 
+## when we only need a number we let cosmos db compute it, instead of getting every hotel and doing len(items)
+## every partition sends back one small row and we merge them here
+print(f"{run_aggregate(container_client, AGGREGATES_BY_NAME['budget hotels'], controller=controller)} hotels in category Budget")
+print(f"{run_aggregate(container_client, AGGREGATES_BY_NAME['top rated hotels'], controller=controller)} hotels with a rating of 4.8 or higher")
+print(f"average rating : {run_aggregate(container_client, AGGREGATES_BY_NAME['average rating'], controller=controller)}")
+## the room prices are in the Rooms array, with a JOIN we aggregate over every room
+print(f"cheapest room : {run_aggregate(container_client, AGGREGATES_BY_NAME['cheapest room'], controller=controller)}")
+print(f"most expensive room : {run_aggregate(container_client, AGGREGATES_BY_NAME['most expensive room'], controller=controller)}")
+for category, hotels in run_aggregate(container_client, AGGREGATES_BY_NAME['hotels per category'], controller=controller).items():
+    print(f"{category} : {hotels} hotels")
+
+if METRICS_PATH:
+    metrics.write_json(METRICS_PATH)
+    metrics.print_summary()
+if workload:
+    workload.close()
@@ -0,0 +1,76 @@
+## the report queries of readcosmos.py, in one place
+## readcosmos.py runs them one by one through the router, cosmos_async_query.py runs them all at the same time,
+## bench_cosmos.py measures them and indexing_policy.py derives the index paths from them (and from the aggregates)
+## so a new query only has to be added here, and the indexing policy does not fall behind
+## a spec is a dict: name, and either a query, or a record (from record_type) with a where; parameters and allow_fan_out are optional
+## an aggregate spec has a function and optional expression, where, parameters, join and group_by, like aggregate()
+
+from cosmos_aggregate import aggregate, partial_query
+from cosmos_projection import query_records, record_type, records_query
+
+## the fields we print, the rest of every hotel stays in cosmos db
+HotelRating = record_type("HotelRating", ["HotelName", "Category", "Rating"])
+HotelName = record_type("HotelName", ["HotelName"])
+
+REPORT_QUERIES = [
+    {"name": "budget", "query": "SELECT * FROM c WHERE c.Category = 'Budget'"},
+    {"name": "top rated", "record": HotelRating, "where": "c.Rating >= @min_rating",
+     "parameters": [{"name": "@min_rating", "value": 4.8}], "allow_fan_out": True},
+    {"name": "top rated projection", "query": "SELECT c.HotelId, c.HotelName, c.Rating FROM c WHERE c.Rating >= @min_rating",
+     "parameters": [{"name": "@min_rating", "value": 4.8}], "allow_fan_out": True},
+    {"name": "with a view", "record": HotelName, "where": "EXISTS(SELECT VALUE tag FROM tag IN c.Tags WHERE LOWER(tag) = LOWER(@tag))",
+     "parameters": [{"name": "@tag", "value": "View"}], "allow_fan_out": True},
+]
+
+REPORT_QUERIES_BY_NAME = {spec["name"]: spec for spec in REPORT_QUERIES}
+
+
+def query_text(spec):
+    """this function gives the sql of a spec, for a record spec the SELECT is the projection of the record"""
+    if "record" in spec:
+        return records_query(spec["record"], spec.get("where"), spec.get("order_by"))
+    return spec["query"]
+
+
+def to_items(spec, rows):
+    """this function turns the rows of a record spec in records, the rows of the other specs stay dicts"""
+    if "record" in spec:
+        return [spec["record"].from_row(row) for row in rows]
+    return list(rows)
+
+
+def run_report_query(router, spec):
+    """this function runs a spec through a QueryRouter and gives back the items (records for a record spec)"""
+    if "record" in spec:
+        return list(query_records(router, spec["record"], spec.get("where"), spec.get("parameters"), spec.get("order_by"),
+                                  allow_fan_out=spec.get("allow_fan_out", False)))
+    return list(router.query(spec["query"], spec.get("parameters"), allow_fan_out=spec.get("allow_fan_out", False)))
+
+
+AGGREGATES = [
+    {"name": "budget hotels", "function": "COUNT", "where": "c.Category = 'Budget'"},
+    {"name": "top rated hotels", "function": "COUNT", "where": "c.Rating >= @min_rating", "parameters": [{"name": "@min_rating", "value": 4.8}]},
+    {"name": "average rating", "function": "AVG", "expression": "c.Rating"},
+    ## the room prices are in the Rooms array, with a JOIN we aggregate over every room
+    {"name": "cheapest room", "function": "MIN", "expression": "r.BaseRate", "join": "r IN c.Rooms"},
+    {"name": "most expensive room", "function": "MAX", "expression": "r.BaseRate", "join": "r IN c.Rooms"},
+    {"name": "hotels per category", "function": "COUNT", "group_by": "c.Category"},
+]
+
+AGGREGATES_BY_NAME = {spec["name"]: spec for spec in AGGREGATES}
+
+
+def aggregate_text(spec):
+    """this function gives the sql that aggregate() sends to every partition for an aggregate spec"""
+    return partial_query(spec["function"], spec.get("expression", "1"), spec.get("where"), spec.get("group_by"), spec.get("join"))
+
+
+def run_aggregate(container_client, spec, **kwargs):
+    """this function computes an aggregate spec with aggregate(), kwargs (like controller) are passed on"""
+    return aggregate(container_client, spec["function"], spec.get("expression", "1"), spec.get("where"), spec.get("parameters"),
+                     group_by=spec.get("group_by"), join=spec.get("join"), **kwargs)
+
+
+def all_query_texts():
+    """this function gives the sql of every query the report runs, the report queries and the aggregates"""
+    return [query_text(spec) for spec in REPORT_QUERIES] + [aggregate_text(spec) for spec in AGGREGATES]
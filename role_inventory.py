@@ -0,0 +1,120 @@
+## inventory of the cosmos db data plane role assignments of an account
+## the assignments are grouped by (role definition, scope) and inside a group by principal, all with dicts (hashed), so
+## adding an assignment is O(1) and tens of thousands of assignments are no problem
+## the role names come from list_sql_role_definitions, so custom roles get their own name too
+## the result can be written as json lines or csv, one line per (role, scope, principal), so other tools can read it
+
+import csv
+import json
+
+from azure.core.exceptions import AzureError
+
+## these two built-in roles always exist, we use the names when the account does not give us its role definitions
+BUILT_IN_ROLES = {
+    "00000000-0000-0000-0000-000000000001": "Cosmos DB Built-in Data Reader",
+    "00000000-0000-0000-0000-000000000002": "Cosmos DB Built-in Data Contributor",
+}
+
+RECORD_FIELDS = [
+    "role_name", "role_type", "role_definition_id", "scope", "scope_level",
+    "principal_id", "display_name", "email", "type", "assignment_ids",
+]
+
+
+def role_definition_key(role_definition_id):
+    """this function gives the guid at the end of a role definition id, lower case, so full ids and guids match"""
+    return (role_definition_id or "").rstrip("/").rsplit("/", 1)[-1].lower()
+
+
+def load_role_definitions(cosmos_client, resource_group, account_name):
+    """
+    this function gives a dict role definition guid -> {name, type} with the built-in and the custom roles of the account
+    when we cant list the role definitions (no permission, throttled, ...) we go on with BUILT_IN_ROLES and what we did read,
+    the assignments of custom roles then show as "Unknown role <guid>"
+    """
+    roles = {key: {"name": name, "type": "BuiltInRole"} for key, name in BUILT_IN_ROLES.items()}
+    try:
+        for definition in cosmos_client.sql_resources.list_sql_role_definitions(resource_group, account_name):
+            ## the sdk gives the role type (BuiltInRole/CustomRole) as an enum, we want the plain string
+            role_type = getattr(definition, "type_properties_type", None) or "CustomRole"
+            roles[role_definition_key(definition.id or definition.name)] = {
+                "name": definition.role_name or definition.name,
+                "type": getattr(role_type, "value", role_type),
+            }
+    except AzureError as e:
+        print(f"    Debug: could not list the role definitions of {account_name}, using the built-in role names: {e}")
+    return roles
+
+
+class RoleInventory:
+    """
+    this class groups role assignments by (role definition, scope) and then by principal
+    groups: (role key, scope) -> {principal_id -> [assignment ids]}
+    by_principal: principal_id -> set of (role key, scope), so we can also answer "what can this principal do"
+    """
+
+    def __init__(self, role_definitions=None, scope_level=None):
+        self.role_definitions = role_definitions or {}
+        self.scope_level = scope_level or (lambda scope: "")
+        self.groups = {}
+        self.by_principal = {}
+        self.assignments = 0
+
+    def add(self, assignment):
+        group_key = (role_definition_key(assignment.role_definition_id), assignment.scope)
+        members = self.groups.setdefault(group_key, {})
+        members.setdefault(assignment.principal_id, []).append(assignment.name)
+        self.by_principal.setdefault(assignment.principal_id, set()).add(group_key)
+        self.assignments += 1
+
+    def add_all(self, assignments):
+        """this function takes any iterable of assignments, like the pager of list_sql_role_assignments, without making a list of it"""
+        for assignment in assignments:
+            self.add(assignment)
+        return self
+
+    def principal_ids(self):
+        return self.by_principal.keys()
+
+    def role_name(self, role_key):
+        role = self.role_definitions.get(role_key)
+        return role["name"] if role else f"Unknown role {role_key}"
+
+    def iter_records(self, principals=None):
+        """this generator yields one flat dict per (role, scope, principal), sorted by role name and scope"""
+        principals = principals or {}
+        for role_key, scope in sorted(self.groups, key=lambda group_key: (self.role_name(group_key[0]), group_key[1])):
+            role = self.role_definitions.get(role_key, {})
+            for principal_id, assignment_ids in self.groups[(role_key, scope)].items():
+                principal = principals.get(principal_id, {})
+                yield {
+                    "role_name": self.role_name(role_key),
+                    "role_type": role.get("type", "Unknown"),
+                    "role_definition_id": role_key,
+                    "scope": scope,
+                    "scope_level": self.scope_level(scope),
+                    "principal_id": principal_id,
+                    "display_name": principal.get("displayName", "Unknown"),
+                    "email": principal.get("email", "Unknown"),
+                    "type": principal.get("type", "Unknown"),
+                    "assignment_ids": assignment_ids,
+                }
+
+
+def write_jsonl(records, file):
+    count = 0
+    for record in records:
+        file.write(json.dumps(record, ensure_ascii=False) + "\n")
+        count += 1
+    return count
+
+
+def write_csv(records, file):
+    """this function writes the records as csv, the assignment ids of one principal are joined with a ;"""
+    writer = csv.DictWriter(file, fieldnames=RECORD_FIELDS)
+    writer.writeheader()
+    count = 0
+    for record in records:
+        writer.writerow(dict(record, assignment_ids=";".join(record["assignment_ids"])))
+        count += 1
+    return count
@@ -11,10 +11,13 @@ from azure.identity import DefaultAzureCredential
 from azure.mgmt.cosmosdb import CosmosDBManagementClient
 from azure.mgmt.authorization import AuthorizationManagementClient
 from azure.mgmt.authorization.models import RoleAssignmentCreateParameters
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from datetime import datetime
 import uuid
 from dotenv import load_dotenv
 
+from cosmos_metrics import MetricsRecorder, InstrumentedClient
+
 # Load environment variables
 load_dotenv()
 
@@ -27,15 +30,29 @@ RESOURCE_GROUP = os.environ['RESOURCE_GROUP']
 COSMOS_ACCOUNT_NAME = os.environ['ACCOUNT_NAME']
 DATABASE_NAME = os.environ['DATABASE_NAME']
 CONTAINER_NAME = os.environ['CONTAINER_NAME']
+# Optional: write the timing of every management call to this JSON file
+METRICS_PATH = os.environ.get('METRICS_PATH', '')
+# Optional: set to 1 to only print which role assignments would be created
+DRY_RUN = os.environ.get('DRY_RUN', '') == '1'
+# Optional: how many missing role assignments we create at the same time
+RBAC_CONCURRENCY = int(os.environ.get('RBAC_CONCURRENCY', '4'))
 
 # USER CONFIGURATION
 USER_EMAIL = ""  # Leave empty to use current user, or set to "user@domain.com"
 PRINCIPAL_ID = ""  # Leave empty to auto-detect
+# Optional: comma separated principal IDs to provision all at once (overrides PRINCIPAL_ID)
+PRINCIPAL_IDS = [p.strip() for p in os.environ.get('PRINCIPAL_IDS', '').split(',') if p.strip()]
 
 # ROLE DEFINITION IDs
 DATA_READER_ROLE = "00000000-0000-0000-0000-000000000001"
 DATA_CONTRIBUTOR_ROLE = "00000000-0000-0000-0000-000000000002"
 
+# Azure RBAC roles every principal gets on the account
+AZURE_ROLES = [
+    "CosmosDB SDK Reader",
+    "Cosmos DB Account Reader Role"
+]
+
 def get_principal_id(credential):
     """Get the principal ID for the user"""
     if PRINCIPAL_ID:
@@ -55,37 +72,6 @@ def get_principal_id(credential):
     print("Get it with: az ad signed-in-user show --query id -o tsv")
     sys.exit(1)
 
-def create_azure_rbac_roles(auth_client, principal_id, account_scope):
-    """Create Azure RBAC roles for management plane access"""
-    print("Setting up Azure RBAC roles...")
-    
-    roles = [
-        "CosmosDB SDK Reader",
-        "Cosmos DB Account Reader Role"
-    ]
-    
-    for role_name in roles:
-        try:
-            # Create role assignment
-            role_assignment_params = RoleAssignmentCreateParameters(
-                role_definition_id=f"/subscriptions/{SUBSCRIPTION_ID}/providers/Microsoft.Authorization/roleDefinitions/{get_role_definition_id(role_name)}",
-                principal_id=principal_id
-            )
-            
-            assignment_name = str(uuid.uuid4())
-            auth_client.role_assignments.create(
-                scope=account_scope,
-                role_assignment_name=assignment_name,
-                parameters=role_assignment_params
-            )
-            print(f"✅ Created {role_name} role assignment")
-            
-        except Exception as e:
-            if "already exists" in str(e).lower():
-                print(f"{role_name} role assignment already exists")
-            else:
-                print(f"Error creating {role_name}: {e}")
-
 def get_role_definition_id(role_name):
     """Get the role definition ID for built-in roles"""
     role_ids = {
@@ -94,39 +80,111 @@ def get_role_definition_id(role_name):
     }
     return role_ids.get(role_name, "")
 
-def create_cosmos_data_plane_roles(cosmos_client, principal_id, account_scope, database_scope, container_scope):
-    """Create Cosmos DB data plane roles"""
-    print("Setting up Cosmos DB data plane roles...")
-    
-    scopes = [
-        (account_scope, "account-scoped"),
-        (database_scope, "database-scoped"), 
-        (container_scope, "container-scoped")
-    ]
-    
-    for scope, scope_name in scopes:
-        try:
-            # Create SQL role assignment
-            assignment_id = str(uuid.uuid4())
-            
-            cosmos_client.sql_resources.create_update_sql_role_assignment(
-                resource_group_name=RESOURCE_GROUP,
-                account_name=COSMOS_ACCOUNT_NAME,
-                role_assignment_id=assignment_id,
-                create_update_sql_role_assignment_parameters={
-                    "roleDefinitionId": f"/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/{RESOURCE_GROUP}/providers/Microsoft.DocumentDB/databaseAccounts/{COSMOS_ACCOUNT_NAME}/sqlRoleDefinitions/{DATA_CONTRIBUTOR_ROLE}",
-                    "scope": scope,
-                    "principalId": principal_id
-                }
+def assignment_id(scope, role_definition_id, principal_id):
+    """Deterministic assignment ID, so a re-run targets the same assignment instead of creating a duplicate"""
+    key = f"{scope.lower()}|{role_definition_id.rsplit('/', 1)[-1].lower()}|{principal_id.lower()}"
+    return str(uuid.uuid5(uuid.NAMESPACE_URL, key))
+
+def assignment_key(scope, role_definition_id, principal_id):
+    """Key we compare desired and existing assignments on (case insensitive, role by its GUID)"""
+    return (scope.rstrip("/").lower(), role_definition_id.rsplit("/", 1)[-1].lower(), principal_id.lower())
+
+def desired_assignments(principal_ids, account_scope, database_scope, container_scope):
+    """All assignments the principals should have, as a dict key -> assignment"""
+    desired = {}
+    for principal_id in principal_ids:
+        ## Azure RBAC (management plane) on the account
+        for role_name in AZURE_ROLES:
+            role_definition_id = f"/subscriptions/{SUBSCRIPTION_ID}/providers/Microsoft.Authorization/roleDefinitions/{get_role_definition_id(role_name)}"
+            key = assignment_key(account_scope, role_definition_id, principal_id)
+            desired.setdefault(key, {
+                "plane": "azure",
+                "name": role_name,
+                "scope": account_scope,
+                "role_definition_id": role_definition_id,
+                "principal_id": principal_id,
+                "assignment_id": assignment_id(account_scope, role_definition_id, principal_id),
+            })
+        ## Cosmos DB data plane on account, database and container
+        for scope, scope_name in ((account_scope, "account-scoped"), (database_scope, "database-scoped"), (container_scope, "container-scoped")):
+            role_definition_id = f"{account_scope}/sqlRoleDefinitions/{DATA_CONTRIBUTOR_ROLE}"
+            key = assignment_key(scope, role_definition_id, principal_id)
+            desired.setdefault(key, {
+                "plane": "sql",
+                "name": f"{scope_name} Data Contributor",
+                "scope": scope,
+                "role_definition_id": role_definition_id,
+                "principal_id": principal_id,
+                "assignment_id": assignment_id(scope, role_definition_id, principal_id),
+            })
+    return desired
+
+def existing_assignment_keys(auth_client, cosmos_client, account_scope):
+    """List the existing assignments once (one paged call per plane) and give back their keys"""
+    existing = set()
+    for a in cosmos_client.sql_resources.list_sql_role_assignments(RESOURCE_GROUP, COSMOS_ACCOUNT_NAME):
+        existing.add(assignment_key(a.scope, a.role_definition_id, a.principal_id))
+    ## atScope() gives the assignments on the account itself (and above it), not the ones on resources below it
+    for a in auth_client.role_assignments.list_for_scope(account_scope, filter="atScope()"):
+        existing.add(assignment_key(a.scope, a.role_definition_id, a.principal_id))
+    return existing
+
+def plan_assignments(auth_client, cosmos_client, principal_ids, account_scope, database_scope, container_scope):
+    """The assignments that are desired but do not exist yet"""
+    desired = desired_assignments(principal_ids, account_scope, database_scope, container_scope)
+    existing = existing_assignment_keys(auth_client, cosmos_client, account_scope)
+    return [assignment for key, assignment in desired.items() if key not in existing], len(desired)
+
+def apply_assignment(auth_client, cosmos_client, assignment):
+    """Create one missing assignment"""
+    if assignment["plane"] == "azure":
+        auth_client.role_assignments.create(
+            scope=assignment["scope"],
+            role_assignment_name=assignment["assignment_id"],
+            parameters=RoleAssignmentCreateParameters(
+                role_definition_id=assignment["role_definition_id"],
+                principal_id=assignment["principal_id"]
             )
-            
-            print(f"Created {scope_name} Data Contributor role")
-            
-        except Exception as e:
-            if "already exists" in str(e).lower():
-                print(f"{scope_name} role assignment already exists")
-            else:
-                print(f"Error creating {scope_name} role: {e}")
+        )
+        return
+    sql_resources = cosmos_client.sql_resources
+    # Newer SDK versions only have the long running begin_ variant
+    create = getattr(sql_resources, "begin_create_update_sql_role_assignment", None) or sql_resources.create_update_sql_role_assignment
+    result = create(
+        resource_group_name=RESOURCE_GROUP,
+        account_name=COSMOS_ACCOUNT_NAME,
+        role_assignment_id=assignment["assignment_id"],
+        create_update_sql_role_assignment_parameters={
+            "roleDefinitionId": assignment["role_definition_id"],
+            "scope": assignment["scope"],
+            "principalId": assignment["principal_id"]
+        }
+    )
+    if hasattr(result, "result"):
+        result.result()
+
+def reconcile_roles(auth_client, cosmos_client, principal_ids, account_scope, database_scope, container_scope, dry_run=False):
+    """Create only the missing role assignments, at the same time; with dry_run only print the plan"""
+    print("Reconciling role assignments...")
+    missing, desired_count = plan_assignments(auth_client, cosmos_client, principal_ids, account_scope, database_scope, container_scope)
+    print(f"{desired_count} desired, {desired_count - len(missing)} already exist, {len(missing)} to create")
+    for assignment in missing:
+        print(f"  + {assignment['name']} for {assignment['principal_id']} on {assignment['scope']} ({assignment['assignment_id']})")
+    if dry_run or not missing:
+        return []
+
+    failures = []
+    with ThreadPoolExecutor(max_workers=RBAC_CONCURRENCY) as executor:
+        futures = {executor.submit(apply_assignment, auth_client, cosmos_client, assignment): assignment for assignment in missing}
+        for future in as_completed(futures):
+            assignment = futures[future]
+            try:
+                future.result()
+                print(f"✅ Created {assignment['name']} for {assignment['principal_id']}")
+            except Exception as e:
+                failures.append((assignment, e))
+                print(f"Error creating {assignment['name']} for {assignment['principal_id']}: {e}")
+    return failures
 
 def main():
     print("=== Azure Cosmos DB RBAC Setup (Python) ===")
@@ -137,29 +195,41 @@ def main():
     # Initialize credential
     credential = DefaultAzureCredential()
     
-    # Get principal ID
-    principal_id = get_principal_id(credential)
+    # Get principal IDs
+    principal_ids = PRINCIPAL_IDS or [get_principal_id(credential)]
     
     # Compute scopes
     account_scope = f"/subscriptions/{SUBSCRIPTION_ID}/resourceGroups/{RESOURCE_GROUP}/providers/Microsoft.DocumentDB/databaseAccounts/{COSMOS_ACCOUNT_NAME}"
     database_scope = f"{account_scope}/dbs/{DATABASE_NAME}"
     container_scope = f"{database_scope}/colls/{CONTAINER_NAME}"
     
-    print(f"Principal ID: {principal_id}")
+    print(f"Principal IDs: {', '.join(principal_ids)}")
     print(f"Account Scope: {account_scope}")
     
     # Initialize clients
     auth_client = AuthorizationManagementClient(credential, SUBSCRIPTION_ID)
     cosmos_client = CosmosDBManagementClient(credential, SUBSCRIPTION_ID)
+    metrics = MetricsRecorder()
+    if METRICS_PATH:
+        auth_client = InstrumentedClient(auth_client, metrics)
+        cosmos_client = InstrumentedClient(cosmos_client, metrics)
     
-    # Create role assignments
-    create_azure_rbac_roles(auth_client, principal_id, account_scope)
-    create_cosmos_data_plane_roles(cosmos_client, principal_id, account_scope, database_scope, container_scope)
+    # Create the missing role assignments
+    failures = reconcile_roles(auth_client, cosmos_client, principal_ids, account_scope, database_scope, container_scope, dry_run=DRY_RUN)
     
-    print("\n=== RBAC setup complete! ===")
-    print(f"✅ All permissions configured for principal: {principal_id}")
+    if DRY_RUN:
+        print("\n=== Dry run, nothing was changed ===")
+    elif failures:
+        print(f"\n=== RBAC setup finished with {len(failures)} errors ===")
+    else:
+        print("\n=== RBAC setup complete! ===")
+        print(f"✅ All permissions configured for principals: {', '.join(principal_ids)}")
     print("\nTo verify, check the Azure Portal or run:")
     print(f"az cosmosdb sql role assignment list --account-name {COSMOS_ACCOUNT_NAME} --resource-group {RESOURCE_GROUP}")
 
+    if METRICS_PATH:
+        metrics.write_json(METRICS_PATH)
+        metrics.print_summary()
+
 if __name__ == "__main__":
     main()
\ No newline at end of file
@@ -0,0 +1,76 @@
+## aggregates against the in-memory container, no azure account needed
+## run them with:  python -m unittest discover -s tests -t .
+
+import unittest
+
+from cosmos_aggregate import aggregate, count
+from cosmos_emulator import InMemoryContainer
+
+
+def make_container():
+    container = InMemoryContainer(partition_key_path="/Category", physical_partitions=4)
+    container.load({"id": str(number), "Category": ["Budget", "Resort", "Inn"][number % 3], "Rating": number % 5}
+                   for number in range(30))
+    return container
+
+
+class RepeatedInValuesTest(unittest.TestCase):
+    """a value that is repeated in IN (...) must be counted once, not once per repeat"""
+
+    def setUp(self):
+        self.container = make_container()
+        self.budget = [document for document in self.container.documents() if document["Category"] == "Budget"]
+
+    def test_count(self):
+        self.assertEqual(count(self.container, "c.Category IN ('Budget', 'Budget')"), len(self.budget))
+
+    def test_sum_and_avg(self):
+        where = "c.Category IN ('Budget', 'Budget')"
+        total = sum(document["Rating"] for document in self.budget)
+        self.assertEqual(aggregate(self.container, "SUM", "c.Rating", where), total)
+        self.assertAlmostEqual(aggregate(self.container, "AVG", "c.Rating", where), total / len(self.budget))
+
+    def test_repeated_values_among_others(self):
+        where = "c.Category IN ('Budget', 'Inn', 'Budget') AND c.Category IN ('Budget', 'Budget', 'Inn')"
+        expected = sum(1 for document in self.container.documents() if document["Category"] in ("Budget", "Inn"))
+        self.assertEqual(count(self.container, where), expected)
+
+    def test_repeated_parameter_values(self):
+        parameters = [{"name": "@first", "value": "Resort"}, {"name": "@second", "value": "Resort"}]
+        self.assertEqual(count(self.container, "c.Category IN (@first, @second)", parameters), 10)
+
+
+class NonNumericValuesTest(unittest.TestCase):
+    """one null Rating makes SUM and AVG undefined (None), in cosmos db and so also in the merged result"""
+
+    def setUp(self):
+        self.container = make_container()
+        self.container.upsert_item({"id": "no-rating", "Category": "Resort", "Rating": None})
+
+    def test_across_partitions(self):
+        self.assertIsNone(aggregate(self.container, "SUM", "c.Rating"))
+        self.assertIsNone(aggregate(self.container, "AVG", "c.Rating"))
+        self.assertEqual(count(self.container, "IS_DEFINED(c.Rating)"), 31)
+
+    def test_single_partition(self):
+        self.assertIsNone(aggregate(self.container, "SUM", "c.Rating", "c.Category = 'Resort'"))
+        self.assertIsNone(aggregate(self.container, "AVG", "c.Rating", "c.Category = 'Resort'"))
+
+    def test_other_partitions_are_not_affected(self):
+        budget = [document["Rating"] for document in self.container.documents() if document["Category"] == "Budget"]
+        self.assertEqual(aggregate(self.container, "SUM", "c.Rating", "c.Category = 'Budget'"), sum(budget))
+        self.assertAlmostEqual(aggregate(self.container, "AVG", "c.Rating", "c.Category = 'Budget'"), sum(budget) / len(budget))
+
+    def test_group_by(self):
+        averages = aggregate(self.container, "AVG", "c.Rating", group_by="c.Category")
+        self.assertIsNone(averages["Resort"])
+        self.assertIsNotNone(averages["Budget"])
+        self.assertIsNotNone(averages["Inn"])
+
+    def test_sum_of_nothing_is_zero(self):
+        self.assertEqual(aggregate(self.container, "SUM", "c.Rating", "c.Category = 'Spa'"), 0)
+        self.assertIsNone(aggregate(self.container, "AVG", "c.Rating", "c.Category = 'Spa'"))
+
+
+if __name__ == "__main__":
+    unittest.main()
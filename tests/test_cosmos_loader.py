@@ -0,0 +1,131 @@
+## the bulk and batch loader against the in-memory container, no azure account needed
+## run them with:  python -m unittest discover -s tests -t .
+
+import contextlib
+import io
+import threading
+import unittest
+
+from cosmos_emulator import CosmosEmulatorError, InMemoryContainer
+from cosmos_loader import MAX_BATCH_OPERATIONS, batch_upsert, bulk_upsert
+from cosmos_throttle import RateController
+
+
+def make_documents(size, categories=("Budget", "Resort", "Inn")):
+    return [{"id": str(number), "Category": categories[number % len(categories)], "Rating": number % 5}
+            for number in range(size)]
+
+
+class RecordingContainer(InMemoryContainer):
+    """this container remembers every batch it was sent, and can refuse the batches of some partition keys"""
+
+    def __init__(self, refuse=(), **kwargs):
+        super().__init__(**kwargs)
+        self.refuse = set(refuse)
+        self.batches = []
+        self._batches_lock = threading.Lock()
+
+    def execute_item_batch(self, batch_operations, partition_key, **kwargs):
+        with self._batches_lock:
+            self.batches.append((partition_key, [args[0]["id"] for _, args, *_ in batch_operations]))
+        if partition_key in self.refuse:
+            raise CosmosEmulatorError(413, "Request size is too large")
+        return super().execute_item_batch(batch_operations, partition_key, **kwargs)
+
+
+class BatchUpsertTest(unittest.TestCase):
+
+    def test_batches_are_grouped_by_partition_key(self):
+        container = RecordingContainer()
+        documents = make_documents(30)
+        report = batch_upsert(container, documents)
+        self.assertEqual(report.succeeded, 30)
+        self.assertEqual(report.batches, 3)
+        by_id = {document["id"]: document for document in documents}
+        for partition_key, ids in container.batches:
+            self.assertEqual({by_id[item_id]["Category"] for item_id in ids}, {partition_key})
+
+    def test_a_batch_has_at_most_100_operations(self):
+        container = RecordingContainer()
+        report = batch_upsert(container, make_documents(250, categories=("Budget",)), batch_size=500)
+        self.assertEqual(sorted(len(ids) for _, ids in container.batches), [50, MAX_BATCH_OPERATIONS, MAX_BATCH_OPERATIONS])
+        self.assertEqual(report.succeeded, 250)
+        self.assertEqual(container.count(), 250)
+
+    def test_documents_without_partition_key_are_written_one_by_one(self):
+        container = RecordingContainer()
+        documents = make_documents(10) + [{"id": "loose", "Rating": 1}]
+        report = batch_upsert(container, documents)
+        self.assertEqual(report.succeeded, 11)
+        self.assertNotIn("loose", [item_id for _, ids in container.batches for item_id in ids])
+
+    def test_failed_batch_falls_back_to_single_writes(self):
+        container = RecordingContainer(refuse={"Resort"})
+        report = batch_upsert(container, make_documents(30))
+        self.assertEqual(report.succeeded, 30)
+        self.assertEqual(report.failed, 0)
+        self.assertEqual(report.batches, 2)
+        self.assertEqual(report.batch_fallbacks, 1)
+        self.assertEqual(report.failures, [])
+        self.assertIn("413", report.fallback_errors[0])
+        self.assertEqual(container.count(), 30)
+
+    def test_fallback_records_the_documents_that_still_fail(self):
+        container = RecordingContainer(refuse={"Resort"})
+        documents = make_documents(30)
+        documents[1]["id"] = 1
+        report = batch_upsert(container, documents)
+        self.assertEqual(report.succeeded, 29)
+        self.assertEqual(report.failed, 1)
+        self.assertEqual(report.failures[0][0], 1)
+        self.assertIn("400", report.failures[0][1])
+
+    def test_summary_shows_fallbacks_apart_from_failures(self):
+        container = RecordingContainer(refuse={"Resort"})
+        report = batch_upsert(container, make_documents(30))
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            report.print_summary()
+        self.assertIn("batch written one by one after: (413)", output.getvalue())
+        self.assertNotIn("failed", output.getvalue().replace("documents failed", ""))
+
+
+class ThrottledLoadTest(unittest.TestCase):
+    """one request in ten gets a 429: without a controller documents are lost, with one every document is written"""
+
+    size = 500
+
+    def make_container(self):
+        return InMemoryContainer(throttle_rate=0.1, seed=7)
+
+    def make_controller(self):
+        return RateController(ru_per_second=1000000, base_delay=0.01, max_delay=0.05)
+
+    def test_without_controller_throttled_documents_are_recorded(self):
+        container = self.make_container()
+        report = bulk_upsert(container, make_documents(self.size), concurrency=4)
+        self.assertGreater(report.failed, 0)
+        self.assertEqual(report.succeeded + report.failed, self.size)
+        self.assertEqual(len(report.failures), report.failed)
+        self.assertTrue(all("429" in error for _, error in report.failures))
+        self.assertEqual(container.count(), report.succeeded)
+
+    def test_with_controller_every_document_is_written(self):
+        container = self.make_container()
+        controller = self.make_controller()
+        report = bulk_upsert(container, make_documents(self.size), concurrency=4, controller=controller)
+        self.assertEqual(report.succeeded, self.size)
+        self.assertEqual(report.failed, 0)
+        self.assertGreater(controller.throttled, 0)
+        self.assertEqual(container.count(), self.size)
+
+    def test_batch_mode_writes_every_document(self):
+        container = self.make_container()
+        report = batch_upsert(container, make_documents(self.size), controller=self.make_controller())
+        self.assertEqual(report.succeeded, self.size)
+        self.assertEqual(report.failed, 0)
+        self.assertEqual(container.count(), self.size)
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,175 @@
+## partition routing against the in-memory container, no azure account needed
+## run them with:  python -m unittest discover -s tests -t .
+
+import contextlib
+import io
+import unittest
+
+from cosmos_emulator import InMemoryContainer
+from cosmos_router import FanOutError, QueryRouter, route_query
+
+CATEGORIES = ("Budget", "Resort", "Inn", "Boutique")
+
+
+class RecordingContainer(InMemoryContainer):
+    """this container remembers the partition key of every query, None for a cross partition query"""
+
+    def __init__(self, **kwargs):
+        super().__init__(**kwargs)
+        self.queried = []
+
+    def query_items(self, query, parameters=None, partition_key=None, **kwargs):
+        self.queried.append(partition_key)
+        return super().query_items(query, parameters=parameters, partition_key=partition_key, **kwargs)
+
+
+def make_container():
+    container = RecordingContainer(partition_key_path="/Category", physical_partitions=4)
+    container.load({"id": str(number), "Category": CATEGORIES[number % len(CATEGORIES)], "Rating": number % 5,
+                    "Address": {"City": ["Oslo", "Lima"][number % 2]}}
+                   for number in range(40))
+    return container
+
+
+## (query, parameters, kind, partition keys)
+ROUTES = [
+    ("SELECT * FROM c WHERE c.Category = 'Budget'", None, "single", ["Budget"]),
+    ("SELECT * FROM c WHERE 'Budget' = c.Category AND c.Rating > 2", None, "single", ["Budget"]),
+    ("SELECT * FROM c WHERE c['Category'] = 'Inn'", None, "single", ["Inn"]),
+    ("SELECT * FROM c WHERE c.Category IN ('Budget', 'Inn')", None, "multi", ["Budget", "Inn"]),
+    ("SELECT * FROM c WHERE c.Category IN ('Budget', 'Inn', 'Budget')", None, "multi", ["Budget", "Inn"]),
+    ("SELECT * FROM c WHERE c.Category IN ('Inn', 'Inn')", None, "single", ["Inn"]),
+    ## AND keeps the values both sides allow, a contradiction allows none
+    ("SELECT * FROM c WHERE c.Category = 'Budget' AND c.Category = 'Inn'", None, "multi", []),
+    ("SELECT * FROM c WHERE c.Category IN ('Budget', 'Inn') AND c.Category IN ('Inn', 'Resort')", None, "single", ["Inn"]),
+    ("SELECT * FROM c WHERE c.Category = 'Inn' AND (c.Category = 'Inn' OR c.Category = 'Budget')", None, "single", ["Inn"]),
+    ## OR needs partition key values on both sides
+    ("SELECT * FROM c WHERE c.Category = 'Budget' OR c.Category = 'Inn'", None, "multi", ["Budget", "Inn"]),
+    ("SELECT * FROM c WHERE c.Category = 'Budget' OR c.Category IN ('Inn', 'Budget')", None, "multi", ["Budget", "Inn"]),
+    ("SELECT * FROM c WHERE c.Category = 'Budget' OR c.Rating > 3", None, "fan-out", []),
+    ("SELECT * FROM c WHERE NOT (c.Category = 'Budget')", None, "fan-out", []),
+    ("SELECT * FROM c WHERE c.Category != 'Budget'", None, "fan-out", []),
+    ("SELECT * FROM c WHERE c.Rating > 3", None, "fan-out", []),
+    ("SELECT * FROM c", None, "fan-out", []),
+    ("SELECT * FROM c WHERE c.Category = @category", [{"name": "@category", "value": "Resort"}], "single", ["Resort"]),
+    ("SELECT * FROM c WHERE c.Category IN (@first, @second)",
+     [{"name": "@first", "value": "Resort"}, {"name": "@second", "value": "Resort"}], "single", ["Resort"]),
+    ("SELECT * FROM hotels h WHERE h.Category = 'Inn'", None, "single", ["Inn"]),
+    ("SELECT VALUE r FROM r IN c.Rooms WHERE c.Category = 'Inn'", None, "fan-out", []),
+]
+
+
+class RouteQueryTest(unittest.TestCase):
+
+    def test_routes(self):
+        for query, parameters, kind, partition_keys in ROUTES:
+            with self.subTest(query=query):
+                route = route_query(query, parameters)
+                self.assertEqual(route.kind, kind)
+                self.assertEqual(route.partition_keys, partition_keys)
+
+    def test_unknown_parameter_or_alias_is_not_a_filter(self):
+        self.assertEqual(route_query("SELECT * FROM c WHERE c.Category = @category").kind, "fan-out")
+        self.assertEqual(route_query("SELECT * FROM hotels h WHERE c.Category = 'Inn'").kind, "fan-out")
+
+    def test_true_and_one_are_different_values(self):
+        route = route_query("SELECT * FROM c WHERE c.Category IN (true, 1, true)")
+        self.assertEqual(route.partition_keys, [True, 1])
+
+    def test_nested_partition_key_path(self):
+        route = route_query("SELECT * FROM c WHERE c.Address.City = 'Oslo'", partition_key_path="/Address/City")
+        self.assertEqual((route.kind, route.partition_keys), ("single", ["Oslo"]))
+
+    def test_queries_that_need_a_merge(self):
+        self.assertTrue(route_query("SELECT * FROM c WHERE c.Category IN ('Inn', 'Budget') ORDER BY c.Rating").merged)
+        self.assertTrue(route_query("SELECT VALUE COUNT(1) FROM c WHERE c.Category IN ('Inn', 'Budget')").merged)
+        self.assertFalse(route_query("SELECT * FROM c WHERE c.Category IN ('Inn', 'Budget')").merged)
+
+    def test_parse_error_falls_back_to_fan_out(self):
+        route = route_query("SELECT * FROM c WHERE c.Category LIKE 'Bud%'")
+        self.assertEqual(route.kind, "fan-out")
+        self.assertIn("LIKE", route.reason)
+
+
+class QueryRouterTest(unittest.TestCase):
+    """the router must ask only the partitions of the route, and give the same items as a cross partition query"""
+
+    def setUp(self):
+        self.container = make_container()
+
+    def expected(self, query, parameters=None):
+        items = self.container.query_items(query, parameters=parameters, enable_cross_partition_query=True)
+        self.container.queried.clear()
+        return sorted(item["id"] for item in items)
+
+    def test_results_and_partitions(self):
+        router = QueryRouter(self.container, fan_out="allow")
+        for query, parameters, kind, partition_keys in ROUTES:
+            if "Rooms" in query:
+                continue
+            with self.subTest(query=query):
+                expected = self.expected(query, parameters)
+                items = sorted(item["id"] for item in router.query(query, parameters))
+                self.assertEqual(items, expected)
+                self.assertEqual(self.container.queried, partition_keys if kind != "fan-out" else [None])
+                self.container.queried.clear()
+
+    def test_merged_query_runs_once_across_the_partitions(self):
+        router = QueryRouter(self.container, fan_out="fail")
+        query = "SELECT VALUE COUNT(1) FROM c WHERE c.Category IN ('Inn', 'Budget')"
+        self.assertEqual(list(router.query(query)), [20])
+        self.assertEqual(self.container.queried, [None])
+
+    def test_partition_key_path_is_read_from_the_container(self):
+        self.assertEqual(QueryRouter(self.container).partition_key_path, "/Category")
+
+    def test_routes_are_counted(self):
+        router = QueryRouter(self.container, fan_out="allow")
+        for query in ("SELECT * FROM c WHERE c.Category = 'Inn'", "SELECT * FROM c WHERE c.Category IN ('Inn', 'Budget')",
+                      "SELECT * FROM c"):
+            list(router.query(query))
+        self.assertEqual(router.routes, {"single": 1, "multi": 1, "fan-out": 1})
+
+    def test_fan_out_fail(self):
+        router = QueryRouter(self.container, fan_out="fail")
+        with self.assertRaises(FanOutError):
+            list(router.query("SELECT * FROM c WHERE c.Rating > 3"))
+        self.assertEqual(self.container.queried, [])
+        self.assertEqual(len(list(router.query("SELECT * FROM c WHERE c.Category = 'Inn'"))), 10)
+
+    def test_fan_out_fail_names_the_parse_error(self):
+        router = QueryRouter(self.container, fan_out="fail")
+        with self.assertRaisesRegex(FanOutError, "cant read it"):
+            list(router.query("SELECT * FROM c WHERE c.Category LIKE 'Bud%'"))
+
+    def test_fan_out_warn(self):
+        router = QueryRouter(self.container, fan_out="warn")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            items = list(router.query("SELECT * FROM c WHERE c.Rating > 3"))
+        self.assertEqual(len(items), 8)
+        self.assertIn("Warning: query asks every partition", output.getvalue())
+
+    def test_no_warning_for_a_targeted_query(self):
+        router = QueryRouter(self.container, fan_out="warn")
+        output = io.StringIO()
+        with contextlib.redirect_stdout(output):
+            list(router.query("SELECT * FROM c WHERE c.Category = 'Inn'"))
+        self.assertEqual(output.getvalue(), "")
+
+    def test_allow_fan_out_per_query(self):
+        for fan_out in ("warn", "fail"):
+            router = QueryRouter(self.container, fan_out=fan_out)
+            output = io.StringIO()
+            with contextlib.redirect_stdout(output):
+                items = list(router.query("SELECT * FROM c WHERE c.Rating > 3", allow_fan_out=True))
+            self.assertEqual(len(items), 8)
+            self.assertEqual(output.getvalue(), "")
+
+    def test_unknown_fan_out_setting(self):
+        with self.assertRaises(ValueError):
+            QueryRouter(self.container, fan_out="sometimes")
+
+
+if __name__ == "__main__":
+    unittest.main()
@@ -0,0 +1,139 @@
+## the sql engine of the in-memory container, on the patterns the report queries use
+## run them with:  python -m unittest discover -s tests -t .
+
+import unittest
+
+from cosmos_emulator import InMemoryContainer
+from cosmos_router import QueryRouter
+from cosmos_sql import SqlError, execute, parse
+from report_queries import AGGREGATES_BY_NAME, REPORT_QUERIES_BY_NAME, run_aggregate, run_report_query
+
+HOTELS = [
+    {"id": "1", "HotelId": "1", "HotelName": "Fjord Inn", "Category": "Inn", "Rating": 4.9, "Tags": ["view", "pool"],
+     "Rooms": [{"BaseRate": 100}, {"BaseRate": 80}]},
+    {"id": "2", "HotelId": "2", "HotelName": "Lake Lodge", "Category": "Budget", "Rating": 3.0, "Tags": ["Lake View"], "Rooms": []},
+    {"id": "3", "HotelId": "3", "HotelName": "Hilltop", "Category": "Budget", "Tags": ["VIEW"]},
+    {"id": "4", "HotelId": "4", "HotelName": "Palm Resort", "Category": "Resort", "Rating": None, "Rooms": [{"BaseRate": 300}]},
+    {"id": "5", "HotelId": "5", "HotelName": "Sea Breeze", "Category": "Resort", "Rating": 4.8, "Tags": ["beach"],
+     "Rooms": [{"BaseRate": 250}]},
+]
+
+
+def ids(results):
+    return [result["id"] for result in results]
+
+
+class UndefinedTest(unittest.TestCase):
+    """a missing property is undefined: it is left out of a projection and makes a comparison fail (not false)"""
+
+    def test_projection_leaves_out_undefined(self):
+        self.assertEqual(execute("SELECT c.id, c.Rating FROM c WHERE c.id IN ('3', '4')", HOTELS), [{"id": "3"}, {"id": "4", "Rating": None}])
+
+    def test_select_value_skips_undefined(self):
+        self.assertEqual(execute("SELECT VALUE c.Rating FROM c", HOTELS), [4.9, 3.0, None, 4.8])
+
+    def test_comparison_with_undefined_or_another_type(self):
+        self.assertEqual(ids(execute("SELECT c.id FROM c WHERE c.Rating >= 3", HOTELS)), ["1", "2", "5"])
+        ## NOT of undefined is still undefined, so the documents without a number are in neither list
+        self.assertEqual(ids(execute("SELECT c.id FROM c WHERE NOT (c.Rating >= 3)", HOTELS)), [])
+        self.assertEqual(ids(execute("SELECT c.id FROM c WHERE c.Rating != 3", HOTELS)), ["1", "5"])
+
+    def test_null_is_not_undefined(self):
+        self.assertEqual(ids(execute("SELECT c.id FROM c WHERE c.Rating = null", HOTELS)), ["4"])
+        self.assertEqual(ids(execute("SELECT c.id FROM c WHERE IS_DEFINED(c.Rating)", HOTELS)), ["1", "2", "4", "5"])
+
+    def test_parameters(self):
+        results = execute("SELECT c.id FROM c WHERE c.Rating >= @min_rating", HOTELS, [{"name": "@min_rating", "value": 4.8}])
+        self.assertEqual(ids(results), ["1", "5"])
+
+
+class JoinAndExistsTest(unittest.TestCase):
+
+    def test_join_gives_one_row_per_element(self):
+        results = execute("SELECT c.id, r.BaseRate FROM c JOIN r IN c.Rooms", HOTELS)
+        self.assertEqual([(result["id"], result["BaseRate"]) for result in results], [("1", 100), ("1", 80), ("4", 300), ("5", 250)])
+
+    def test_exists_with_lower(self):
+        query = "SELECT c.HotelName FROM c WHERE EXISTS(SELECT VALUE tag FROM tag IN c.Tags WHERE LOWER(tag) = LOWER(@tag))"
+        results = execute(query, HOTELS, [{"name": "@tag", "value": "View"}])
+        self.assertEqual(results, [{"HotelName": "Fjord Inn"}, {"HotelName": "Hilltop"}])
+
+
+class OrderByTest(unittest.TestCase):
+
+    def test_undefined_and_null_sort_first(self):
+        self.assertEqual(ids(execute("SELECT c.id FROM c ORDER BY c.Rating", HOTELS)), ["3", "4", "2", "5", "1"])
+        self.assertEqual(ids(execute("SELECT c.id FROM c ORDER BY c.Rating DESC", HOTELS)), ["1", "5", "2", "4", "3"])
+
+    def test_top_offset_and_distinct(self):
+        self.assertEqual(ids(execute("SELECT TOP 2 c.id FROM c ORDER BY c.id DESC", HOTELS)), ["5", "4"])
+        self.assertEqual(ids(execute("SELECT c.id FROM c OFFSET 1 LIMIT 2", HOTELS)), ["2", "3"])
+        self.assertEqual(execute("SELECT DISTINCT VALUE c.Category FROM c", HOTELS), ["Inn", "Budget", "Resort"])
+
+
+class AggregateTest(unittest.TestCase):
+
+    def test_count(self):
+        self.assertEqual(execute("SELECT VALUE COUNT(1) FROM c", HOTELS), [5])
+        ## COUNT of an expression skips undefined, but not null
+        self.assertEqual(execute("SELECT VALUE COUNT(c.Rating) FROM c", HOTELS), [4])
+
+    def test_sum_and_avg(self):
+        self.assertEqual(execute("SELECT VALUE SUM(c.Rating) FROM c WHERE c.id IN ('1', '2')", HOTELS), [7.9])
+        self.assertAlmostEqual(execute("SELECT VALUE AVG(c.Rating) FROM c WHERE c.id IN ('1', '2', '3')", HOTELS)[0], 3.95)
+        ## a null makes them undefined, and an aggregate over nothing gives 0 for SUM and undefined for AVG
+        self.assertEqual(execute("SELECT VALUE AVG(c.Rating) FROM c", HOTELS), [])
+        self.assertEqual(execute("SELECT VALUE SUM(c.Rating) FROM c WHERE c.id = 'none'", HOTELS), [0])
+        self.assertEqual(execute("SELECT VALUE AVG(c.Rating) FROM c WHERE c.id = 'none'", HOTELS), [])
+
+    def test_min_and_max(self):
+        self.assertEqual(execute("SELECT VALUE MIN(r.BaseRate) FROM c JOIN r IN c.Rooms", HOTELS), [80])
+        self.assertEqual(execute("SELECT VALUE MAX(c.Rating) FROM c", HOTELS), [4.9])
+
+    def test_group_by(self):
+        results = execute("SELECT c.Category, COUNT(1) AS n FROM c GROUP BY c.Category", HOTELS)
+        self.assertEqual({result["Category"]: result["n"] for result in results}, {"Inn": 1, "Budget": 2, "Resort": 2})
+
+
+class ProjectionTest(unittest.TestCase):
+
+    def test_aliases_and_objects(self):
+        results = execute("SELECT c.HotelName AS name, {'r': c.Rating} AS nested FROM c WHERE c.id = '1'", HOTELS)
+        self.assertEqual(results, [{"name": "Fjord Inn", "nested": {"r": 4.9}}])
+
+    def test_unknown_syntax_is_an_error(self):
+        with self.assertRaises(SqlError):
+            parse("SELECT * FROM c WHERE c.HotelName LIKE 'Sea%'")
+
+
+class ReportQueriesTest(unittest.TestCase):
+    """the report queries and aggregates of report_queries.py, run on the in-memory container"""
+
+    def setUp(self):
+        self.container = InMemoryContainer(partition_key_path="/Category", physical_partitions=4)
+        self.container.load(HOTELS)
+        self.router = QueryRouter(self.container, fan_out="fail")
+
+    def test_report_queries(self):
+        budget = run_report_query(self.router, REPORT_QUERIES_BY_NAME["budget"])
+        self.assertEqual(sorted(ids(budget)), ["2", "3"])
+        top_rated = run_report_query(self.router, REPORT_QUERIES_BY_NAME["top rated"])
+        self.assertEqual(sorted((record.HotelName, record.Rating) for record in top_rated), [("Fjord Inn", 4.9), ("Sea Breeze", 4.8)])
+        projection = run_report_query(self.router, REPORT_QUERIES_BY_NAME["top rated projection"])
+        self.assertEqual(sorted(projection, key=lambda row: row["HotelId"]),
+                         [{"HotelId": "1", "HotelName": "Fjord Inn", "Rating": 4.9}, {"HotelId": "5", "HotelName": "Sea Breeze", "Rating": 4.8}])
+        with_a_view = run_report_query(self.router, REPORT_QUERIES_BY_NAME["with a view"])
+        self.assertEqual(sorted(record.HotelName for record in with_a_view), ["Fjord Inn", "Hilltop"])
+
+    def test_aggregates(self):
+        self.assertEqual(run_aggregate(self.container, AGGREGATES_BY_NAME["budget hotels"]), 2)
+        self.assertEqual(run_aggregate(self.container, AGGREGATES_BY_NAME["top rated hotels"]), 2)
+        ## the null Rating of Palm Resort makes the average undefined
+        self.assertIsNone(run_aggregate(self.container, AGGREGATES_BY_NAME["average rating"]))
+        self.assertEqual(run_aggregate(self.container, AGGREGATES_BY_NAME["cheapest room"]), 80)
+        self.assertEqual(run_aggregate(self.container, AGGREGATES_BY_NAME["most expensive room"]), 300)
+        self.assertEqual(run_aggregate(self.container, AGGREGATES_BY_NAME["hotels per category"]), {"Inn": 1, "Budget": 2, "Resort": 2})
+
+
+if __name__ == "__main__":
+    unittest.main()
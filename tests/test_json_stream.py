@@ -0,0 +1,39 @@
+## the streaming json reader, on small in-memory files
+## run them with:  python -m unittest discover -s tests -t .
+
+import io
+import json
+import unittest
+
+from json_stream import _iter_stream
+
+
+def read(text, chunk_size=4):
+    ## a tiny chunk size makes every document cross a buffer boundary
+    return list(_iter_stream(io.StringIO(text), chunk_size))
+
+
+class IterStreamTest(unittest.TestCase):
+
+    def test_formats(self):
+        self.assertEqual(read('[{"a": 1}, {"b": 2}]'), [{"a": 1}, {"b": 2}])
+        self.assertEqual(read('{"a": 1}\n{"b": 2}\n'), [{"a": 1}, {"b": 2}])
+        self.assertEqual(read('{"a": 1}{"b": 2}'), [{"a": 1}, {"b": 2}])
+        self.assertEqual(read('[]'), [])
+        self.assertEqual(read('[ -1.5e10 , 2 ]'), [-1.5e10, 2])
+
+    def test_broken_arrays_are_reported(self):
+        for text in ('[{"a": 1} {"b": 2}]', '[,,{"a": 1}]', '[{"a": 1},]', '[{"a": 1},,{"b": 2}]', '[,]', '[{"a": 1}'):
+            with self.subTest(text=text), self.assertRaises(json.JSONDecodeError):
+                read(text)
+
+    def test_broken_document_does_not_read_the_whole_file(self):
+        text = '{"a": [1, 2\n' + '{"b": 2}\n' * 10000
+        stream = io.StringIO(text)
+        with self.assertRaises(json.JSONDecodeError):
+            list(_iter_stream(stream, 64, 1024))
+        self.assertLess(stream.tell(), 4096)
+
+
+if __name__ == "__main__":
+    unittest.main()
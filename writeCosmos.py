@@ -1,10 +1,15 @@
 import os
-import json
-import glob
 from dotenv import load_dotenv
 from azure.cosmos import CosmosClient
 from azure.identity import DefaultAzureCredential
 
+from cosmos_loader import bulk_upsert, batch_upsert
+from json_stream import iter_directory_documents
+from cosmos_throttle import RateController
+from ingest_manifest import IngestManifest
+from cosmos_metrics import MetricsRecorder, InstrumentedContainer
+from cosmos_workload import RecordingContainer, WorkloadRecorder
+
 #we use pathlib for the file handling of importing the files 
 from pathlib import Path
 
@@ -15,6 +20,20 @@ load_dotenv()
 COSMOS_ENDPOINT = os.environ['COSMOS_ENDPOINT']
 DATABASE_NAME = os.environ['DATABASE_NAME']
 CONTAINER_NAME = os.environ['CONTAINER_NAME']
+## how many upserts we run at the same time, 1 gives the old one-by-one behaviour
+BULK_CONCURRENCY = int(os.environ.get('BULK_CONCURRENCY', '8'))
+## "batch" groups the documents per partition key into transactional batches, "bulk" sends one upsert per document
+LOAD_MODE = os.environ.get('LOAD_MODE', 'batch')
+PARTITION_KEY_PATH = os.environ.get('PARTITION_KEY_PATH', '/Category')
+## the RU/s we allow the load to use, leave it empty to not throttle ourselves
+RU_BUDGET = os.environ.get('RU_BUDGET', '')
+## the manifest remembers what we already loaded, set FULL_RELOAD=1 to send every document again
+MANIFEST_PATH = os.environ.get('MANIFEST_PATH', '.ingest_manifest.jsonl')
+FULL_RELOAD = os.environ.get('FULL_RELOAD', '') == '1'
+## when set we record the RU and latency of every call and write them to this json file
+METRICS_PATH = os.environ.get('METRICS_PATH', '')
+## when set every call is appended to this json lines file, cosmos_workload.py can replay it later
+WORKLOAD_PATH = os.environ.get('WORKLOAD_PATH', '')
 
 ## now we setup the cosmosdb client connection using Azure AD
 credential = DefaultAzureCredential()
@@ -26,20 +45,42 @@ print(f"endpoint : {COSMOS_ENDPOINT}")
 ## cosmos db connectors
 db_client = client.get_database_client(DATABASE_NAME)
 container_client = db_client.get_container_client(CONTAINER_NAME)
+metrics = MetricsRecorder()
+if METRICS_PATH:
+    container_client = InstrumentedContainer(container_client, metrics, partition_key_path=PARTITION_KEY_PATH)
+workload = WorkloadRecorder(WORKLOAD_PATH) if WORKLOAD_PATH else None
+if workload:
+    container_client = RecordingContainer(container_client, workload, partition_key_path=PARTITION_KEY_PATH)
 
 
 items_dir  = Path("./items/")
 
-for json_file in items_dir.glob("*.json"):
-    if json_file.is_file():
-        with open(json_file, "r") as file:
-            book_data = json.load(file)
-            try:
-                result = container_client.upsert_item(book_data)
-                print(f"Book '{book_data['title']}' upserted in category '{book_data['category']}'")
-            except Exception as e:
-                print(f"Error upserting {file.name}: {e}")
-    
-            
-
 
+## we stream the documents of every .json and .jsonl file straight into the upserts, so big files never sit in memory
+## and we upsert everything with a pool of workers and print a summary at the end
+## a file with broken json is skipped (and printed at the end) instead of stopping the whole load
+failed_files = []
+documents = iter_directory_documents(items_dir, on_error=lambda path, error: failed_files.append((path, error)))
+## we only send the documents that are new or changed since the last run
+manifest = IngestManifest(MANIFEST_PATH, partition_key_path=PARTITION_KEY_PATH)
+if not FULL_RELOAD:
+    documents = manifest.changed(documents)
+## the controller keeps us under the RU/s budget and retries the 429s instead of losing the document
+controller = RateController(float(RU_BUDGET), max_concurrency=BULK_CONCURRENCY) if RU_BUDGET else None
+if LOAD_MODE == "batch":
+    report = batch_upsert(container_client, documents, partition_key_path=PARTITION_KEY_PATH, concurrency=BULK_CONCURRENCY, controller=controller, on_success=manifest.commit)
+else:
+    report = bulk_upsert(container_client, documents, concurrency=BULK_CONCURRENCY, controller=controller, on_success=manifest.commit)
+manifest.compact()
+manifest.close()
+report.print_summary()
+print(f"documents unchanged : {manifest.skipped} (skipped)")
+for path, error in failed_files:
+    print(f"    -- failed file {path}: {error}")
+if controller:
+    print(f"throttled requests : {controller.throttled}")
+if METRICS_PATH:
+    metrics.write_json(METRICS_PATH)
+    metrics.print_summary()
+if workload:
+    workload.close()